@@ -3,6 +3,7 @@ from django.urls import path
 from django.contrib.auth.views import LoginView, LogoutView  # Django内置的登录登出视图
 
 # 本地视图导入
+from monitoring.budgets import query_budget
 from . import views
 
 # 应用命名空间，用于URL反向解析
@@ -14,14 +15,14 @@ urlpatterns = [
     # 使用Django内置的LoginView处理登录请求
     # template_name指定登录页面模板
     path('login/', 
-         LoginView.as_view(template_name='accounts/login.html'), 
+         query_budget({'GET': 2, 'POST': 8})(LoginView.as_view(template_name='accounts/login.html')), 
          name='login'),
     
     # 登出处理
     # 使用Django内置的LogoutView处理登出请求
     # 登出后默认重定向到首页
     path('logout/', 
-         LogoutView.as_view(), 
+         query_budget(6)(LogoutView.as_view()), 
          name='logout'),
     
     # 用户注册页面
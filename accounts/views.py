@@ -92,6 +92,7 @@ class RegisterView(CreateView):
     form_class = CustomUserCreationForm   # 使用的表单类
     template_name = 'accounts/register.html'  # 模板文件路径
     success_url = reverse_lazy('rooms:room_list')  # 注册成功后的跳转URL
+    query_budget = {'GET': 2, 'POST': 10}  # 每个请求最多执行的查询数
     
     def form_valid(self, form):
         """
@@ -128,6 +129,7 @@ class ProfileView(LoginRequiredMixin, UpdateView):
     ]
     template_name = 'accounts/profile.html'  # 模板文件路径
     success_url = reverse_lazy('accounts:profile')  # 更新成功后的跳转URL
+    query_budget = {'GET': 4, 'POST': 8}   # 每个请求最多执行的查询数
     
     def get_object(self):
         """
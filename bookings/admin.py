@@ -1,15 +1,21 @@
-from django.contrib import admin
-from .models import Booking, BookingHistory
+from django.contrib import admin, messages
+from .models import Booking, BookingHistory, BookingSeries
+from search.admin import IndexedSearchAdminMixin
+from search.index import BOOKING
+from .exports import BOOKINGS, HISTORY, stream_export
+from .services import transition_bookings
 
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(IndexedSearchAdminMixin, admin.ModelAdmin):
     """预约管理"""
     list_display = ('user', 'room', 'date', 'time_slot', 'status', 'participants', 'created_at')
     list_filter = ('status', 'date', 'room', 'created_at')
     search_fields = ('user__username', 'room__name', 'purpose')
+    search_index_kind = BOOKING
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
+    actions = ('approve_selected', 'reject_selected', 'export_csv', 'export_ndjson')
     
     fieldsets = (
         ('预约信息', {
@@ -34,6 +40,40 @@ class BookingAdmin(admin.ModelAdmin):
         else:
             return qs.filter(user=request.user)
     
+    def _transition_selected(self, request, queryset, status, action_text):
+        booking_ids = list(queryset.values_list('pk', flat=True))
+        changed = transition_bookings(
+            booking_ids,
+            status,
+            operator=request.user,
+            action=action_text,
+            notes=f'管理员{request.user.username}在后台批量{action_text}了预约',
+        )
+        self.message_user(request, f'已{action_text}{len(changed)}条预约')
+        skipped = len(booking_ids) - len(changed)
+        if skipped:
+            self.message_user(request, f'{skipped}条预约不是待审核状态，已跳过', messages.WARNING)
+    
+    @admin.action(description='批量审批通过所选预约', permissions=['approve'])
+    def approve_selected(self, request, queryset):
+        self._transition_selected(request, queryset, 'confirmed', '审批通过')
+    
+    @admin.action(description='批量拒绝所选预约', permissions=['approve'])
+    def reject_selected(self, request, queryset):
+        self._transition_selected(request, queryset, 'cancelled', '审批拒绝')
+    
+    @admin.action(description='导出所选预约为CSV')
+    def export_csv(self, request, queryset):
+        return stream_export(queryset, BOOKINGS, 'csv')
+    
+    @admin.action(description='导出所选预约为NDJSON')
+    def export_ndjson(self, request, queryset):
+        return stream_export(queryset, BOOKINGS, 'ndjson')
+    
+    def has_approve_permission(self, request):
+        """只有管理员可以批量审批"""
+        return request.user.is_superuser or request.user.user_type == 'admin'
+    
     def has_change_permission(self, request, obj=None):
         """权限控制"""
         if obj is None:
@@ -43,6 +83,16 @@ class BookingAdmin(admin.ModelAdmin):
         return obj.user == request.user and obj.status == 'pending'
 
 
+@admin.register(BookingSeries)
+class BookingSeriesAdmin(admin.ModelAdmin):
+    """周期预约管理"""
+    list_display = ('user', 'room', 'time_slot', 'start_date', 'end_date', 'interval_weeks', 'status', 'materialized_until')
+    list_filter = ('status', 'room', 'time_slot')
+    search_fields = ('user__username', 'room__name', 'purpose')
+    ordering = ('-created_at',)
+    readonly_fields = ('materialized_until', 'created_at', 'updated_at')
+
+
 @admin.register(BookingHistory)
 class BookingHistoryAdmin(admin.ModelAdmin):
     """预约历史管理"""
@@ -51,3 +101,8 @@ class BookingHistoryAdmin(admin.ModelAdmin):
     search_fields = ('booking__user__username', 'operator__username', 'notes')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+    actions = ('export_csv',)
+    
+    @admin.action(description='导出所选预约历史为CSV')
+    def export_csv(self, request, queryset):
+        return stream_export(queryset, HISTORY, 'csv')
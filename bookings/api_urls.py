@@ -7,7 +7,9 @@ urlpatterns = [
     path('rooms/', api_views.RoomListAPIView.as_view(), name='room_list'),
     path('rooms/<int:pk>/', api_views.RoomDetailAPIView.as_view(), name='room_detail'),
     path('bookings/', api_views.BookingListCreateAPIView.as_view(), name='booking_list_create'),
+    path('bookings/batch/', api_views.BookingBatchAPIView.as_view(), name='booking_batch'),
     path('bookings/<int:pk>/', api_views.BookingDetailAPIView.as_view(), name='booking_detail'),
     path('timeslots/', api_views.TimeSlotListAPIView.as_view(), name='timeslot_list'),
     path('available-slots/<int:room_id>/<str:date>/', api_views.AvailableSlotsAPIView.as_view(), name='available_slots'),
+    path('availability-grid/', api_views.AvailabilityGridAPIView.as_view(), name='availability_grid'),
 ]
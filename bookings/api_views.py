@@ -1,68 +1,168 @@
-from rest_framework import generics, status
+from rest_framework import exceptions, generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 from django.utils.dateparse import parse_date
-from datetime import datetime
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.utils import timezone
 from .models import Booking
-from rooms.models import StudyRoom, TimeSlot
+from .availability import get_mask, is_slot_free, parse_day, series_masks
+from rooms.catalog import active_rooms, active_time_slots, get_room
+from rooms.models import StudyRoom
+from .conditional import (
+    available_slots_condition, booking_detail_etag, booking_list_etag, catalog_condition, grid_condition
+)
+from .pagination import BookingCursorPagination
+from .services import apply_booking_batch
 from .serializers import (
-    BookingSerializer, StudyRoomSerializer, TimeSlotSerializer
+    BookingBatchSerializer, BookingSerializer, SlotConflict, StudyRoomSerializer, TimeSlotSerializer,
+    ValuesProjection,
 )
+from monitoring.metrics import ACCEPTED, CONFLICT, INVALID, record_admission
 
 
+@method_decorator(catalog_condition, name='get')
 class RoomListAPIView(generics.ListAPIView):
     """自习室列表API"""
-    queryset = StudyRoom.objects.filter(is_active=True)
+    query_budget = 6
     serializer_class = StudyRoomSerializer
     permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return active_rooms()
 
 
+@method_decorator(catalog_condition, name='get')
 class RoomDetailAPIView(generics.RetrieveAPIView):
     """自习室详情API"""
+    query_budget = 6
     queryset = StudyRoom.objects.filter(is_active=True)
     serializer_class = StudyRoomSerializer
     permission_classes = [IsAuthenticated]
 
 
+@method_decorator(condition(etag_func=booking_list_etag), name='get')
 class BookingListCreateAPIView(generics.ListCreateAPIView):
-    """预约列表和创建API"""
+    """预约列表和创建API
+
+    列表按创建时间倒序使用游标分页，?cursor= 翻页，?count=1 时返回总数。
+    GET 发送 ETag，预约未变化时返回 304。列表按序列化器字段做 values() 投影，
+    整页只需一次联表查询，不实例化模型；?fields=/?expand= 裁剪的字段不会被查询。
+    """
+    query_budget = {'GET': 7, 'POST': 13}
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BookingCursorPagination
     
     def get_queryset(self):
         return Booking.objects.filter(user=self.request.user)
     
+    def list(self, request, *args, **kwargs):
+        projection = ValuesProjection(self.get_serializer_class(), self.get_serializer_context())
+        # 游标分页还需要 created_at 和 id
+        lookups = dict.fromkeys([*projection.lookups, 'created_at', 'id'])
+        page = self.paginate_queryset(self.get_queryset().values(*lookups))
+        return self.get_paginated_response(projection.serialize(page))
+    
+    def create(self, request, *args, **kwargs):
+        try:
+            response = super().create(request, *args, **kwargs)
+        except SlotConflict:
+            record_admission(CONFLICT)
+            raise
+        except exceptions.ValidationError:
+            record_admission(INVALID)
+            raise
+        record_admission(ACCEPTED)
+        return response
+    
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
+class BookingBatchAPIView(generics.GenericAPIView):
+    """批量预约操作API
+
+    请求体：
+        {"mode": "atomic" | "best_effort",
+         "operations": [{"op": "create", "room_id": 1, "time_slot_id": 2, "date": "2025-06-01"},
+                        {"op": "cancel", "id": 10}]}
+
+    atomic 模式下任一操作失败则全部不执行并返回400；best_effort 模式执行所有
+    可成功的操作。results 与 operations 按顺序一一对应。
+    """
+    query_budget = 16
+    serializer_class = BookingBatchSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        atomic = serializer.validated_data['mode'] == 'atomic'
+        
+        results = apply_booking_batch(request.user, serializer.get_operations(), atomic=atomic)
+        for result in results:
+            # 原子模式下因其他操作失败而跳过的创建不计入
+            if result['op'] == 'create' and result['status'] != 'skipped':
+                record_admission(
+                    ACCEPTED if result['status'] == 'created'
+                    else CONFLICT if result['code'] == 'slot_taken' else INVALID
+                )
+        
+        failed = sum(1 for result in results if result['status'] == 'error')
+        return Response({
+            'mode': serializer.validated_data['mode'],
+            'created': sum(1 for result in results if result['status'] == 'created'),
+            'cancelled': sum(1 for result in results if result['status'] == 'cancelled'),
+            'failed': failed,
+            'results': results,
+        }, status=status.HTTP_400_BAD_REQUEST if atomic and failed else status.HTTP_200_OK)
+
+
+@method_decorator(condition(etag_func=booking_detail_etag), name='get')
 class BookingDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     """预约详情API"""
+    query_budget = {'GET': 7, 'PUT': 15, 'PATCH': 15, 'DELETE': 15}
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         if self.request.user.user_type == 'admin' or self.request.user.is_superuser:
-            return Booking.objects.all()
-        return Booking.objects.filter(user=self.request.user)
+            queryset = Booking.objects.all()
+        else:
+            queryset = Booking.objects.filter(user=self.request.user)
+        # 嵌套的用户、自习室、时间段随预约一次联表读取；
+        # 读取时按 ?fields=/?expand= 只查询用到的列，写操作需要完整的实例
+        serializer = self.get_serializer() if self.request.method == 'GET' else None
+        return self.get_serializer_class().setup_eager_loading(queryset, serializer)
 
 
+@method_decorator(catalog_condition, name='get')
 class TimeSlotListAPIView(generics.ListAPIView):
     """时间段列表API"""
-    queryset = TimeSlot.objects.filter(is_active=True)
+    query_budget = 6
     serializer_class = TimeSlotSerializer
     permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return active_time_slots()
 
 
+@method_decorator(available_slots_condition, name='get')
 class AvailableSlotsAPIView(generics.GenericAPIView):
     """查询可用时间段API"""
+    query_budget = 9
     permission_classes = [IsAuthenticated]
     
     def get(self, request, room_id, date):
         try:
-            room = get_object_or_404(StudyRoom, pk=room_id, is_active=True)
+            room = get_room(room_id)
+            if room is None:
+                raise Http404
             date_obj = parse_date(date)
             
             if not date_obj:
@@ -71,18 +171,12 @@ class AvailableSlotsAPIView(generics.GenericAPIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # 获取所有时间段
-            all_slots = TimeSlot.objects.filter(is_active=True)
-            
-            # 获取已预约的时间段
-            booked_slots = Booking.objects.filter(
-                room=room,
-                date=date_obj,
-                status__in=['pending', 'confirmed']
-            ).values_list('time_slot_id', flat=True)
-            
-            # 过滤出可用时间段
-            available_slots = all_slots.exclude(id__in=booked_slots)
+            # 从占用索引读取该房间当天的位图，过滤出可用时间段
+            mask = get_mask(room.pk, date_obj)
+            available_slots = [
+                slot for slot in active_time_slots()
+                if is_slot_free(mask, slot.pk)
+            ]
             
             serializer = TimeSlotSerializer(available_slots, many=True)
             return Response({
@@ -96,3 +190,83 @@ class AvailableSlotsAPIView(generics.GenericAPIView):
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+
+@method_decorator(grid_condition, name='get')
+class AvailabilityGridAPIView(generics.GenericAPIView):
+    """多自习室、多日期可用性矩阵API
+
+    参数：
+        rooms: 逗号分隔的自习室ID，省略时返回全部启用的自习室
+        start: 起始日期(YYYY-MM-DD)，默认今天
+        end: 结束日期(YYYY-MM-DD)，默认 start 之后 6 天
+
+    每个自习室返回按日期排列的位串，第 i 个字符对应 slots 中第 i 个时间段，
+    "1" 表示已被预约，"0" 表示可预约。整个矩阵只查询一次预约表，
+    范围超出周期预约生成窗口时再查询一次周期预约。
+    """
+    query_budget = 9
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        start = parse_day(request.GET['start']) if 'start' in request.GET else timezone.localdate()
+        if 'end' in request.GET:
+            end = parse_day(request.GET['end'])
+        else:
+            end = start + timedelta(days=6) if start else None
+        if not start or not end:
+            return Response({'error': '日期格式无效'}, status=status.HTTP_400_BAD_REQUEST)
+        days = (end - start).days + 1
+        if days < 1 or days > settings.AVAILABILITY_GRID_MAX_DAYS:
+            return Response(
+                {'error': f'日期范围必须在1-{settings.AVAILABILITY_GRID_MAX_DAYS}天之间'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rooms = sorted(active_rooms(), key=lambda room: room.pk)
+        if request.GET.get('rooms'):
+            try:
+                room_ids = {int(pk) for pk in request.GET['rooms'].split(',') if pk}
+            except ValueError:
+                return Response({'error': '自习室ID无效'}, status=status.HTTP_400_BAD_REQUEST)
+            rooms = [room for room in rooms if room.pk in room_ids]
+        rooms = [(room.pk, room.name) for room in rooms]
+        slots = active_time_slots()
+        
+        # 一次查询取出范围内所有有效预约，按(自习室, 日期)归并为时间段集合
+        booked = {}
+        rows = Booking.objects.filter(
+            room_id__in=[pk for pk, _ in rooms],
+            date__range=(start, end),
+            status__in=Booking.ACTIVE_STATUSES,
+        ).order_by().values_list('room_id', 'date', 'time_slot_id')
+        for room_id, day, slot_id in rows:
+            booked.setdefault((room_id, day), set()).add(slot_id)
+        
+        dates = [start + timedelta(days=offset) for offset in range(days)]
+        claims = series_masks((room_id, day) for room_id, _ in rooms for day in dates)
+        for key, mask in claims.items():
+            booked.setdefault(key, set()).update(
+                slot.pk for slot in slots if not is_slot_free(mask, slot.pk)
+            )
+        empty = frozenset()
+        return Response({
+            'start': start,
+            'end': end,
+            'slots': TimeSlotSerializer(slots, many=True).data,
+            'rooms': [
+                {
+                    'id': room_id,
+                    'name': name,
+                    'days': [
+                        ''.join(
+                            '1' if slot.pk in booked.get((room_id, day), empty) else '0'
+                            for slot in slots
+                        )
+                        for day in dates
+                    ],
+                }
+                for room_id, name in rooms
+            ],
+        })
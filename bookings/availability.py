@@ -0,0 +1,193 @@
+"""
+时间段占用索引
+
+每个(自习室, 日期)在 RoomOccupancy 中保存一个占用位图，第 N 位表示主键为 N
+的时间段已被有效预约占用。查询可用时间段只需按主键读取一行，
+预约的创建、取消、审批等写操作负责刷新对应的行。
+
+周期预约在其 materialized_until 之后的日期尚无预约行，这些日期的位图
+同时计入周期规则占用的时间段。
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Booking, BookingSeries, RoomOccupancy
+
+
+def encode_mask(mask):
+    """将整数位图编码为小端字节串"""
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+
+def decode_mask(data):
+    """将字节串解码为整数位图"""
+    if not data:
+        return 0
+    return int.from_bytes(bytes(data), 'little')
+
+
+def parse_day(value):
+    """解析 YYYY-MM-DD 格式的日期，无效时返回 None"""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def is_slot_free(mask, slot_id):
+    """判断时间段在位图中是否空闲"""
+    return not (mask >> slot_id) & 1
+
+
+def _booked_masks(keys):
+    """根据有效预约计算指定(room_id, date)的位图，返回 {(room_id, date): mask}"""
+    masks = dict.fromkeys(keys, 0)
+    if not masks:
+        return masks
+    # 用 IN 而非逐对 OR，使查询走(room, date, status)索引；交叉组合多取的行在下面跳过
+    booked = Booking.objects.filter(
+        room_id__in={room_id for room_id, _ in keys},
+        date__in={day for _, day in keys},
+        status__in=Booking.ACTIVE_STATUSES,
+    ).order_by().values_list('room_id', 'date', 'time_slot_id')
+    for room_id, day, slot_id in booked:
+        if (room_id, day) in masks:
+            masks[(room_id, day)] |= 1 << slot_id
+    return masks
+
+
+def get_mask(room_id, day):
+    """读取单个(自习室, 日期)的占用位图
+
+    今天之前的日期不在索引中（见 rebuild_occupancy），直接按预约计算。
+    """
+    if day < timezone.localdate():
+        return _booked_masks({(room_id, day)})[(room_id, day)]
+    rows = RoomOccupancy.objects.filter(
+        room_id=room_id, date=day
+    ).values_list('bitmap', flat=True)[:1]
+    return decode_mask(rows[0]) if rows else 0
+
+
+def get_masks(room_ids, dates):
+    """批量读取占用位图，返回 {(room_id, date): mask}"""
+    rows = RoomOccupancy.objects.filter(
+        room_id__in=room_ids, date__in=dates
+    ).values_list('room_id', 'date', 'bitmap')
+    return {(room_id, day): decode_mask(bitmap) for room_id, day, bitmap in rows}
+
+
+def series_horizon():
+    """周期预约已生成预约行的最后日期"""
+    return timezone.localdate() + timedelta(days=settings.BOOKING_SERIES_HORIZON_DAYS)
+
+
+def series_masks(keys, exclude_series=None):
+    """计算周期预约在尚未生成预约行的日期上占用的位图
+
+    以各周期自己的 materialized_until 为界，而不是按今天推算的生成窗口：
+    日切后刚进入窗口、定时任务还没有生成预约行的日期仍由周期规则占用。
+    今天之前的日期不会再生成预约行，不需要查询；其余用一次范围查询读取相关周期。
+    返回 {(room_id, date): mask}，只包含有占用的键。
+    """
+    today = timezone.localdate()
+    keys = {(room_id, day) for room_id, day in keys if day >= today}
+    if not keys:
+        return {}
+    dates = [day for _, day in keys]
+    series = BookingSeries.objects.filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=max(dates)),
+        room_id__in={room_id for room_id, _ in keys},
+        status='active',
+        start_date__lte=max(dates),
+        end_date__gte=min(dates),
+    ).order_by().only(
+        'room_id', 'time_slot_id', 'start_date', 'end_date', 'interval_weeks', 'materialized_until'
+    )
+    if exclude_series is not None:
+        series = series.exclude(pk=exclude_series)
+    masks = {}
+    for item in series:
+        for room_id, day in keys:
+            if room_id != item.room_id or not item.occurs_on(day):
+                continue
+            if item.materialized_until and day <= item.materialized_until:
+                continue
+            masks[(room_id, day)] = masks.get((room_id, day), 0) | 1 << item.time_slot_id
+    return masks
+
+
+def annotate_slots(time_slots, mask):
+    """为时间段设置 is_available 属性，返回列表"""
+    slots = list(time_slots)
+    for slot in slots:
+        slot.is_available = is_slot_free(mask, slot.pk)
+    return slots
+
+
+def _write_masks(masks):
+    RoomOccupancy.objects.bulk_create(
+        [
+            RoomOccupancy(room_id=room_id, date=day, bitmap=encode_mask(mask))
+            for (room_id, day), mask in masks.items()
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['room', 'date'],
+        update_fields=['bitmap', 'updated_at'],
+    )
+
+
+def refresh_occupancy(keys):
+    """根据有效预约重新计算指定(room_id, date)的位图
+
+    一次查询读取相关预约，一次 upsert 写回，适用于单条和批量写操作。
+    """
+    keys = {(room_id, day) for room_id, day in keys if room_id and day}
+    if not keys:
+        return
+    masks = _booked_masks(keys)
+    for key, mask in series_masks(keys).items():
+        masks[key] |= mask
+    _write_masks(masks)
+
+
+def rebuild_occupancy(start=None, days=None, room_ids=None):
+    """预建从 start 起 days 天的占用索引，并清理过期的行
+
+    供日切时的定时任务调用，也用于修复索引与预约数据的偏差。
+    返回写入的行数。
+    """
+    from rooms.models import StudyRoom
+
+    start = start or timezone.localdate()
+    days = days or settings.AVAILABILITY_PREBUILD_DAYS
+    end = start + timedelta(days=days - 1)
+
+    rooms = StudyRoom.objects.filter(is_active=True)
+    if room_ids is not None:
+        rooms = rooms.filter(pk__in=room_ids)
+    room_ids = list(rooms.values_list('pk', flat=True))
+
+    masks = {
+        (room_id, start + timedelta(days=offset)): 0
+        for room_id in room_ids
+        for offset in range(days)
+    }
+    booked = Booking.objects.filter(
+        room_id__in=room_ids,
+        date__range=(start, end),
+        status__in=Booking.ACTIVE_STATUSES,
+    ).order_by().values_list('room_id', 'date', 'time_slot_id')
+    for room_id, day, slot_id in booked:
+        masks[(room_id, day)] |= 1 << slot_id
+    for key, mask in series_masks(masks).items():
+        masks[key] |= mask
+
+    RoomOccupancy.objects.filter(date__lt=timezone.localdate()).delete()
+    _write_masks(masks)
+    return len(masks)
@@ -0,0 +1,180 @@
+"""
+HTTP 条件请求
+
+为自习室、时间段、预约和可用性接口计算 ETag/Last-Modified，交给
+django.views.decorators.http.condition 处理 If-None-Match/If-Modified-Since。
+验证器只读取版本号和 max(updated_at) 等少量数据，未变化时直接返回 304，
+不执行视图、不渲染模板也不序列化。
+
+- 自习室和时间段：目录版本号（CatalogVersion），任何修改都会递增
+- 占用情况：RoomOccupancy 的位图和 updated_at，影响占用的写操作都会刷新；
+  今天之前的日期不在索引中，不生成验证器
+- 预约：可见预约的 max(updated_at) 和数量（数量用于发现删除）
+
+网页和预约接口的内容因用户而异，ETag 计入当前用户，且不发送 Last-Modified，
+避免同一浏览器切换用户后按时间误判为未修改。
+"""
+import hashlib
+from datetime import timedelta
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from rooms.catalog import version_info
+from .availability import parse_day
+from .models import Booking, RoomOccupancy
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _memo(request, name, compute):
+    """同一请求中 ETag 和 Last-Modified 共用一次查询结果"""
+    cache = request.__dict__.setdefault('_conditional_cache', {})
+    if name not in cache:
+        cache[name] = compute()
+    return cache[name]
+
+
+def _catalog(request):
+    return _memo(request, 'catalog', version_info)
+
+
+def _occupancy(request, room_id, day):
+    """占用索引中的 (位图, updated_at)
+
+    今天之前的日期不在索引中，可用性按预约表计算，调用方不生成验证器。
+    """
+    return _memo(request, ('occupancy', room_id, day), lambda: RoomOccupancy.objects.filter(
+        room_id=room_id, date=day
+    ).values_list('bitmap', 'updated_at').first() or (b'', None))
+
+
+def _user_part(request):
+    user = request.user
+    return user.pk, getattr(user, 'updated_at', None)
+
+
+# 自习室和时间段接口
+
+def catalog_etag(request, *args, **kwargs):
+    version, _ = _catalog(request)
+    return make_etag('catalog', version)
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return _catalog(request)[1]
+
+
+catalog_condition = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+
+
+# 网页
+
+def page_etag(request, *parts):
+    """网页的 ETag：计入当前用户；有待显示的消息时不使用验证器"""
+    if len(get_messages(request)):
+        return None
+    return make_etag('page', _user_part(request), *parts)
+
+
+def room_list_page_etag(request, *args, **kwargs):
+    return page_etag(request, 'room_list', _catalog(request)[0])
+
+
+def room_detail_page_etag(request, pk, *args, **kwargs):
+    day = parse_day(request.GET.get('date')) or timezone.localdate()
+    if day < timezone.localdate():
+        return None
+    bitmap, updated_at = _occupancy(request, pk, day)
+    return page_etag(request, 'room_detail', _catalog(request)[0], day, bytes(bitmap), updated_at)
+
+
+# 可用性接口
+
+def available_slots_etag(request, room_id, date, *args, **kwargs):
+    day = parse_day(date)
+    if day is None or day < timezone.localdate():
+        return None
+    bitmap, _ = _occupancy(request, room_id, day)
+    return make_etag('available_slots', _catalog(request)[0], bytes(bitmap))
+
+
+def available_slots_last_modified(request, room_id, date, *args, **kwargs):
+    day = parse_day(date)
+    if day is None or day < timezone.localdate():
+        return None
+    return _latest(_catalog(request)[1], _occupancy(request, room_id, day)[1])
+
+
+available_slots_condition = condition(
+    etag_func=available_slots_etag, last_modified_func=available_slots_last_modified
+)
+
+
+def _grid_state(request):
+    """可用性矩阵范围内占用索引的 (行数, max(updated_at))，参数无效时返回 None
+
+    矩阵直接按预约表计算，与占用索引一致；过去的日期的占用行会被清理，
+    包含过去日期的请求不使用验证器。
+    """
+    def compute():
+        today = timezone.localdate()
+        start = parse_day(request.GET['start']) if 'start' in request.GET else today
+        end = parse_day(request.GET['end']) if 'end' in request.GET else start and start + timedelta(days=6)
+        if not start or not end or start < today or end < start:
+            return None
+        rows = RoomOccupancy.objects.filter(date__range=(start, end))
+        if request.GET.get('rooms'):
+            try:
+                rows = rows.filter(room_id__in=[int(pk) for pk in request.GET['rooms'].split(',') if pk])
+            except ValueError:
+                return None
+        return rows.aggregate(count=Count('pk'), latest=Max('updated_at'))
+    return _memo(request, 'grid', compute)
+
+
+def grid_etag(request, *args, **kwargs):
+    state = _grid_state(request)
+    if state is None:
+        return None
+    return make_etag('grid', _catalog(request)[0], state['count'], state['latest'])
+
+
+def grid_last_modified(request, *args, **kwargs):
+    state = _grid_state(request)
+    if state is None:
+        return None
+    return _latest(_catalog(request)[1], state['latest'])
+
+
+grid_condition = condition(etag_func=grid_etag, last_modified_func=grid_last_modified)
+
+
+# 预约接口
+
+def booking_list_etag(request, *args, **kwargs):
+    """当前用户预约列表的 ETag，列表中嵌套的用户信息取 user.updated_at"""
+    state = Booking.objects.filter(user=request.user).order_by().aggregate(
+        count=Count('pk'), latest=Max('updated_at')
+    )
+    return make_etag('bookings', _user_part(request), _catalog(request)[0], state['count'], state['latest'])
+
+
+def booking_detail_etag(request, pk, *args, **kwargs):
+    """预约详情的 ETag，预约不存在或无权查看时不使用验证器"""
+    bookings = Booking.objects.filter(pk=pk)
+    if not (request.user.user_type == 'admin' or request.user.is_superuser):
+        bookings = bookings.filter(user=request.user)
+    row = bookings.values_list('updated_at', 'user__updated_at').first()
+    if row is None:
+        return None
+    return make_etag('booking', _user_part(request), _catalog(request)[0], *row)
@@ -0,0 +1,163 @@
+"""
+预约数据导出
+
+管理员预约列表的筛选条件（状态、自习室、日期、搜索）在这里统一处理，
+列表页和导出共用。导出通过 StreamingHttpResponse 逐行输出 CSV 或 NDJSON：
+按主键键集分批读取，每批是一条独立的短查询，并用 iterator() 逐行取出，
+不缓存查询集，内存占用与导出行数无关。
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from search.index import BOOKING, search_queryset
+from .availability import parse_day
+from .models import Booking, BookingHistory
+
+BOOKINGS, HISTORY = 'bookings', 'history'
+
+# 导出格式：格式名 -> (Content-Type, 文件扩展名)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+STATUS_LABELS = dict(Booking.STATUS_CHOICES)
+
+# Excel 把以这些字符开头的单元格当作公式，导出时加单引号转义
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# 导出列：(NDJSON 键, CSV 表头, 查询字段)
+COLUMNS = {
+    BOOKINGS: (
+        ('id', '编号', 'id'),
+        ('user', '预约用户', 'user__username'),
+        ('room', '自习室', 'room__name'),
+        ('date', '预约日期', 'date'),
+        ('time_slot', '时间段', 'time_slot__name'),
+        ('start_time', '开始时间', 'time_slot__start_time'),
+        ('end_time', '结束时间', 'time_slot__end_time'),
+        ('status', '状态', 'status'),
+        ('participants', '参与人数', 'participants'),
+        ('purpose', '使用目的', 'purpose'),
+        ('created_at', '创建时间', 'created_at'),
+        ('updated_at', '更新时间', 'updated_at'),
+    ),
+    HISTORY: (
+        ('id', '编号', 'id'),
+        ('booking', '预约编号', 'booking_id'),
+        ('user', '预约用户', 'booking__user__username'),
+        ('room', '自习室', 'booking__room__name'),
+        ('date', '预约日期', 'booking__date'),
+        ('action', '操作', 'action'),
+        ('operator', '操作者', 'operator__username'),
+        ('notes', '备注', 'notes'),
+        ('created_at', '操作时间', 'created_at'),
+    ),
+}
+
+
+def filter_bookings(queryset, params, ranked=True):
+    """按管理员预约列表的参数过滤预约，无效的自习室或日期参数被忽略
+
+    ranked 为 True 时搜索结果按相关度排序，否则保留查询集原有排序。
+    """
+    status = params.get('status')
+    if status:
+        queryset = queryset.filter(status=status)
+    room = params.get('room', '')
+    if room.isdigit():
+        queryset = queryset.filter(room_id=int(room))
+    day = parse_day(params.get('date'))
+    if day:
+        queryset = queryset.filter(date=day)
+    search = params.get('search', '').strip()
+    if search:
+        # 全文索引匹配用户名、自习室名称和使用目的
+        queryset = search_queryset(
+            queryset, BOOKING, search, ('user__username', 'room__name', 'purpose'), ranked=ranked
+        )
+    return queryset
+
+
+def export_queryset(kind, params):
+    """按列表筛选条件取得要导出的预约或预约历史
+
+    搜索条件是对索引表的子查询，导出全部匹配的预约，不受 SEARCH_MAX_RESULTS 限制。
+    """
+    bookings = filter_bookings(Booking.objects.all(), params, ranked=False)
+    if kind == HISTORY:
+        return BookingHistory.objects.filter(booking__in=bookings.values('pk'))
+    return bookings
+
+
+def iter_rows(queryset, lookups, chunk_size=None):
+    """按主键键集分批逐行读取 values_list() 元组，第一列为主键"""
+    chunk_size = chunk_size or settings.BOOKING_EXPORT_CHUNK_SIZE
+    rows = queryset.order_by('pk').values_list('pk', *lookups)
+    last = 0
+    while True:
+        count = 0
+        for row in rows.filter(pk__gt=last)[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last = row[0]
+            yield row[1:]
+        if count < chunk_size:
+            return
+
+
+def _text(value):
+    if hasattr(value, 'tzinfo') and hasattr(value, 'date'):
+        return timezone.localtime(value).isoformat(timespec='seconds')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """csv.writer 的输出目标，write() 直接返回写入的行"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    # BOM 使 Excel 按 UTF-8 打开中文
+    yield '\ufeff' + writer.writerow([label for _, label, _ in columns])
+    for row in rows:
+        # 用户、自习室、用途和备注由用户填写，转义公式
+        values = [_csv_cell(value) for value in row]
+        values = [_text(value) for value in values]
+        values = [
+            STATUS_LABELS.get(value, value) if key == 'status' else value
+            for (key, _, _), value in zip(columns, values)
+        ]
+        yield writer.writerow(values)
+
+
+def _ndjson_lines(columns, rows):
+    keys = [key for key, _, _ in columns]
+    for row in rows:
+        yield json.dumps(dict(zip(keys, map(_text, row))), ensure_ascii=False) + '\n'
+
+
+def stream_export(queryset, kind, fmt, chunk_size=None):
+    """以流式响应导出查询集，kind 为 BOOKINGS 或 HISTORY，fmt 为 FORMATS 中的格式"""
+    columns = COLUMNS[kind]
+    rows = iter_rows(queryset, [lookup for _, _, lookup in columns], chunk_size)
+    lines = _csv_lines(columns, rows) if fmt == 'csv' else _ndjson_lines(columns, rows)
+    content_type, extension = FORMATS[fmt]
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    filename = f'{kind}-{timezone.localdate():%Y%m%d}.{extension}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,86 @@
+"""
+预约维护任务
+
+由定时任务调用的批量维护操作。每批使用独立的短事务，批次之间可以暂停，
+避免在站点提供服务时长时间持有 SQLite 的写锁。
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from rooms.models import TimeSlot
+from .availability import refresh_occupancy
+from .models import Booking, BookingHistory, JobCheckpoint
+from .stats import add_transition, apply_deltas, new_deltas
+
+COMPLETE_JOB = 'complete_past_bookings'
+
+
+def _expired_condition(now):
+    """已结束的预约：日期早于今天，或今天且时间段已结束"""
+    today, current = now.date(), now.time()
+    ended_slots = list(TimeSlot.objects.filter(end_time__lte=current).order_by().values_list('pk', flat=True))
+    return Q(date__lt=today) | Q(date=today, time_slot_id__in=ended_slots)
+
+
+def complete_past_bookings(now=None, batch_size=500, pause=0, max_batches=None):
+    """将已结束的已确认预约分批转换为已完成
+
+    按(date, id)键集分页，每批一条集合 UPDATE 加一次历史记录 bulk_create，
+    并在同一事务中更新预约统计和断点。max_batches 用于限制单次执行的批数，
+    未处理完时下次执行从断点继续。返回本次处理的预约数量。
+    """
+    now = timezone.localtime(now)
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=COMPLETE_JOB)
+    expired = Booking.objects.filter(_expired_condition(now), status='confirmed')
+    today = now.date()
+
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        position = Q()
+        if checkpoint.last_date:
+            position = Q(date__gt=checkpoint.last_date) | Q(date=checkpoint.last_date, pk__gt=checkpoint.last_id)
+        with transaction.atomic():
+            rows = list(
+                expired.filter(position).order_by('date', 'pk').values_list('pk', 'date', 'room_id', 'user_id')[:batch_size]
+            )
+            if not rows:
+                checkpoint.last_date, checkpoint.last_id = None, 0
+                checkpoint.processed, checkpoint.finished_at = 0, timezone.now()
+                checkpoint.save()
+                break
+            # 断点按读到的最后一行前进，即使其中有行没有被更新
+            last_id, last_date, read = rows[-1][0], rows[-1][1], len(rows)
+            ids = [pk for pk, _, _, _ in rows]
+            stamp = timezone.now()
+            updated = Booking.objects.filter(pk__in=ids, status='confirmed').update(
+                status='completed', updated_at=stamp
+            )
+            if updated < len(rows):
+                # 读取之后被并发取消等操作修改的行没有更新，只为实际完成的预约写历史和统计
+                changed = set(
+                    Booking.objects.filter(pk__in=ids, status='completed', updated_at=stamp).values_list('pk', flat=True)
+                )
+                rows = [row for row in rows if row[0] in changed]
+            BookingHistory.objects.bulk_create([
+                BookingHistory(booking_id=pk, action='完成预约', operator_id=user_id, notes='预约时间已结束，系统自动完成')
+                for pk, _, _, user_id in rows
+            ])
+            deltas = new_deltas()
+            for _, day, room_id, user_id in rows:
+                add_transition(deltas, user_id, room_id, day, 'confirmed', 'completed')
+            apply_deltas(deltas)
+            # 过去日期的占用索引会被清理，只需刷新今天的
+            refresh_occupancy({(room_id, day) for _, day, room_id, _ in rows if day >= today})
+            checkpoint.last_id, checkpoint.last_date = last_id, last_date
+            checkpoint.processed += len(rows)
+            checkpoint.save()
+        total += len(rows)
+        batches += 1
+        if read < batch_size:
+            continue
+        if pause:
+            time.sleep(pause)
+    return total
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from bookings.maintenance import complete_past_bookings
+
+
+class Command(BaseCommand):
+    """将已结束的已确认预约标记为已完成
+
+    建议每个时间段结束后通过定时任务执行，例如：
+        */30 * * * * python manage.py complete_bookings
+    中断后再次执行会从上次提交的批次继续。
+    """
+    help = '分批将时间已结束的已确认预约转换为已完成'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='每批处理的预约数量'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='批次之间暂停的秒数，让出数据库写锁'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='本次最多处理的批数，默认处理完为止'
+        )
+
+    def handle(self, *args, **options):
+        count = complete_past_bookings(
+            batch_size=options['batch_size'],
+            pause=options['sleep'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'已完成 {count} 条预约'))
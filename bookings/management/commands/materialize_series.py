@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from bookings.services import materialize_series
+
+
+class Command(BaseCommand):
+    """生成周期预约在滚动窗口内的预约行
+
+    建议在每日零点后、rebuild_availability 之前执行，例如：
+        0 0 * * * python manage.py materialize_series
+    """
+    help = '为进行中的周期预约生成未来 BOOKING_SERIES_HORIZON_DAYS 天内的预约'
+
+    def handle(self, *args, **options):
+        count = materialize_series()
+        self.stdout.write(self.style.SUCCESS(f'已生成 {count} 条周期预约'))
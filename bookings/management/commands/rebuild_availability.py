@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from bookings.availability import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    """预建时间段占用索引
+
+    建议在每日零点后通过定时任务执行，例如：
+        5 0 * * * python manage.py rebuild_availability
+    """
+    help = '预建未来若干天的时间段占用索引，并清理过期数据'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.AVAILABILITY_PREBUILD_DAYS,
+            help='预建的天数'
+        )
+        parser.add_argument(
+            '--start',
+            help='起始日期(YYYY-MM-DD)，默认今天'
+        )
+
+    def handle(self, *args, **options):
+        start = parse_date(options['start']) if options['start'] else None
+        count = rebuild_occupancy(start=start, days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f'已重建 {count} 条占用索引'))
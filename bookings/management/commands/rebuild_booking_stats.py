@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from bookings.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    """根据预约表重建预约统计
+
+    统计由写操作增量维护，直接修改数据库等情况造成偏差时执行，
+    也可通过定时任务在低峰期执行，例如：
+        30 3 * * 0 python manage.py rebuild_booking_stats
+    """
+    help = '重建全站、用户、自习室/日期的预约数量统计'
+
+    def handle(self, *args, **options):
+        count = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'已重建 {count} 条预约统计'))
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def build_occupancy(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    RoomOccupancy = apps.get_model('bookings', 'RoomOccupancy')
+    masks = {}
+    booked = Booking.objects.filter(
+        date__gte=timezone.localdate(),
+        status__in=['pending', 'confirmed'],
+    ).values_list('room_id', 'date', 'time_slot_id')
+    for room_id, day, slot_id in booked:
+        masks[(room_id, day)] = masks.get((room_id, day), 0) | (1 << slot_id)
+    RoomOccupancy.objects.bulk_create(
+        [
+            RoomOccupancy(
+                room_id=room_id,
+                date=day,
+                bitmap=mask.to_bytes((mask.bit_length() + 7) // 8, 'little'),
+            )
+            for (room_id, day), mask in masks.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0001_initial'),
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('bitmap', models.BinaryField(default=b'', verbose_name='占用位图')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rooms.studyroom', verbose_name='自习室')),
+            ],
+            options={
+                'verbose_name': '时间段占用',
+                'verbose_name_plural': '时间段占用',
+                'unique_together': {('room', 'date')},
+            },
+        ),
+        migrations.RunPython(build_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rooms', '0001_initial'),
+        ('bookings', '0003_booking_active_slot_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='开始日期')),
+                ('end_date', models.DateField(verbose_name='结束日期')),
+                ('interval_weeks', models.PositiveSmallIntegerField(default=1, verbose_name='间隔周数')),
+                ('purpose', models.TextField(blank=True, verbose_name='使用目的')),
+                ('participants', models.PositiveIntegerField(default=1, verbose_name='参与人数')),
+                ('status', models.CharField(choices=[('active', '进行中'), ('cancelled', '已取消')], default='active', max_length=10, verbose_name='状态')),
+                ('materialized_until', models.DateField(blank=True, null=True, verbose_name='已生成至')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rooms.studyroom', verbose_name='自习室')),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rooms.timeslot', verbose_name='时间段')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='预约用户')),
+            ],
+            options={
+                'verbose_name': '周期预约',
+                'verbose_name_plural': '周期预约',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='bookings.bookingseries', verbose_name='所属周期预约'),
+        ),
+    ]
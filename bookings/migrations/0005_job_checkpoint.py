@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_booking_series'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='任务名称')),
+                ('last_date', models.DateField(blank=True, null=True, verbose_name='最后处理日期')),
+                ('last_id', models.PositiveBigIntegerField(default=0, verbose_name='最后处理ID')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='本轮已处理数量')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='上次完成时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '任务断点',
+                'verbose_name_plural': '任务断点',
+            },
+        ),
+    ]
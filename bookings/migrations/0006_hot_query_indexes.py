@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_job_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', '-created_at'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', '-created_at'], name='booking_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'date'], name='booking_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-created_at'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['room', 'date', 'status'], name='booking_room_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinghistory',
+            index=models.Index(fields=['booking', '-created_at'], name='history_booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingseries',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['room', 'end_date'], name='series_active_room_end_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:26
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_stats(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    BookingStats = apps.get_model('bookings', 'BookingStats')
+    statuses = ('pending', 'confirmed', 'cancelled', 'completed')
+    stats = {}
+    rows = Booking.objects.order_by().values('user_id', 'room_id', 'date', 'status').annotate(n=Count('pk'))
+    for row in rows:
+        if row['status'] not in statuses:
+            continue
+        for key in ('global', f"user:{row['user_id']}", f"room:{row['room_id']}:{row['date'].isoformat()}"):
+            counts = stats.setdefault(key, dict.fromkeys(statuses, 0))
+            counts[row['status']] += row['n']
+    BookingStats.objects.bulk_create(
+        [BookingStats(key=key, **counts) for key, counts in stats.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingStats',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='统计键')),
+                ('pending', models.IntegerField(default=0, verbose_name='待确认')),
+                ('confirmed', models.IntegerField(default=0, verbose_name='已确认')),
+                ('cancelled', models.IntegerField(default=0, verbose_name='已取消')),
+                ('completed', models.IntegerField(default=0, verbose_name='已完成')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '预约统计',
+                'verbose_name_plural': '预约统计',
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
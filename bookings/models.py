@@ -1,3 +1,4 @@
+from datetime import timedelta
 from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -13,6 +14,8 @@ class Booking(models.Model):
         ('cancelled', '已取消'),
         ('completed', '已完成'),
     ]
+    # 占用时间段的有效状态
+    ACTIVE_STATUSES = ('pending', 'confirmed')
     
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -38,14 +41,51 @@ class Booking(models.Model):
         default='pending',
         verbose_name='状态'
     )
+    series = models.ForeignKey(
+        'BookingSeries',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='occurrences',
+        verbose_name='所属周期预约'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     
     class Meta:
         verbose_name = '预约'
         verbose_name_plural = '预约'
-        unique_together = ('room', 'time_slot', 'date')
         ordering = ['-created_at']
+        constraints = [
+            # 同一自习室、时间段、日期只能有一个有效预约，已取消/已完成的预约不占用
+            models.UniqueConstraint(
+                fields=['room', 'time_slot', 'date'],
+                condition=models.Q(status__in=('pending', 'confirmed')),
+                name='unique_active_booking_slot',
+            ),
+        ]
+        indexes = [
+            # 我的预约：按用户筛选、按创建时间倒序。索引使用升序，倒序扫描时
+            # 隐含的 id 也是倒序，游标分页的 (created_at, id) 排序无需额外排序
+            models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
+            # 管理员列表：按状态筛选、按创建时间倒序
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+            # 自动完成任务：按状态和日期键集分页
+            models.Index(fields=['status', 'date'], name='booking_status_date_idx'),
+            # 管理员未筛选状态时的列表
+            models.Index(fields=['created_at'], name='booking_created_idx'),
+            # 可用性查询按(自习室, 日期)定位后在索引内过滤状态；SQLite 无法用
+            # 带参数的 status IN (?, ?) 匹配部分索引条件，因此不做成部分索引
+            models.Index(fields=['room', 'date', 'status'], name='booking_room_date_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # 记录从数据库加载时的字段值，用于保存后判断占用索引是否需要更新
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def clean(self):
         """验证预约规则"""
         current_date = timezone.now().date()
@@ -56,33 +96,14 @@ class Booking(models.Model):
         # 检查人数不能超过房间容量
         if self.room_id and self.participants:
             try:
-                room = self.room # This line might still cause issues if self.room is not loaded
-                if self.participants > room.capacity:
-                    raise ValidationError(f'参与人数不能超过房间容量({room.capacity})')
+                room = self.room
             except StudyRoom.DoesNotExist:
-                # This case should ideally be prevented by form validation or a check for self.room before accessing its attributes
-                pass 
+                room = None
+            if room and self.participants > room.capacity:
+                raise ValidationError(f'参与人数不能超过房间容量({room.capacity})')
         
-        # 检查同一时间段是否已被预约
-        if self.room_id and self.time_slot_id and self.date:
-            # It's generally better to query using the related object itself if available,
-            # but using _id fields is fine if the object isn't loaded.
-            # However, ensure that room and time_slot are actually set on the instance
-            # if you are in a context where they should be (e.g. after form validation and cleaning)
-            try:
-                existing_booking = Booking.objects.filter(
-                    room_id=self.room_id,
-                    time_slot_id=self.time_slot_id,
-                    date=self.date,
-                    status__in=['pending', 'confirmed']
-                ).exclude(pk=self.pk)
-                
-                if existing_booking.exists():
-                    raise ValidationError('该时间段已被预约')
-            except Exception:
-                # Avoid catching generic Exception if possible.
-                # Consider what specific exceptions might occur here.
-                pass 
+        # 时间段冲突由 unique_active_booking_slot 约束在写入时保证，
+        # 见 bookings.services.admit_booking
     
     def save(self, *args, **kwargs):
         self.clean()
@@ -95,6 +116,95 @@ class Booking(models.Model):
         return f"{user_name} - {room_name} - {self.date} {time_slot_name}"
 
 
+class BookingSeries(models.Model):
+    """周期预约
+
+    只保存一次重复规则（每 interval_weeks 周的 start_date 同一星期几），
+    具体的预约在滚动窗口内按需生成，materialized_until 记录已生成到的日期。
+    """
+    STATUS_CHOICES = [
+        ('active', '进行中'),
+        ('cancelled', '已取消'),
+    ]
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='预约用户'
+    )
+    room = models.ForeignKey(
+        StudyRoom,
+        on_delete=models.CASCADE,
+        verbose_name='自习室'
+    )
+    time_slot = models.ForeignKey(
+        TimeSlot,
+        on_delete=models.CASCADE,
+        verbose_name='时间段'
+    )
+    start_date = models.DateField(verbose_name='开始日期')
+    end_date = models.DateField(verbose_name='结束日期')
+    interval_weeks = models.PositiveSmallIntegerField(default=1, verbose_name='间隔周数')
+    purpose = models.TextField(blank=True, verbose_name='使用目的')
+    participants = models.PositiveIntegerField(default=1, verbose_name='参与人数')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='active',
+        verbose_name='状态'
+    )
+    materialized_until = models.DateField(null=True, blank=True, verbose_name='已生成至')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    
+    class Meta:
+        verbose_name = '周期预约'
+        verbose_name_plural = '周期预约'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['room', 'end_date'],
+                condition=models.Q(status='active'),
+                name='series_active_room_end_idx',
+            ),
+        ]
+    
+    def clean(self):
+        """验证重复规则"""
+        if self.start_date and self.end_date and self.end_date < self.start_date:
+            raise ValidationError('结束日期不能早于开始日期')
+        if self.interval_weeks is not None and self.interval_weeks < 1:
+            raise ValidationError('间隔周数至少为1')
+    
+    def occurs_on(self, day):
+        """判断指定日期是否为该周期的一次预约"""
+        if day < self.start_date or day > self.end_date:
+            return False
+        return (day - self.start_date).days % (7 * self.interval_weeks) == 0
+    
+    def occurrence_dates(self, start=None, end=None):
+        """生成 [start, end] 范围内的预约日期"""
+        step = 7 * self.interval_weeks
+        first = self.start_date
+        if start and start > first:
+            first += timedelta(days=-(-(start - first).days // step) * step)
+        last = min(end, self.end_date) if end else self.end_date
+        day = first
+        while day <= last:
+            yield day
+            day += timedelta(days=step)
+    
+    @property
+    def occurrence_count(self):
+        """总预约次数，按规则计算而不展开"""
+        if self.end_date < self.start_date:
+            return 0
+        return (self.end_date - self.start_date).days // (7 * self.interval_weeks) + 1
+    
+    def __str__(self):
+        return f"{self.user} - {self.room} - {self.start_date}~{self.end_date} {self.time_slot}"
+
+
 class BookingHistory(models.Model):
     """预约历史记录"""
     booking = models.ForeignKey(
@@ -115,6 +225,80 @@ class BookingHistory(models.Model):
         verbose_name = '预约历史'
         verbose_name_plural = '预约历史'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['booking', '-created_at'], name='history_booking_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.booking} - {self.action}"
+
+
+class RoomOccupancy(models.Model):
+    """自习室每日时间段占用索引
+
+    每个(自习室, 日期)一行，bitmap 中第 N 位为 1 表示主键为 N 的时间段
+    已被有效预约（待确认/已确认）占用。由预约写操作同步维护。
+    """
+    room = models.ForeignKey(
+        StudyRoom,
+        on_delete=models.CASCADE,
+        verbose_name='自习室'
+    )
+    date = models.DateField(verbose_name='日期')
+    bitmap = models.BinaryField(default=b'', verbose_name='占用位图')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '时间段占用'
+        verbose_name_plural = '时间段占用'
+        unique_together = ('room', 'date')
+
+    def __str__(self):
+        return f"{self.room_id} - {self.date}"
+
+
+class BookingStats(models.Model):
+    """预约数量统计
+
+    按键保存各状态的预约数量：'global' 为全站，'user:<id>' 为单个用户，
+    'room:<id>:<YYYY-MM-DD>' 为单个自习室某天。由预约写操作在同一事务中
+    增量维护，列表页按主键读取一行即可，偏差可用 rebuild_booking_stats 修复。
+    """
+    key = models.CharField(max_length=64, primary_key=True, verbose_name='统计键')
+    pending = models.IntegerField(default=0, verbose_name='待确认')
+    confirmed = models.IntegerField(default=0, verbose_name='已确认')
+    cancelled = models.IntegerField(default=0, verbose_name='已取消')
+    completed = models.IntegerField(default=0, verbose_name='已完成')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    
+    class Meta:
+        verbose_name = '预约统计'
+        verbose_name_plural = '预约统计'
+    
+    @property
+    def total(self):
+        return self.pending + self.confirmed + self.cancelled + self.completed
+    
+    def __str__(self):
+        return f"{self.key}: {self.total}"
+
+
+class JobCheckpoint(models.Model):
+    """后台任务断点
+
+    分批执行的维护任务在每批提交时记录最后处理的(日期, 主键)，
+    中断后再次执行从断点继续；整轮完成后清空位置。
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name='任务名称')
+    last_date = models.DateField(null=True, blank=True, verbose_name='最后处理日期')
+    last_id = models.PositiveBigIntegerField(default=0, verbose_name='最后处理ID')
+    processed = models.PositiveIntegerField(default=0, verbose_name='本轮已处理数量')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='上次完成时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    
+    class Meta:
+        verbose_name = '任务断点'
+        verbose_name_plural = '任务断点'
+    
+    def __str__(self):
+        return f"{self.name} ({self.last_date}, {self.last_id})"
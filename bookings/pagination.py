@@ -0,0 +1,150 @@
+"""
+键集（游标）分页
+
+按 (created_at, id) 倒序分页：下一页的条件为 (created_at, id) 小于本页最后一行，
+不使用 OFFSET，也默认不统计总数，因此任意深度的页面代价相同。
+游标是对客户端不透明的 base64 字符串。查询集可以是 values() 投影，需包含
+created_at 和 id。
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+NEXT, PREVIOUS = 'n', 'p'
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def _position(obj):
+    """取 (created_at, id)，支持模型实例和 values() 返回的字典"""
+    if isinstance(obj, dict):
+        return obj['created_at'], obj['id']
+    return obj.created_at, obj.pk
+
+
+def encode_cursor(direction, obj):
+    created_at, pk = _position(obj)
+    raw = f'{direction}|{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游标，返回 (方向, created_at, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        direction, created_at, pk = raw.split('|')
+        if direction not in (NEXT, PREVIOUS):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+class KeysetPage:
+    """一页数据及前后页游标"""
+
+    def __init__(self, items, next_cursor, previous_cursor, count=None):
+        self.object_list = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_keyset(queryset, cursor=None, page_size=20, with_count=False):
+    """按 (created_at, id) 倒序取出游标所指的一页
+
+    多取一行判断是否还有更多数据；with_count 为 True 时才额外执行 COUNT。
+    游标无效时抛出 InvalidCursor。
+    """
+    direction, created_at, pk = decode_cursor(cursor) if cursor else (NEXT, None, None)
+    if direction == NEXT:
+        page = queryset.order_by('-created_at', '-pk')
+        if created_at is not None:
+            page = page.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    else:
+        page = queryset.order_by('created_at', 'pk').filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        )
+    rows = list(page[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if direction == NEXT:
+        has_next, has_previous = has_more, created_at is not None
+    else:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(NEXT, rows[-1]) if rows and has_next else None,
+        previous_cursor=encode_cursor(PREVIOUS, rows[0]) if rows and has_previous else None,
+        count=queryset.count() if with_count else None,
+    )
+
+
+class BookingCursorPagination(BasePagination):
+    """预约API的游标分页，?count=1 时返回总数"""
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        with_count = request.query_params.get(self.count_query_param) in ('1', 'true')
+        try:
+            self.page = paginate_keyset(
+                queryset, request.query_params.get(self.cursor_query_param), self.page_size, with_count
+            )
+        except InvalidCursor:
+            raise NotFound('无效的游标')
+        return list(self.page)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        body = {
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        }
+        if self.page.count is not None:
+            body['count'] = self.page.count
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
@@ -1,31 +1,203 @@
-from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from rest_framework import exceptions, serializers, status
+from monitoring.timing import SERIALIZER, TimedSerializerMixin, measure
 from .models import Booking
+from .services import SlotUnavailable, admit_booking
 from rooms.models import StudyRoom, TimeSlot
 from accounts.models import User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class SlotConflict(exceptions.APIException):
+    """时间段已被预约"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = '该时间段已被预约'
+    default_code = 'slot_taken'
+
+
+def _lookup(prefix, field):
+    return prefix + field.source.replace('.', '__')
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class SparseFieldsMixin:
+    """支持 ?fields= 和 ?expand= 的序列化器
+
+    两个参数都未提供时输出全部字段，与原来一致。fields 选择输出的字段，
+    嵌套对象的字段用 "room.name" 选择；提供任一参数时，嵌套对象只有在
+    expand 中列出或选择了其字段时才展开，否则只输出主键。
+    裁剪后的字段同时决定预加载和 values() 投影，未请求的列和联表不会被查询。
+    也可以在构造时直接传入 fields/expand 列表。
+    """
+    
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            params = getattr(self.context.get('request'), 'query_params', {})
+            fields = _split(params['fields']) if 'fields' in params else None
+            expand = _split(params['expand']) if 'expand' in params else None
+        self.sparse = fields is not None or expand is not None
+        if self.sparse:
+            self._apply_sparse(fields, expand or [])
+    
+    def _apply_sparse(self, fields, expand):
+        selected, nested_fields, nested_expand = set(), {}, {}
+        for name in fields or []:
+            head, _, rest = name.partition('.')
+            selected.add(head)
+            if rest:
+                nested_fields.setdefault(head, []).append(rest)
+        for name in expand:
+            head, _, rest = name.partition('.')
+            nested_expand.setdefault(head, [])
+            if rest:
+                nested_expand[head].append(rest)
+        
+        readable = {name for name, field in self.fields.items() if not field.write_only}
+        unknown = (selected | set(nested_expand)) - readable
+        if unknown:
+            raise exceptions.ParseError(f'未知字段：{"、".join(sorted(unknown))}')
+        
+        for name in list(self.fields):
+            field = self.fields[name]
+            if field.write_only:
+                continue
+            if fields is not None and name not in selected:
+                self.fields.pop(name)
+            elif isinstance(field, SparseFieldsMixin):
+                kwargs = {'read_only': True}
+                if field.source != name:
+                    kwargs['source'] = field.source
+                if name in nested_expand or name in nested_fields:
+                    self.fields[name] = type(field)(
+                        fields=nested_fields.get(name), expand=nested_expand.get(name, []), **kwargs
+                    )
+                else:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(**kwargs)
+
+
+class EagerLoadingMixin:
+    """根据声明的嵌套序列化器字段预加载关联对象
+
+    单个嵌套对象用 select_related，many=True 的嵌套列表用 prefetch_related，
+    嵌套序列化器中的嵌套字段递归处理。
+    """
+    
+    @classmethod
+    def related_lookups(cls, serializer=None, prefix=''):
+        """返回 (select_related 路径, prefetch_related 路径)"""
+        serializer = serializer or cls()
+        select, prefetch = [], []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                prefetch.append(_lookup(prefix, field))
+            elif isinstance(field, serializers.BaseSerializer):
+                lookup = _lookup(prefix, field)
+                select.append(lookup)
+                nested_select, nested_prefetch = cls.related_lookups(field, lookup + '__')
+                select.extend(nested_select)
+                prefetch.extend(nested_prefetch)
+        return select, prefetch
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, serializer=None):
+        """按序列化器字段预加载；传入裁剪过的序列化器时只读取用到的列"""
+        select, prefetch = cls.related_lookups(serializer)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if getattr(serializer, 'sparse', False):
+            queryset = queryset.only(*ValuesProjection(serializer).lookups)
+        return queryset
+
+
+class ValuesProjection:
+    """按序列化器声明的可读字段生成 values() 投影的只读序列化
+
+    嵌套对象通过联表字段一并读出，不实例化模型，由各字段自身的
+    to_representation 转换，输出与原序列化器一致。只支持普通字段和
+    单个嵌套序列化器，声明了 SerializerMethodField、嵌套列表等字段时报错。
+    """
+    
+    def __init__(self, serializer, context=None):
+        self.columns = []
+        if isinstance(serializer, type):
+            serializer = serializer(context=context or {})
+        self._collect(serializer, (), '')
+    
+    def _collect(self, serializer, path, prefix):
+        model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer) or field.source == '*':
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name} 不能用 values() 投影')
+            if isinstance(field, serializers.BaseSerializer):
+                self._collect(field, path + (name,), _lookup(prefix, field) + '__')
+                continue
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                # values() 对外键直接返回主键
+                self.columns.append((path + (name,), _lookup(prefix, field), None, None))
+                continue
+            convert = None
+            model_field = model._meta.get_field(field.source) if model and '.' not in field.source else None
+            if isinstance(model_field, models.FileField):
+                # values() 返回文件名，包装为 FieldFile 以便字段生成 URL
+                convert = lambda name, model_field=model_field: model_field.attr_class(None, model_field, name)
+            self.columns.append((path + (name,), _lookup(prefix, field), field, convert))
+    
+    @property
+    def lookups(self):
+        return [lookup for _, lookup, _, _ in self.columns]
+    
+    def to_representation(self, row):
+        data = {}
+        for path, lookup, field, convert in self.columns:
+            target = data
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            value = row[lookup]
+            if value is not None and convert:
+                value = convert(value)
+            if value is not None and field is not None:
+                value = field.to_representation(value)
+            target[path[-1]] = value
+        return data
+    
+    def serialize(self, rows):
+        with measure(SERIALIZER):
+            return [self.to_representation(row) for row in rows]
+
+
+class UserSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """用户序列化器"""
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'user_type', 'student_id']
 
 
-class StudyRoomSerializer(serializers.ModelSerializer):
+class StudyRoomSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """自习室序列化器"""
     class Meta:
         model = StudyRoom
         fields = ['id', 'name', 'description', 'capacity', 'location', 'equipment', 'image']
 
 
-class TimeSlotSerializer(serializers.ModelSerializer):
+class TimeSlotSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """时间段序列化器"""
     class Meta:
         model = TimeSlot
         fields = ['id', 'name', 'start_time', 'end_time']
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(TimedSerializerMixin, EagerLoadingMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """预约序列化器"""
     user = UserSerializer(read_only=True)
     room = StudyRoomSerializer(read_only=True)
@@ -45,51 +217,87 @@ class BookingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'status', 'created_at', 'updated_at']
     
     def create(self, validated_data):
-        room_id = validated_data.pop('room_id')
-        time_slot_id = validated_data.pop('time_slot_id')
-        
-        room = StudyRoom.objects.get(id=room_id)
-        time_slot = TimeSlot.objects.get(id=time_slot_id)
-        
-        validated_data['room'] = room
-        validated_data['time_slot'] = time_slot
-        
-        return super().create(validated_data)
+        # validate() 已加载 room 和 time_slot 对象，这里不再重复查询
+        try:
+            return admit_booking(Booking(**validated_data))
+        except SlotUnavailable as exc:
+            raise SlotConflict(exc.message)
+    
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        try:
+            return admit_booking(instance)
+        except SlotUnavailable as exc:
+            raise SlotConflict(exc.message)
     
     def validate(self, data):
-        # 验证房间和时间段是否存在
+        # 验证房间和时间段是否存在，并将加载的对象交给 create/update 复用
         if 'room_id' in data:
             try:
-                room = StudyRoom.objects.get(id=data['room_id'], is_active=True)
+                data['room'] = StudyRoom.objects.get(id=data.pop('room_id'), is_active=True)
             except StudyRoom.DoesNotExist:
                 raise serializers.ValidationError('指定的自习室不存在或已停用')
         
         if 'time_slot_id' in data:
             try:
-                time_slot = TimeSlot.objects.get(id=data['time_slot_id'], is_active=True)
+                data['time_slot'] = TimeSlot.objects.get(id=data.pop('time_slot_id'), is_active=True)
             except TimeSlot.DoesNotExist:
                 raise serializers.ValidationError('指定的时间段不存在或已停用')
         
         # 验证参与人数
-        if 'room_id' in data and 'participants' in data:
-            room = StudyRoom.objects.get(id=data['room_id'])
-            if data['participants'] > room.capacity:
+        if 'participants' in data:
+            room = data.get('room') or (self.instance.room if self.instance else None)
+            if room and data['participants'] > room.capacity:
                 raise serializers.ValidationError(f'参与人数不能超过房间容量({room.capacity})')
         
-        # 验证时间段冲突
-        if all(key in data for key in ['room_id', 'time_slot_id', 'date']):
-            existing = Booking.objects.filter(
-                room_id=data['room_id'],
-                time_slot_id=data['time_slot_id'],
-                date=data['date'],
-                status__in=['pending', 'confirmed']
-            )
-            
-            # 如果是更新操作，排除当前预约
-            if self.instance:
-                existing = existing.exclude(pk=self.instance.pk)
-            
-            if existing.exists():
-                raise serializers.ValidationError('该时间段已被预约')
+        # 时间段冲突由数据库约束在写入时判定，见 bookings.services.admit_booking
         
         return data
+
+
+class BookingBatchOperationSerializer(serializers.Serializer):
+    """批量操作中的单项操作"""
+    op = serializers.ChoiceField(choices=['create', 'cancel'])
+    id = serializers.IntegerField(required=False)
+    room_id = serializers.IntegerField(required=False)
+    time_slot_id = serializers.IntegerField(required=False)
+    date = serializers.DateField(required=False)
+    purpose = serializers.CharField(required=False, allow_blank=True, default='')
+    participants = serializers.IntegerField(required=False, min_value=1, default=1)
+    
+    def validate(self, data):
+        if data['op'] == 'cancel' and 'id' not in data:
+            raise serializers.ValidationError('取消操作需要提供id')
+        if data['op'] == 'create' and not all(key in data for key in ['room_id', 'time_slot_id', 'date']):
+            raise serializers.ValidationError('创建操作需要提供room_id、time_slot_id和date')
+        return data
+
+
+class BookingBatchSerializer(serializers.Serializer):
+    """批量预约操作请求"""
+    MODE_CHOICES = [
+        ('atomic', '全部成功或全部不执行'),
+        ('best_effort', '执行所有可成功的操作'),
+    ]
+    
+    mode = serializers.ChoiceField(choices=MODE_CHOICES, default='atomic')
+    operations = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.BOOKING_BATCH_MAX_OPERATIONS
+    )
+    
+    def get_operations(self):
+        """逐项校验操作，未通过的项转换为 {'op': ..., 'error': ...}"""
+        operations = []
+        for item in self.validated_data['operations']:
+            serializer = BookingBatchOperationSerializer(data=item)
+            if serializer.is_valid():
+                operations.append(serializer.validated_data)
+            else:
+                errors = serializer.errors
+                field, messages = next(iter(errors.items()))
+                prefix = '' if field == 'non_field_errors' else f'{field}: '
+                operations.append({'op': item.get('op'), 'error': f'{prefix}{messages[0]}'})
+        return operations
@@ -0,0 +1,454 @@
+"""
+预约写操作服务
+
+网页表单、API 等所有预约入口统一通过这里写入，时间段冲突依赖
+unique_active_booking_slot 条件唯一约束在数据库中判定，不再先查询后插入。
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from rooms.models import StudyRoom, TimeSlot
+from search.index import BOOKING, booking_document, index_bookings, index_documents
+from .availability import is_slot_free, refresh_occupancy, series_horizon, series_masks
+from .models import Booking, BookingHistory, BookingSeries
+from .stats import add_booking, add_transition, apply_deltas, new_deltas
+
+SLOT_CONSTRAINT = 'unique_active_booking_slot'
+
+
+class SlotUnavailable(Exception):
+    """时间段已被其他有效预约占用"""
+
+    def __init__(self, message='该时间段已被预约，请选择其他时间段'):
+        super().__init__(message)
+        self.message = message
+
+
+def _slot_columns():
+    """SQLite 的唯一约束错误只列出列名，如 bookings_booking.room_id, bookings_booking.time_slot_id, ..."""
+    meta = Booking._meta
+    constraint = next(c for c in meta.constraints if c.name == SLOT_CONSTRAINT)
+    return ', '.join(f'{meta.db_table}.{meta.get_field(name).column}' for name in constraint.fields)
+
+
+def _is_slot_conflict(exc):
+    """是否违反了 unique_active_booking_slot，其他唯一约束的冲突照常抛出
+
+    PostgreSQL 等的错误信息包含约束名，SQLite 只包含列名。MySQL 不支持条件唯一约束，
+    冲突由 _lock_slot 检查，不会走到这里。
+    """
+    text = str(exc)
+    return SLOT_CONSTRAINT in text or text == f'UNIQUE constraint failed: {_slot_columns()}'
+
+
+def _lock_slot(booking):
+    """不支持条件唯一约束的数据库（如MySQL）上，锁定自习室行后检查冲突"""
+    StudyRoom.objects.select_for_update().filter(pk=booking.room_id).exists()
+    conflict = Booking.objects.filter(
+        room_id=booking.room_id,
+        time_slot_id=booking.time_slot_id,
+        date=booking.date,
+        status__in=Booking.ACTIVE_STATUSES,
+    ).exclude(pk=booking.pk)
+    if conflict.exists():
+        raise SlotUnavailable()
+
+
+def _claimed_by_series(booking):
+    """生成窗口之后的日期尚无预约行，需要按周期规则检查是否已被占用"""
+    mask = series_masks([(booking.room_id, booking.date)]).get((booking.room_id, booking.date), 0)
+    return not is_slot_free(mask, booking.time_slot_id)
+
+
+def admit_booking(booking, operator=None, action='创建预约', notes=''):
+    """在单个事务中写入预约（及其历史记录）
+
+    违反时间段唯一约束时抛出 SlotUnavailable，调用方据此返回"已被预约"提示。
+    operator 不为空时同时写入一条预约历史。
+    """
+    try:
+        with transaction.atomic():
+            if booking.status in Booking.ACTIVE_STATUSES:
+                if not connection.features.supports_partial_indexes:
+                    _lock_slot(booking)
+                if booking.series_id is None and _claimed_by_series(booking):
+                    raise SlotUnavailable()
+            booking.save()
+            if operator is not None:
+                BookingHistory.objects.create(
+                    booking=booking,
+                    action=action,
+                    operator=operator,
+                    notes=notes,
+                )
+    except IntegrityError as exc:
+        if _is_slot_conflict(exc):
+            raise SlotUnavailable() from exc
+        raise
+    return booking
+
+
+def transition_booking(booking, status, operator, action, notes='', from_statuses=None):
+    """将预约状态从 from_statuses 之一转换为 status
+
+    使用带状态条件的 UPDATE，不会重新执行 Booking.clean，也不会与并发的
+    审批/取消互相覆盖。状态已被他人修改时返回 False。
+    """
+    from_statuses = from_statuses or (booking.status,)
+    if booking.status not in from_statuses:
+        return False
+    with transaction.atomic():
+        # 按加载时的状态更新，保证统计的增量与实际转换一致
+        updated = Booking.objects.filter(
+            pk=booking.pk, status=booking.status
+        ).update(status=status, updated_at=timezone.now())
+        if not updated:
+            return False
+        old_status = booking.status
+        booking.status = status
+        BookingHistory.objects.create(
+            booking=booking,
+            action=action,
+            operator=operator,
+            notes=notes,
+        )
+        deltas = new_deltas()
+        add_transition(deltas, booking.user_id, booking.room_id, booking.date, old_status, status)
+        apply_deltas(deltas)
+        if (old_status in Booking.ACTIVE_STATUSES) != (status in Booking.ACTIVE_STATUSES):
+            refresh_occupancy([(booking.room_id, booking.date)])
+    return True
+
+
+def transition_bookings(booking_ids, status, operator, action, notes='', from_statuses=('pending',)):
+    """批量将预约从 from_statuses 之一转换为 status
+
+    一条带状态条件的 UPDATE 完成转换，再按本次写入的 updated_at 取回实际
+    转换的预约，历史记录用一次 bulk_create 写入；状态已被他人修改的预约
+    自然被跳过。返回实际转换的预约列表。
+    """
+    changed = []
+    deltas = new_deltas()
+    with transaction.atomic():
+        # 每个原状态一次 UPDATE，便于按原状态计算统计增量
+        for old_status in from_statuses:
+            now = timezone.now()
+            updated = Booking.objects.filter(
+                pk__in=booking_ids, status=old_status
+            ).update(status=status, updated_at=now)
+            if not updated:
+                continue
+            rows = list(Booking.objects.filter(
+                pk__in=booking_ids, status=status, updated_at=now
+            ).order_by().only('id', 'user_id', 'room_id', 'date'))
+            for booking in rows:
+                add_transition(deltas, booking.user_id, booking.room_id, booking.date, old_status, status)
+            changed.extend(rows)
+        if not changed:
+            return []
+        BookingHistory.objects.bulk_create([
+            BookingHistory(booking=booking, action=action, operator=operator, notes=notes)
+            for booking in changed
+        ])
+        apply_deltas(deltas)
+        if any((old in Booking.ACTIVE_STATUSES) != (status in Booking.ACTIVE_STATUSES) for old in from_statuses):
+            refresh_occupancy({(booking.room_id, booking.date) for booking in changed})
+    return changed
+
+
+def _batch_error(op, message, code='invalid'):
+    return {'op': op, 'status': 'error', 'code': code, 'error': message}
+
+
+def _apply_batch_one_by_one(user, to_cancel, to_create, results):
+    """批量写入遇到并发冲突时，逐条写入以保留可成功的操作"""
+    for index, booking in to_cancel:
+        done = transition_booking(
+            booking, 'cancelled', operator=user, action='取消预约',
+            notes='批量操作取消预约', from_statuses=Booking.ACTIVE_STATUSES
+        )
+        results[index] = (
+            {'op': 'cancel', 'status': 'cancelled', 'id': booking.pk} if done
+            else _batch_error('cancel', '预约状态已变更，无法取消', 'not_found')
+        )
+    for index, booking in to_create:
+        try:
+            admit_booking(booking, operator=user, notes='批量操作创建预约')
+        except SlotUnavailable as exc:
+            results[index] = _batch_error('create', exc.message, 'slot_taken')
+        else:
+            results[index] = {'op': 'create', 'status': 'created', 'id': booking.pk}
+
+
+def apply_booking_batch(user, operations, atomic=True):
+    """批量创建/取消预约
+
+    operations 中每项为已通过字段校验的操作（op 为 create 或 cancel），
+    未通过字段校验的项以 {'op': ..., 'error': ...} 形式传入。
+    自习室、时间段、待取消预约和冲突检测各用一次查询完成，写入使用
+    bulk_create 及集合 UPDATE，预约历史批量写入。
+
+    atomic 为 True 时任一操作失败则全部不写入；否则写入所有可成功的操作。
+    返回与 operations 一一对应的结果列表。
+    """
+    results = [None] * len(operations)
+    creates, cancels = [], []
+    for index, op in enumerate(operations):
+        if 'error' in op:
+            results[index] = _batch_error(op.get('op'), op['error'])
+        elif op['op'] == 'create':
+            creates.append((index, op))
+        else:
+            cancels.append((index, op))
+
+    rooms = StudyRoom.objects.filter(is_active=True).in_bulk({op['room_id'] for _, op in creates})
+    slots = TimeSlot.objects.filter(is_active=True).in_bulk({op['time_slot_id'] for _, op in creates})
+    owned = Booking.objects.filter(
+        user=user, status__in=Booking.ACTIVE_STATUSES
+    ).only('id', 'user_id', 'room_id', 'time_slot_id', 'date', 'status').in_bulk({op['id'] for _, op in cancels})
+
+    to_cancel = []
+    for index, op in cancels:
+        booking = owned.pop(op['id'], None)
+        if booking is None:
+            results[index] = _batch_error('cancel', '预约不存在或无法取消', 'not_found')
+        else:
+            to_cancel.append((index, booking))
+    freed = {(b.room_id, b.time_slot_id, b.date) for _, b in to_cancel}
+
+    candidates = []
+    today = timezone.localdate()
+    for index, op in creates:
+        room, slot = rooms.get(op['room_id']), slots.get(op['time_slot_id'])
+        if room is None:
+            results[index] = _batch_error('create', '指定的自习室不存在或已停用')
+        elif slot is None:
+            results[index] = _batch_error('create', '指定的时间段不存在或已停用')
+        elif op['date'] < today:
+            results[index] = _batch_error('create', '不能预约过去的日期')
+        elif op['participants'] > room.capacity:
+            results[index] = _batch_error('create', f'参与人数不能超过房间容量({room.capacity})')
+        else:
+            candidates.append((index, Booking(
+                user=user, room=room, time_slot=slot, date=op['date'],
+                purpose=op.get('purpose', ''), participants=op['participants'],
+            )))
+
+    # 一次查询找出与已有有效预约冲突的时间段，本批次取消的时间段视为空闲
+    taken = set()
+    if candidates:
+        taken = set(Booking.objects.filter(
+            room_id__in={b.room_id for _, b in candidates},
+            time_slot_id__in={b.time_slot_id for _, b in candidates},
+            date__in={b.date for _, b in candidates},
+            status__in=Booking.ACTIVE_STATUSES,
+        ).order_by().values_list('room_id', 'time_slot_id', 'date')) - freed
+    claims = series_masks({(b.room_id, b.date) for _, b in candidates})
+    to_create = []
+    for index, booking in candidates:
+        key = (booking.room_id, booking.time_slot_id, booking.date)
+        claimed = not is_slot_free(claims.get((booking.room_id, booking.date), 0), booking.time_slot_id)
+        if key in taken or claimed:
+            results[index] = _batch_error('create', '该时间段已被预约', 'slot_taken')
+        else:
+            taken.add(key)
+            to_create.append((index, booking))
+
+    if atomic and any(result is not None for result in results):
+        return [result or {'op': operations[i]['op'], 'status': 'skipped'} for i, result in enumerate(results)]
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            Booking.objects.filter(
+                pk__in=[b.pk for _, b in to_cancel], status__in=Booking.ACTIVE_STATUSES
+            ).update(status='cancelled', updated_at=now)
+            created = Booking.objects.bulk_create([b for _, b in to_create])
+            if created and created[0].pk is None:
+                # 不支持 RETURNING 的数据库需要回查新预约的主键
+                ids = dict(
+                    ((room_id, slot_id, day), pk) for pk, room_id, slot_id, day in Booking.objects.filter(
+                        user=user, created_at__gte=now, status='pending'
+                    ).values_list('pk', 'room_id', 'time_slot_id', 'date')
+                )
+                for booking in created:
+                    booking.pk = ids[(booking.room_id, booking.time_slot_id, booking.date)]
+            BookingHistory.objects.bulk_create(
+                [BookingHistory(booking=b, action='取消预约', operator=user, notes='批量操作取消预约') for _, b in to_cancel]
+                + [BookingHistory(booking=b, action='创建预约', operator=user, notes='批量操作创建预约') for _, b in to_create]
+            )
+            deltas = new_deltas()
+            for _, booking in to_cancel:
+                add_transition(deltas, user.pk, booking.room_id, booking.date, booking.status, 'cancelled')
+            for _, booking in to_create:
+                add_booking(deltas, user.pk, booking.room_id, booking.date, 'pending')
+            apply_deltas(deltas)
+            refresh_occupancy({(b.room_id, b.date) for _, b in to_cancel + to_create})
+            index_bookings([b for _, b in to_create], created=True)
+    except IntegrityError as exc:
+        if not _is_slot_conflict(exc):
+            raise
+        # 冲突检测之后有并发写入抢占了时间段
+        if atomic:
+            return [
+                _batch_error(op['op'], '该时间段已被预约', 'slot_taken') if op['op'] == 'create'
+                else {'op': op['op'], 'status': 'skipped'}
+                for op in operations
+            ]
+        _apply_batch_one_by_one(user, to_cancel, to_create, results)
+        return results
+
+    for index, booking in to_cancel:
+        results[index] = {'op': 'cancel', 'status': 'cancelled', 'id': booking.pk}
+    for index, booking in to_create:
+        results[index] = {'op': 'create', 'status': 'created', 'id': booking.pk}
+    return results
+
+
+def series_conflicts(series):
+    """返回周期预约中已被占用的日期列表
+
+    已有预约行用一次日期范围查询读取，其他周期预约尚未生成的日期
+    用一次查询读取重叠的周期后按规则计算，不逐个日期查询。
+    """
+    start = max(series.start_date, timezone.localdate())
+    dates = set(series.occurrence_dates(start=start))
+    if not dates:
+        return []
+    end = max(dates)
+    booked = Booking.objects.filter(
+        room_id=series.room_id,
+        time_slot_id=series.time_slot_id,
+        date__range=(start, end),
+        status__in=Booking.ACTIVE_STATUSES,
+    ).order_by().values_list('date', flat=True)
+    conflicts = dates.intersection(booked)
+    others = BookingSeries.objects.filter(
+        room_id=series.room_id,
+        time_slot_id=series.time_slot_id,
+        status='active',
+        start_date__lte=end,
+        end_date__gte=start,
+    ).exclude(pk=series.pk).order_by()
+    for other in others:
+        conflicts.update(
+            day for day in dates
+            if other.occurs_on(day) and not (other.materialized_until and day <= other.materialized_until)
+        )
+    return sorted(conflicts)
+
+
+def _materialize(series, until, ignore_conflicts):
+    """为周期预约生成 until 之前尚未生成的预约行，返回生成的数量"""
+    start = max(series.start_date, timezone.localdate())
+    if series.materialized_until:
+        start = max(start, series.materialized_until + timedelta(days=1))
+    until = min(until, series.end_date)
+    dates = list(series.occurrence_dates(start=start, end=until))
+    created = 0
+    if dates:
+        Booking.objects.bulk_create(
+            [
+                Booking(
+                    user_id=series.user_id, room_id=series.room_id, time_slot_id=series.time_slot_id,
+                    date=day, purpose=series.purpose, participants=series.participants, series=series,
+                )
+                for day in dates
+            ],
+            ignore_conflicts=ignore_conflicts,
+        )
+        # ignore_conflicts 时无法取得主键，统一按日期回查本次生成的预约，
+        # 同时读取建立搜索索引所需的用户名和自习室名称
+        occurrences = list(
+            series.occurrences.filter(date__in=dates).values_list('pk', 'date', 'user__username', 'room__name')
+        )
+        BookingHistory.objects.bulk_create([
+            BookingHistory(booking_id=pk, action='创建预约', operator_id=series.user_id, notes='周期预约自动生成')
+            for pk, _, _, _ in occurrences
+        ])
+        deltas = new_deltas()
+        for _, day, _, _ in occurrences:
+            add_booking(deltas, series.user_id, series.room_id, day, 'pending')
+        apply_deltas(deltas)
+        index_documents(BOOKING, [
+            booking_document(pk, username, room_name, series.purpose)
+            for pk, _, username, room_name in occurrences
+        ], created=True)
+        created = len(occurrences)
+    if until >= start:
+        series.materialized_until = until
+        BookingSeries.objects.filter(pk=series.pk).update(materialized_until=until)
+    if dates:
+        refresh_occupancy((series.room_id, day) for day in dates)
+    return created
+
+
+def create_series(series):
+    """创建周期预约，并生成生成窗口内的预约行
+
+    任一日期已被占用时抛出 SlotUnavailable，提示中列出冲突日期。
+    """
+    series.clean()
+    conflicts = series_conflicts(series)
+    if conflicts:
+        raise SlotUnavailable('以下日期该时间段已被预约：' + '、'.join(day.isoformat() for day in conflicts[:10]))
+    try:
+        with transaction.atomic():
+            series.save()
+            _materialize(series, series_horizon(), ignore_conflicts=False)
+            # 生成窗口之后的日期只在占用索引中按规则占用
+            refresh_occupancy(
+                (series.room_id, day)
+                for day in series.occurrence_dates(start=series_horizon() + timedelta(days=1))
+            )
+    except IntegrityError as exc:
+        if _is_slot_conflict(exc):
+            raise SlotUnavailable() from exc
+        raise
+    return series
+
+
+def materialize_series(until=None):
+    """为所有进行中的周期预约生成到 until（默认生成窗口末尾）的预约行
+
+    供每日定时任务调用。已被单次预约占用的日期跳过，返回生成的预约数量。
+    """
+    until = until or series_horizon()
+    pending = BookingSeries.objects.filter(
+        status='active', end_date__gte=timezone.localdate(), start_date__lte=until,
+    ).exclude(materialized_until__gte=until)
+    created = 0
+    for series in pending:
+        with transaction.atomic():
+            created += _materialize(series, until, ignore_conflicts=True)
+    return created
+
+
+def cancel_series(series, operator):
+    """取消周期预约及其今天之后所有有效的预约"""
+    today = timezone.localdate()
+    with transaction.atomic():
+        updated = BookingSeries.objects.filter(pk=series.pk, status='active').update(
+            status='cancelled', updated_at=timezone.now()
+        )
+        if not updated:
+            return False
+        series.status = 'cancelled'
+        occurrences = list(series.occurrences.filter(
+            date__gte=today, status__in=Booking.ACTIVE_STATUSES
+        ).only('id', 'date', 'status'))
+        Booking.objects.filter(pk__in=[b.pk for b in occurrences]).update(
+            status='cancelled', updated_at=timezone.now()
+        )
+        deltas = new_deltas()
+        for booking in occurrences:
+            add_transition(deltas, series.user_id, series.room_id, booking.date, booking.status, 'cancelled')
+        apply_deltas(deltas)
+        BookingHistory.objects.bulk_create([
+            BookingHistory(booking=booking, action='取消预约', operator=operator, notes='取消周期预约')
+            for booking in occurrences
+        ])
+        refresh_occupancy((series.room_id, day) for day in series.occurrence_dates(start=today))
+    return True
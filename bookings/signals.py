@@ -0,0 +1,90 @@
+"""
+预约相关信号处理
+
+保持时间段占用索引和预约统计与预约数据一致。批量写操作（bulk_create/update()）
+不会触发这些信号，需要自行调用 availability.refresh_occupancy 和 stats.apply_deltas。
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from rooms.models import StudyRoom
+from .availability import refresh_occupancy
+from .models import Booking
+from .stats import add_booking, apply_deltas, delete_room_stats, new_deltas, room_day_key
+
+# 影响时间段占用的字段
+OCCUPANCY_FIELDS = ('room_id', 'time_slot_id', 'date', 'status')
+# 影响预约统计的字段
+STATS_FIELDS = ('user_id', 'room_id', 'date', 'status')
+TRACKED_FIELDS = ('user_id', 'room_id', 'time_slot_id', 'date', 'status')
+
+
+def _changed(loaded, instance, fields):
+    return any(loaded.get(field) != getattr(instance, field) for field in fields)
+
+
+def _cascaded_from_room(origin):
+    """删除是否由删除自习室（单个实例或 QuerySet.delete()）级联而来"""
+    return isinstance(origin, StudyRoom) or getattr(origin, 'model', None) is StudyRoom
+
+
+def _known(loaded):
+    return loaded is not None and all(field in loaded for field in TRACKED_FIELDS)
+
+
+@receiver(pre_save, sender=Booking)
+def load_old_values(sender, instance, raw=False, **kwargs):
+    """用 only()/defer() 加载的预约保存前补读旧值，否则无法计算统计的增量"""
+    if raw or instance._state.adding:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if _known(loaded):
+        return
+    old = Booking.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+    if old is not None:
+        instance._loaded_values = {**(loaded or {}), **old}
+
+
+@receiver(post_save, sender=Booking)
+def sync_on_save(sender, instance, created, raw=False, **kwargs):
+    """预约保存后刷新新旧(自习室, 日期)的占用位图并更新统计"""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    # 旧值未知（记录已不存在）时按全部变化处理
+    known = not created and _known(loaded)
+
+    if created or not known or _changed(loaded, instance, OCCUPANCY_FIELDS):
+        keys = {(instance.room_id, instance.date)}
+        if known:
+            keys.add((loaded['room_id'], loaded['date']))
+        refresh_occupancy(keys)
+
+    if created or (known and _changed(loaded, instance, STATS_FIELDS)):
+        deltas = new_deltas()
+        if known:
+            add_booking(deltas, loaded['user_id'], loaded['room_id'], loaded['date'], loaded['status'], -1)
+        add_booking(deltas, instance.user_id, instance.room_id, instance.date, instance.status)
+        apply_deltas(deltas)
+
+    instance._loaded_values = {field: getattr(instance, field) for field in TRACKED_FIELDS}
+
+
+@receiver(post_delete, sender=Booking)
+def sync_on_delete(sender, instance, **kwargs):
+    """预约删除后刷新对应的占用位图并更新统计"""
+    deltas = new_deltas()
+    add_booking(deltas, instance.user_id, instance.room_id, instance.date, instance.status, -1)
+    # 删除自习室级联删除预约时，该自习室的占用行随之级联删除，不能再写回；
+    # 自习室/日期统计由 delete_stats_of_room 整体删除
+    if _cascaded_from_room(kwargs.get('origin')):
+        deltas.pop(room_day_key(instance.room_id, instance.date), None)
+    else:
+        refresh_occupancy([(instance.room_id, instance.date)])
+    apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=StudyRoom)
+def delete_stats_of_room(sender, instance, **kwargs):
+    """自习室删除后删除其各日期的统计行（预约已先于自习室级联删除）"""
+    delete_room_stats(instance.pk)
@@ -0,0 +1,97 @@
+"""
+预约数量统计
+
+BookingStats 按全站、用户、自习室/日期三个维度保存各状态的预约数量。
+写操作把状态变化累积为增量后调用 apply_deltas，无论涉及多少个键都只需
+一次 INSERT OR IGNORE 和一次带 CASE 的 UPDATE。单条 save()/delete() 由
+signals 处理，批量写操作需要自行调用。
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+
+from .models import Booking, BookingStats
+
+STAT_STATUSES = ('pending', 'confirmed', 'cancelled', 'completed')
+GLOBAL_KEY = 'global'
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def room_day_key(room_id, day):
+    return f'{room_prefix(room_id)}{day.isoformat()}'
+
+
+def room_prefix(room_id):
+    return f'room:{room_id}:'
+
+
+def new_deltas():
+    """创建空的增量表 {key: Counter(status -> n)}"""
+    return defaultdict(Counter)
+
+
+def add_booking(deltas, user_id, room_id, day, status, count=1):
+    """将一条预约计入（count 为负时为移出）各统计键"""
+    if status not in STAT_STATUSES:
+        return
+    for key in (GLOBAL_KEY, user_key(user_id), room_day_key(room_id, day)):
+        deltas[key][status] += count
+
+
+def add_transition(deltas, user_id, room_id, day, old_status, new_status, count=1):
+    """将状态转换计入增量表"""
+    add_booking(deltas, user_id, room_id, day, old_status, -count)
+    add_booking(deltas, user_id, room_id, day, new_status, count)
+
+
+def apply_deltas(deltas):
+    """将增量写入统计表，应在写预约的同一事务中调用"""
+    deltas = {
+        key: {status: n for status, n in counter.items() if n}
+        for key, counter in deltas.items()
+    }
+    deltas = {key: counter for key, counter in deltas.items() if counter}
+    if not deltas:
+        return
+    BookingStats.objects.bulk_create(
+        [BookingStats(key=key) for key in deltas], ignore_conflicts=True
+    )
+    updates = {}
+    for status in STAT_STATUSES:
+        whens = [When(key=key, then=Value(counter[status])) for key, counter in deltas.items() if status in counter]
+        if whens:
+            updates[status] = F(status) + Case(*whens, default=Value(0))
+    BookingStats.objects.filter(key__in=deltas).update(updated_at=timezone.now(), **updates)
+
+
+def delete_room_stats(room_id):
+    """删除自习室的全部日期统计"""
+    BookingStats.objects.filter(key__startswith=room_prefix(room_id)).delete()
+
+
+def get_stats(key):
+    """按主键读取统计，不存在时返回全零"""
+    return BookingStats.objects.filter(pk=key).first() or BookingStats(key=key)
+
+
+def rebuild_stats():
+    """根据预约表重建全部统计，返回写入的行数"""
+    deltas = new_deltas()
+    rows = Booking.objects.order_by().values('user_id', 'room_id', 'date', 'status').annotate(n=Count('pk'))
+    for row in rows:
+        add_booking(deltas, row['user_id'], row['room_id'], row['date'], row['status'], row['n'])
+    with transaction.atomic():
+        BookingStats.objects.all().delete()
+        BookingStats.objects.bulk_create(
+            [
+                BookingStats(key=key, **{status: counter[status] for status in STAT_STATUSES})
+                for key, counter in deltas.items()
+            ],
+            batch_size=500,
+        )
+    return len(deltas)
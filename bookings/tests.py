@@ -3,12 +3,19 @@
 """
 from django.test import TestCase, Client
 from django.urls import reverse
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.messages import get_messages
 from datetime import datetime, date, timedelta
+import csv
 import json
 import os
+from unittest import mock
 import sys
 
 # 添加项目根目录到路径
@@ -16,9 +23,18 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from tests.base import BaseTestCase, TestDataFactory, APITestMixin
-from .models import Booking, BookingHistory
+from tests.base import BaseTestCase, TestDataFactory, APITestMixin, QueryPlanMixin
+from .models import Booking, BookingHistory, BookingSeries, BookingStats, JobCheckpoint, RoomOccupancy
+from .stats import GLOBAL_KEY, get_stats, rebuild_stats, room_day_key, user_key
+from .pagination import decode_cursor, encode_cursor
+from .maintenance import complete_past_bookings
 from .views import BookingForm
+from .serializers import BookingSerializer, ValuesProjection
+from rest_framework import serializers
+from rooms.models import StudyRoom
+from search.index import reindex_bookings
+from .availability import get_mask, is_slot_free, rebuild_occupancy, series_horizon
+from .services import SlotUnavailable, _is_slot_conflict, admit_booking, cancel_series, create_series, materialize_series
 
 
 class BookingModelTest(BaseTestCase):
@@ -553,3 +569,1246 @@ class BookingAPITest(BaseTestCase, APITestMixin):
         if response.status_code == 201:
             data = self.assert_api_success(response, 201)
             self.assertIsNotNone(data)
+
+
+class AvailabilityIndexTest(BaseTestCase, APITestMixin):
+    """时间段占用索引测试"""
+    
+    def test_booking_write_updates_mask(self):
+        """测试预约创建和取消同步更新占用位图"""
+        booking = self.create_test_booking(status='pending')
+        mask = get_mask(self.room1.pk, booking.date)
+        self.assertFalse(is_slot_free(mask, self.slot_morning.pk))
+        self.assertTrue(is_slot_free(mask, self.slot_afternoon.pk))
+        
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertTrue(is_slot_free(get_mask(self.room1.pk, booking.date), self.slot_morning.pk))
+    
+    def test_get_mask_single_query(self):
+        """测试可用性检查只需一次查询"""
+        booking = self.create_test_booking()
+        with self.assertNumQueries(1):
+            get_mask(self.room1.pk, booking.date)
+    
+    def test_rebuild_occupancy(self):
+        """测试预建未来若干天的占用索引"""
+        booking = self.create_test_booking(status='confirmed')
+        RoomOccupancy.objects.all().delete()
+        
+        count = rebuild_occupancy(days=7)
+        
+        # 两个活跃自习室 × 7 天
+        self.assertEqual(count, 14)
+        self.assertEqual(RoomOccupancy.objects.count(), 14)
+        self.assertFalse(is_slot_free(get_mask(self.room1.pk, booking.date), self.slot_morning.pk))
+    
+    def test_available_slots_api_uses_index(self):
+        """测试可用时间段API排除已预约时间段"""
+        booking = self.create_test_booking(status='confirmed')
+        self.login_student()
+        
+        response = self.api_get(f'/api/available-slots/{self.room1.pk}/{booking.date}/')
+        data = self.assert_api_success(response)
+        
+        slot_ids = [slot['id'] for slot in data['available_slots']]
+        self.assertNotIn(self.slot_morning.pk, slot_ids)
+        self.assertIn(self.slot_afternoon.pk, slot_ids)
+    
+    def test_available_slots_api_past_date(self):
+        """测试过去日期的占用行被清理后，可用时间段API仍按预约排除已预约时间段"""
+        booking = self.create_test_booking(status='confirmed')
+        past = timezone.localdate() - timedelta(days=1)
+        Booking.objects.filter(pk=booking.pk).update(date=past)
+        rebuild_occupancy(days=1)
+        self.assertFalse(RoomOccupancy.objects.filter(date=past).exists())
+        self.login_student()
+        
+        response = self.api_get(f'/api/available-slots/{self.room1.pk}/{past}/')
+        data = self.assert_api_success(response)
+        
+        slot_ids = [slot['id'] for slot in data['available_slots']]
+        self.assertNotIn(self.slot_morning.pk, slot_ids)
+        self.assertIn(self.slot_afternoon.pk, slot_ids)
+        self.assertNotIn('ETag', response)
+    
+    def test_room_detail_marks_booked_slots(self):
+        """测试自习室详情页标注已预约时间段"""
+        booking = self.create_test_booking(status='confirmed')
+        self.login_student()
+        
+        response = self.client.get(
+            reverse('rooms:room_detail', kwargs={'pk': self.room1.pk}),
+            {'date': booking.date.strftime('%Y-%m-%d')}
+        )
+        
+        slots = {slot.pk: slot.is_available for slot in response.context['time_slots']}
+        self.assertFalse(slots[self.slot_morning.pk])
+        self.assertTrue(slots[self.slot_afternoon.pk])
+
+    
+    def test_delete_room_with_bookings(self):
+        """测试删除有有效预约的自习室时级联删除预约，不为已删除的自习室写入占用行"""
+        booking = self.create_test_booking(status='confirmed')
+        self.create_test_booking(time_slot=self.slot_afternoon, status='pending')
+        
+        self.room1.delete()
+        
+        self.assertFalse(Booking.objects.filter(room_id=booking.room_id).exists())
+        self.assertFalse(RoomOccupancy.objects.filter(room_id=booking.room_id).exists())
+        
+        # 管理后台的批量删除通过 QuerySet.delete()
+        self.create_test_booking(room=self.room2, status='confirmed')
+        StudyRoom.objects.filter(pk=self.room2.pk).delete()
+        self.assertFalse(RoomOccupancy.objects.filter(room_id=self.room2.pk).exists())
+
+
+class AvailabilityGridAPITest(BaseTestCase, APITestMixin):
+    """可用性矩阵API测试"""
+    
+    def test_grid_encodes_booked_slots(self):
+        """测试矩阵按时间段位串返回占用情况"""
+        booking = self.create_test_booking(time_slot=self.slot_afternoon, status='confirmed')
+        self.create_test_booking(room=self.room2, status='cancelled')
+        self.login_student()
+        
+        response = self.api_get('/api/availability-grid/', {
+            'start': booking.date.strftime('%Y-%m-%d'),
+            'end': (booking.date + timedelta(days=1)).strftime('%Y-%m-%d'),
+        })
+        data = self.assert_api_success(response)
+        
+        # 时间段按开始时间排序：上午、下午、晚上
+        self.assertEqual([slot['id'] for slot in data['slots']],
+                         [self.slot_morning.pk, self.slot_afternoon.pk, self.slot_evening.pk])
+        rooms = {room['id']: room['days'] for room in data['rooms']}
+        self.assertEqual(rooms[self.room1.pk], ['010', '000'])
+        # 已取消的预约不占用时间段
+        self.assertEqual(rooms[self.room2.pk], ['000', '000'])
+        self.assertNotIn(self.room3.pk, rooms)
+    
+    def test_grid_query_count_independent_of_rooms(self):
+        """测试查询次数不随自习室数量增长"""
+        self.login_student()
+        url = '/api/availability-grid/'
+        self.api_get(url)
+        # 自习室和时间段读取目录缓存，只比对一次版本号；ETag 另需一次占用索引聚合，
+        # 尚未生成预约行的周期预约另需一次查询
+        with self.assertNumQueries(6):
+            self.api_get(url)
+        for i in range(10):
+            TestDataFactory.create_room(f'矩阵测试室{i}')
+        self.api_get(url)
+        with self.assertNumQueries(6):
+            response = self.api_get(url, {'rooms': ','.join(str(pk) for pk in range(1, 20))})
+        self.assertEqual(response.status_code, 200)
+    
+    def test_grid_invalid_range(self):
+        """测试无效日期范围"""
+        self.login_student()
+        response = self.api_get('/api/availability-grid/', {'start': '2025-01-10', 'end': '2025-01-01'})
+        self.assert_api_error(response, 400)
+        response = self.api_get('/api/availability-grid/', {'start': 'invalid'})
+        self.assert_api_error(response, 400)
+
+
+class BookingAdmissionTest(BaseTestCase, APITestMixin):
+    """预约准入测试"""
+    
+    def build_booking(self, user, **kwargs):
+        defaults = {
+            'room': self.room1,
+            'time_slot': self.slot_morning,
+            'date': timezone.now().date() + timedelta(days=1),
+            'participants': 1,
+        }
+        defaults.update(kwargs)
+        return Booking(user=user, **defaults)
+    
+    def test_admit_conflict_raises_slot_unavailable(self):
+        """测试时间段冲突抛出SlotUnavailable"""
+        admit_booking(self.build_booking(self.student_user))
+        with self.assertRaises(SlotUnavailable):
+            admit_booking(self.build_booking(self.teacher_user))
+        self.assertEqual(Booking.objects.count(), 1)
+    
+    def test_other_integrity_errors_not_reported_as_conflict(self):
+        """测试其他唯一约束的冲突不会被当作时间段已被预约"""
+        unrelated = IntegrityError('UNIQUE constraint failed: bookings_bookinghistory.id')
+        with mock.patch.object(BookingHistory.objects, 'create', side_effect=unrelated):
+            with self.assertRaises(IntegrityError):
+                admit_booking(self.build_booking(self.student_user), operator=self.student_user)
+        self.assertFalse(Booking.objects.exists())
+        self.assertTrue(_is_slot_conflict(IntegrityError(
+            'UNIQUE constraint failed: bookings_booking.room_id, bookings_booking.time_slot_id, bookings_booking.date'
+        )))
+        self.assertTrue(_is_slot_conflict(IntegrityError(
+            'duplicate key value violates unique constraint "unique_active_booking_slot"'
+        )))
+        self.assertFalse(_is_slot_conflict(IntegrityError("Duplicate entry 'x' for key 'username'")))
+    
+    def test_cancelled_booking_releases_slot(self):
+        """测试已取消的预约不再占用时间段"""
+        booking = self.create_test_booking(status='cancelled')
+        self.login_teacher()
+        
+        response = self.client.post(reverse('bookings:booking_create', kwargs={'room_id': self.room1.pk}), {
+            'time_slot': self.slot_morning.pk,
+            'date': booking.date.strftime('%Y-%m-%d'),
+            'purpose': '重新预约',
+            'participants': 1
+        })
+        
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Booking.objects.filter(
+            user=self.teacher_user, date=booking.date, status='pending'
+        ).exists())
+    
+    def test_api_conflict_returns_409(self):
+        """测试API创建冲突预约返回409"""
+        booking = self.create_test_booking(status='confirmed')
+        self.login_teacher()
+        
+        response = self.api_post('/api/bookings/', {
+            'room_id': self.room1.pk,
+            'time_slot_id': self.slot_morning.pk,
+            'date': booking.date.strftime('%Y-%m-%d'),
+            'participants': 1
+        })
+        
+        self.assert_api_error(response, 409)
+        self.assertEqual(Booking.objects.count(), 1)
+    
+    def test_api_create_success(self):
+        """测试API成功创建预约"""
+        self.login_student()
+        response = self.api_post('/api/bookings/', {
+            'room_id': self.room1.pk,
+            'time_slot_id': self.slot_morning.pk,
+            'date': (timezone.now().date() + timedelta(days=1)).strftime('%Y-%m-%d'),
+            'participants': 1
+        })
+        data = self.assert_api_success(response, 201)
+        self.assertEqual(data['room']['id'], self.room1.pk)
+
+
+class BookingWriteQueryCountTest(BaseTestCase, APITestMixin):
+    """预约写操作查询次数测试
+
+    查询次数包含会话和用户加载(2次)以及事务保存点(2次)，
+    数字变大说明写路径出现了多余查询。
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.booking_date = (timezone.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self.create_url = reverse('bookings:booking_create', kwargs={'room_id': self.room1.pk})
+    
+    def test_create_page_queries(self):
+        """测试预约页面: 目录缓存为空时加载自习室和时间段，之后只比对目录版本号"""
+        self.login_student()
+        with self.assertNumQueries(6):
+            response = self.client.get(self.create_url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(4):
+            self.client.get(self.create_url)
+    
+    def test_create_booking_queries(self):
+        """测试网页创建预约的查询次数（含写入搜索索引一次、准入检查和刷新占用索引各读取一次周期预约，
+        自习室和时间段读取目录缓存）"""
+        self.login_student()
+        self.client.get(self.create_url)
+        with self.assertNumQueries(15):
+            response = self.client.post(self.create_url, {
+                'time_slot': self.slot_morning.pk,
+                'date': self.booking_date,
+                'purpose': '查询预算',
+                'participants': 1
+            })
+        self.assertEqual(response.status_code, 302)
+    
+    def test_api_create_booking_queries(self):
+        """测试API创建预约的查询次数（含写入搜索索引一次、准入检查和刷新占用索引各读取一次周期预约）"""
+        self.login_student()
+        with self.assertNumQueries(14):
+            response = self.api_post('/api/bookings/', {
+                'room_id': self.room1.pk,
+                'time_slot_id': self.slot_morning.pk,
+                'date': self.booking_date,
+                'participants': 1
+            })
+        self.assertEqual(response.status_code, 201)
+    
+    def test_cancel_booking_queries(self):
+        """测试取消预约的查询次数（刷新占用索引时读取一次周期预约）"""
+        booking = self.create_test_booking(status='pending')
+        self.login_student()
+        with self.assertNumQueries(12):
+            self.client.post(reverse('bookings:booking_cancel', kwargs={'pk': booking.pk}))
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+    
+    def test_approve_booking_queries(self):
+        """测试审批预约的查询次数（不影响占用索引）"""
+        booking = self.create_test_booking(status='pending')
+        self.login_admin()
+        with self.assertNumQueries(9):
+            self.client.post(reverse('bookings:booking_approve', kwargs={'pk': booking.pk}), {'action': 'approve'})
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'confirmed')
+
+
+class BookingBatchAPITest(BaseTestCase, APITestMixin):
+    """批量预约API测试"""
+    
+    url = '/api/bookings/batch/'
+    
+    def day(self, offset):
+        return (timezone.now().date() + timedelta(days=offset)).strftime('%Y-%m-%d')
+    
+    def create_op(self, offset, time_slot=None, room=None):
+        return {
+            'op': 'create',
+            'room_id': (room or self.room1).pk,
+            'time_slot_id': (time_slot or self.slot_morning).pk,
+            'date': self.day(offset),
+        }
+    
+    def test_atomic_batch_success(self):
+        """测试原子模式全部成功"""
+        existing = self.create_test_booking(user=self.student_user, time_slot=self.slot_evening)
+        self.login_student()
+        
+        response = self.api_post(self.url, {
+            'operations': [self.create_op(1), self.create_op(2), {'op': 'cancel', 'id': existing.pk}]
+        })
+        data = self.assert_api_success(response)
+        
+        self.assertEqual((data['created'], data['cancelled'], data['failed']), (2, 1, 0))
+        existing.refresh_from_db()
+        self.assertEqual(existing.status, 'cancelled')
+        self.assertEqual(BookingHistory.objects.filter(operator=self.student_user).count(), 3)
+        self.assertFalse(is_slot_free(get_mask(self.room1.pk, timezone.now().date() + timedelta(days=2)),
+                                      self.slot_morning.pk))
+    
+    def test_atomic_batch_conflict_writes_nothing(self):
+        """测试原子模式存在冲突时全部不执行"""
+        self.create_test_booking(user=self.teacher_user, status='confirmed')
+        self.login_student()
+        
+        response = self.api_post(self.url, {'operations': [self.create_op(2), self.create_op(1)]})
+        
+        self.assert_api_error(response, 400)
+        data = response.json()
+        self.assertEqual(data['results'][0]['status'], 'skipped')
+        self.assertEqual(data['results'][1]['code'], 'slot_taken')
+        self.assertFalse(Booking.objects.filter(user=self.student_user).exists())
+    
+    def test_best_effort_batch(self):
+        """测试尽力模式写入可成功的操作"""
+        self.login_student()
+        
+        response = self.api_post(self.url, {
+            'mode': 'best_effort',
+            'operations': [self.create_op(1), self.create_op(1), {'op': 'cancel'}, self.create_op(1, room=self.room3)]
+        })
+        data = self.assert_api_success(response)
+        
+        self.assertEqual([result['status'] for result in data['results']],
+                         ['created', 'error', 'error', 'error'])
+        self.assertEqual(data['results'][1]['code'], 'slot_taken')
+        self.assertEqual(Booking.objects.filter(user=self.student_user).count(), 1)
+    
+    def test_batch_query_count_independent_of_size(self):
+        """测试批量操作的查询次数不随操作数量增长"""
+        self.login_student()
+        self.api_post(self.url, {'operations': [self.create_op(30)]})
+        # 两个批次都包含周期预约生成窗口之后的日期，冲突检测和刷新索引各多一次周期预约查询；
+        # 新预约的搜索索引一次写入
+        with self.assertNumQueries(16):
+            self.api_post(self.url, {'operations': [self.create_op(i) for i in (1, 2, 20)]})
+        with self.assertNumQueries(16):
+            self.api_post(self.url, {'operations': [self.create_op(i) for i in range(4, 24) if i != 20]})
+        self.assertEqual(Booking.objects.filter(user=self.student_user).count(), 23)
+
+
+class BookingSeriesTest(BaseTestCase, APITestMixin):
+    """周期预约测试"""
+    
+    def build_series(self, user=None, weeks=8, **kwargs):
+        start = timezone.now().date() + timedelta(days=1)
+        defaults = {
+            'user': user or self.teacher_user,
+            'room': self.room1,
+            'time_slot': self.slot_morning,
+            'start_date': start,
+            'end_date': start + timedelta(weeks=weeks - 1),
+            'participants': 5,
+        }
+        defaults.update(kwargs)
+        return BookingSeries(**defaults)
+    
+    def test_occurrence_dates(self):
+        """测试按规则计算预约日期"""
+        series = self.build_series(weeks=5, interval_weeks=2)
+        dates = list(series.occurrence_dates())
+        self.assertEqual(len(dates), 3)
+        self.assertEqual(series.occurrence_count, 3)
+        self.assertEqual(dates[1] - dates[0], timedelta(weeks=2))
+        self.assertTrue(series.occurs_on(dates[2]))
+        self.assertFalse(series.occurs_on(dates[0] + timedelta(days=7)))
+        self.assertEqual(list(series.occurrence_dates(start=dates[0] + timedelta(days=1))), dates[1:])
+    
+    def test_create_materializes_within_horizon(self):
+        """测试只生成窗口内的预约行，窗口之后按规则占用"""
+        series = create_series(self.build_series(weeks=8))
+        
+        horizon = timezone.localdate() + timedelta(days=settings.BOOKING_SERIES_HORIZON_DAYS)
+        occurrences = series.occurrences.all()
+        self.assertEqual(occurrences.count(), len([d for d in series.occurrence_dates() if d <= horizon]))
+        self.assertEqual(BookingHistory.objects.filter(booking__series=series).count(), occurrences.count())
+        last = list(series.occurrence_dates())[-1]
+        self.assertFalse(occurrences.filter(date=last).exists())
+        self.assertFalse(is_slot_free(get_mask(self.room1.pk, last), self.slot_morning.pk))
+    
+    def test_single_booking_respects_series_claim(self):
+        """测试单次预约不能占用周期预约尚未生成的日期"""
+        series = create_series(self.build_series(weeks=8))
+        last = list(series.occurrence_dates())[-1]
+        
+        with self.assertRaises(SlotUnavailable):
+            admit_booking(Booking(
+                user=self.student_user, room=self.room1, time_slot=self.slot_morning, date=last, participants=1
+            ))
+        admit_booking(Booking(
+            user=self.student_user, room=self.room1, time_slot=self.slot_afternoon, date=last, participants=1
+        ))
+    
+    def test_claim_survives_day_rollover(self):
+        """测试日切后、定时任务生成预约行之前，刚进入窗口的日期仍由周期占用"""
+        series = create_series(self.build_series(weeks=8))
+        day = next(d for d in series.occurrence_dates() if d > series.materialized_until)
+        # 时钟前进到该日期进入生成窗口，期间没有运行 materialize_series
+        later = timezone.localdate() + timedelta(weeks=1)
+        
+        with mock.patch('django.utils.timezone.localdate', return_value=later):
+            self.assertLessEqual(day, series_horizon())
+            # 同一天其他时间段的预约会刷新该日的占用位图
+            admit_booking(Booking(
+                user=self.student_user, room=self.room1, time_slot=self.slot_afternoon, date=day, participants=1
+            ))
+            self.assertFalse(is_slot_free(get_mask(self.room1.pk, day), self.slot_morning.pk))
+            with self.assertRaises(SlotUnavailable):
+                admit_booking(Booking(
+                    user=self.student_user, room=self.room1, time_slot=self.slot_morning, date=day, participants=1
+                ))
+            
+            materialize_series()
+            self.assertTrue(series.occurrences.filter(date=day, status__in=Booking.ACTIVE_STATUSES).exists())
+    
+    def test_series_conflict_rejected(self):
+        """测试任一日期冲突时整个周期不创建"""
+        series = self.build_series(weeks=8)
+        dates = list(series.occurrence_dates())
+        self.create_test_booking(booking_date=dates[2], status='confirmed')
+        create_series(self.build_series(user=self.admin_user, weeks=8, start_date=dates[3]))
+        
+        with self.assertRaises(SlotUnavailable) as ctx:
+            create_series(series)
+        self.assertIn(dates[2].isoformat(), ctx.exception.message)
+        self.assertIn(dates[-1].isoformat(), ctx.exception.message)
+        self.assertEqual(BookingSeries.objects.count(), 1)
+    
+    def test_materialize_extends_horizon(self):
+        """测试定时任务按窗口生成并跳过已被占用的日期"""
+        series = create_series(self.build_series(weeks=8))
+        dates = list(series.occurrence_dates())
+        created_before = series.occurrences.count()
+        
+        until = dates[-1]
+        self.assertEqual(materialize_series(until=until), len(dates) - created_before)
+        self.assertEqual(materialize_series(until=until), 0)
+        series.refresh_from_db()
+        self.assertEqual(series.materialized_until, until)
+        self.assertEqual(series.occurrences.count(), len(dates))
+    
+    def test_cancel_series(self):
+        """测试取消周期预约释放所有日期"""
+        series = create_series(self.build_series(weeks=8))
+        last = list(series.occurrence_dates())[-1]
+        first = series.occurrences.first()
+        
+        self.assertTrue(cancel_series(series, operator=self.teacher_user))
+        self.assertFalse(series.occurrences.filter(status__in=Booking.ACTIVE_STATUSES).exists())
+        self.assertTrue(is_slot_free(get_mask(self.room1.pk, last), self.slot_morning.pk))
+        self.assertTrue(is_slot_free(get_mask(self.room1.pk, first.date), self.slot_morning.pk))
+        self.assertFalse(cancel_series(series, operator=self.teacher_user))
+    
+    def test_series_create_view(self):
+        """测试教师通过页面创建周期预约"""
+        self.login_teacher()
+        start = timezone.now().date() + timedelta(days=1)
+        url = reverse('bookings:series_create', kwargs={'room_id': self.room1.pk})
+        response = self.client.post(url, {
+            'time_slot': self.slot_evening.pk,
+            'start_date': start.strftime('%Y-%m-%d'),
+            'end_date': (start + timedelta(weeks=15)).strftime('%Y-%m-%d'),
+            'interval_weeks': 1,
+            'purpose': '每周答疑',
+            'participants': 10,
+        })
+        self.assertEqual(response.status_code, 302)
+        series = BookingSeries.objects.get(user=self.teacher_user)
+        self.assertEqual(series.occurrence_count, 16)
+        
+        response = self.client.get(reverse('bookings:booking_list'))
+        self.assertContains(response, '共 16 次')
+    
+    def test_students_cannot_create_series(self):
+        """测试学生无法创建周期预约"""
+        self.login_student()
+        response = self.client.get(reverse('bookings:series_create', kwargs={'room_id': self.room1.pk}))
+        self.assertEqual(response.status_code, 403)
+
+
+class BookingBatchApproveTest(BaseTestCase):
+    """批量审批测试"""
+    
+    def create_pending(self, count, start=1):
+        return [
+            self.create_test_booking(
+                booking_date=timezone.now().date() + timedelta(days=offset), status='pending'
+            )
+            for offset in range(start, start + count)
+        ]
+    
+    def test_batch_approve(self):
+        """测试批量审批通过并跳过非待审核预约"""
+        bookings = self.create_pending(3)
+        confirmed = self.create_test_booking(room=self.room2, status='confirmed')
+        
+        self.login_admin()
+        response = self.client.post(reverse('bookings:booking_batch_approve'), {
+            'action': 'approve',
+            'booking_ids': [b.pk for b in bookings] + [confirmed.pk],
+        })
+        
+        self.assertRedirects(response, reverse('bookings:admin_booking_list'), fetch_redirect_response=False)
+        self.assertEqual(Booking.objects.filter(status='confirmed').count(), 4)
+        self.assertEqual(BookingHistory.objects.filter(action='审批通过').count(), 3)
+        self.assertFalse(BookingHistory.objects.filter(booking=confirmed).exists())
+    
+    def test_batch_reject_releases_slots(self):
+        """测试批量拒绝释放时间段"""
+        bookings = self.create_pending(2)
+        
+        self.login_admin()
+        self.client.post(reverse('bookings:booking_batch_approve'), {
+            'action': 'reject',
+            'booking_ids': [b.pk for b in bookings],
+        })
+        
+        self.assertEqual(Booking.objects.filter(status='cancelled').count(), 2)
+        for booking in bookings:
+            self.assertTrue(is_slot_free(get_mask(booking.room_id, booking.date), booking.time_slot_id))
+    
+    def test_batch_query_count_independent_of_size(self):
+        """测试批量审批的查询次数不随预约数量增长"""
+        self.login_admin()
+        url = reverse('bookings:booking_batch_approve')
+        small, large = self.create_pending(2), self.create_pending(10, start=3)
+        with self.assertNumQueries(12):
+            self.client.post(url, {'action': 'reject', 'booking_ids': [b.pk for b in small]})
+        with self.assertNumQueries(12):
+            self.client.post(url, {'action': 'reject', 'booking_ids': [b.pk for b in large]})
+    
+    def test_batch_requires_admin(self):
+        """测试普通用户无法批量审批"""
+        booking = self.create_test_booking(status='pending')
+        self.login_student()
+        response = self.client.post(reverse('bookings:booking_batch_approve'), {
+            'action': 'approve', 'booking_ids': [booking.pk],
+        })
+        self.assertEqual(response.status_code, 403)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'pending')
+    
+    def test_admin_action(self):
+        """测试后台批量审批动作"""
+        bookings = self.create_pending(3)
+        self.client.login(username='superuser', password='testpass123')
+        response = self.client.post('/admin/bookings/booking/', {
+            'action': 'approve_selected',
+            '_selected_action': [b.pk for b in bookings],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.filter(status='confirmed').count(), 3)
+        self.assertEqual(BookingHistory.objects.filter(action='审批通过', operator=self.superuser).count(), 3)
+    
+    def test_admin_action_requires_admin(self):
+        """测试非管理员的后台用户没有批量审批动作"""
+        booking = self.create_test_booking(user=self.teacher_user, status='pending')
+        self.teacher_user.is_staff = True
+        self.teacher_user.save()
+        self.login_teacher()
+        response = self.client.get('/admin/bookings/booking/')
+        self.assertEqual(response.status_code, 200)
+        actions = dict(response.context['action_form'].fields['action'].choices)
+        self.assertNotIn('approve_selected', actions)
+        self.assertNotIn('reject_selected', actions)
+        # 伪造的请求不会改变预约状态
+        self.client.post('/admin/bookings/booking/', {
+            'action': 'approve_selected',
+            '_selected_action': [booking.pk],
+        })
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'pending')
+        self.assertFalse(BookingHistory.objects.filter(booking=booking).exists())
+
+
+class CompletePastBookingsTest(BaseTestCase):
+    """已结束预约自动完成测试"""
+    
+    def create_past(self, days_ago, status='confirmed', slot=None):
+        booking = self.create_test_booking(
+            time_slot=slot or self.slot_morning,
+            booking_date=timezone.now().date() + timedelta(days=days_ago + 30),
+            status=status,
+        )
+        Booking.objects.filter(pk=booking.pk).update(date=timezone.localdate() - timedelta(days=days_ago))
+        return booking
+    
+    def test_completes_only_ended_confirmed_bookings(self):
+        """测试只完成已结束的已确认预约"""
+        past = [self.create_past(days) for days in (1, 2, 3)]
+        pending = self.create_past(4, status='pending')
+        future = self.create_test_booking(status='confirmed')
+        
+        self.assertEqual(complete_past_bookings(), 3)
+        
+        self.assertEqual(Booking.objects.filter(pk__in=[b.pk for b in past], status='completed').count(), 3)
+        self.assertEqual(Booking.objects.get(pk=pending.pk).status, 'pending')
+        self.assertEqual(Booking.objects.get(pk=future.pk).status, 'confirmed')
+        self.assertEqual(BookingHistory.objects.filter(action='完成预约').count(), 3)
+    
+    def test_today_uses_slot_end_time(self):
+        """测试今天的预约按时间段结束时间判断"""
+        morning = self.create_past(0, slot=self.slot_morning)
+        evening = self.create_past(0, slot=self.slot_evening)
+        noon = timezone.localtime().replace(hour=13, minute=0)
+        
+        complete_past_bookings(now=noon)
+        
+        self.assertEqual(Booking.objects.get(pk=morning.pk).status, 'completed')
+        self.assertEqual(Booking.objects.get(pk=evening.pk).status, 'confirmed')
+    
+    def test_resumes_from_checkpoint(self):
+        """测试分批执行中断后从断点继续"""
+        for days in range(1, 6):
+            self.create_past(days)
+        
+        self.assertEqual(complete_past_bookings(batch_size=2, max_batches=1), 2)
+        checkpoint = JobCheckpoint.objects.get(name='complete_past_bookings')
+        self.assertEqual(checkpoint.processed, 2)
+        self.assertIsNotNone(checkpoint.last_date)
+        
+        self.assertEqual(complete_past_bookings(batch_size=2), 3)
+        checkpoint.refresh_from_db()
+        self.assertIsNone(checkpoint.last_date)
+        self.assertIsNotNone(checkpoint.finished_at)
+        self.assertFalse(Booking.objects.filter(status='confirmed').exists())
+    
+    def test_concurrent_cancel_not_counted(self):
+        """测试读取之后、更新之前被并发取消的预约不写历史、不计入统计"""
+        completed = self.create_past(1)
+        raced = self.create_past(2, slot=self.slot_afternoon)
+        
+        def cancel_before_update(execute, sql, params, many, context):
+            if not cancelled and sql.startswith('UPDATE "bookings_booking"'):
+                cancelled.append(raced.pk)
+                Booking.objects.filter(pk=raced.pk).update(status='cancelled')
+            return execute(sql, params, many, context)
+        
+        cancelled = []
+        with connection.execute_wrapper(cancel_before_update):
+            self.assertEqual(complete_past_bookings(), 1)
+        
+        self.assertEqual(cancelled, [raced.pk])
+        self.assertEqual(Booking.objects.get(pk=raced.pk).status, 'cancelled')
+        self.assertEqual(Booking.objects.get(pk=completed.pk).status, 'completed')
+        self.assertEqual(
+            list(BookingHistory.objects.filter(action='完成预约').values_list('booking_id', flat=True)), [completed.pk]
+        )
+        self.assertEqual(get_stats(GLOBAL_KEY).completed, 1)
+        raced_day = timezone.localdate() - timedelta(days=2)
+        self.assertEqual(get_stats(room_day_key(self.room1.pk, raced_day)).completed, 0)
+    
+    def test_batch_query_count_independent_of_size(self):
+        """测试每批的查询次数不随批大小增长"""
+        complete_past_bookings()
+        for days in range(1, 4):
+            self.create_past(days)
+        with self.assertNumQueries(14):
+            complete_past_bookings(batch_size=500)
+        for days in range(1, 9):
+            self.create_past(days, slot=self.slot_afternoon)
+        with self.assertNumQueries(14):
+            complete_past_bookings(batch_size=500)
+
+
+class HotQueryPlanTest(BaseTestCase, QueryPlanMixin):
+    """热点查询的执行计划测试"""
+    
+    def test_user_booking_list(self):
+        """测试我的预约列表按用户索引查询并免排序"""
+        queryset = Booking.objects.filter(user=self.student_user).order_by('-created_at')
+        self.assert_uses_index(queryset[:10], 'booking_user_created_idx')
+        self.assert_uses_index(queryset.filter(status='pending'), 'booking_user_created_idx')
+    
+    def test_admin_booking_list(self):
+        """测试管理员列表按状态或创建时间索引查询"""
+        self.assert_uses_index(
+            Booking.objects.filter(status='pending').order_by('-created_at')[:20], 'booking_status_created_idx'
+        )
+        self.assert_uses_index(Booking.objects.order_by('-created_at')[:20], 'booking_created_idx')
+    
+    def test_availability_queries(self):
+        """测试占用索引刷新和可用性矩阵按(自习室, 日期, 状态)索引查询"""
+        today = timezone.localdate()
+        refresh = Booking.objects.filter(
+            room_id__in=[self.room1.pk, self.room2.pk], date__in=[today], status__in=Booking.ACTIVE_STATUSES
+        ).order_by()
+        grid = Booking.objects.filter(
+            room_id__in=[self.room1.pk], date__range=(today, today + timedelta(days=6)),
+            status__in=Booking.ACTIVE_STATUSES,
+        ).order_by()
+        self.assert_uses_index(refresh, 'booking_room_date_status_idx')
+        self.assert_uses_index(grid, 'booking_room_date_status_idx')
+        self.assert_uses_index(
+            RoomOccupancy.objects.filter(room_id=self.room1.pk, date=today), 'bookings_roomoccupancy_room_id_date'
+        )
+    
+    def test_completion_batch(self):
+        """测试自动完成任务按(状态, 日期)键集分页"""
+        today = timezone.localdate()
+        queryset = Booking.objects.filter(
+            Q(date__lt=today) | Q(date=today, time_slot_id__in=[self.slot_morning.pk]), status='confirmed'
+        ).filter(Q(date__gt=today - timedelta(days=3)) | Q(date=today - timedelta(days=3), pk__gt=10))
+        self.assert_uses_index(queryset.order_by('date', 'pk')[:500], 'booking_status_date_idx')
+    
+    def test_series_claims(self):
+        """测试周期预约占用查询使用进行中周期的部分索引"""
+        today = timezone.localdate()
+        queryset = BookingSeries.objects.filter(
+            room_id__in=[self.room1.pk], status='active', start_date__lte=today, end_date__gte=today
+        ).order_by()
+        self.assert_uses_index(queryset, 'series_active_room_end_idx')
+    
+    def test_booking_history(self):
+        """测试预约历史按预约索引查询并免排序"""
+        queryset = BookingHistory.objects.filter(booking_id=1).order_by('-created_at')
+        self.assert_uses_index(queryset, 'history_booking_created_idx')
+
+
+class BookingStatsTest(BaseTestCase, APITestMixin):
+    """预约统计测试"""
+    
+    def assert_stats(self, key, **expected):
+        stats = get_stats(key)
+        for status, value in expected.items():
+            self.assertEqual(getattr(stats, status), value, f'{key}.{status}')
+    
+    def assert_matches_rebuild(self):
+        incremental = {
+            row.key: (row.pending, row.confirmed, row.cancelled, row.completed)
+            for row in BookingStats.objects.all() if row.total
+        }
+        rebuild_stats()
+        rebuilt = {
+            row.key: (row.pending, row.confirmed, row.cancelled, row.completed)
+            for row in BookingStats.objects.all()
+        }
+        self.assertEqual(incremental, rebuilt)
+    
+    def test_incremental_updates(self):
+        """测试创建、取消、审批和删除时增量更新统计"""
+        booking = self.create_test_booking(status='pending')
+        self.assert_stats(GLOBAL_KEY, pending=1, total=1)
+        self.assert_stats(user_key(self.student_user.pk), pending=1)
+        self.assert_stats(room_day_key(self.room1.pk, booking.date), pending=1)
+        
+        other = self.create_test_booking(time_slot=self.slot_afternoon, status='pending')
+        self.login_admin()
+        self.client.post(reverse('bookings:booking_batch_approve'), {
+            'action': 'approve', 'booking_ids': [booking.pk, other.pk],
+        })
+        self.assert_stats(GLOBAL_KEY, pending=0, confirmed=2)
+        
+        self.login_student()
+        self.client.get(reverse('bookings:booking_cancel', kwargs={'pk': booking.pk}))
+        self.assert_stats(user_key(self.student_user.pk), confirmed=1, cancelled=1, total=2)
+        
+        Booking.objects.get(pk=other.pk).delete()
+        self.assert_stats(GLOBAL_KEY, confirmed=0, cancelled=1, total=1)
+        self.assert_matches_rebuild()
+    
+    def test_bulk_paths_match_rebuild(self):
+        """测试批量写操作后的增量统计与重建结果一致"""
+        self.login_student()
+        tomorrow = timezone.now().date() + timedelta(days=1)
+        response = self.api_post('/api/bookings/batch/', {'operations': [
+            {'op': 'create', 'room_id': self.room1.pk, 'time_slot_id': slot.pk,
+             'date': tomorrow.strftime('%Y-%m-%d'), 'participants': 1}
+            for slot in (self.slot_morning, self.slot_afternoon)
+        ]})
+        created = [result['id'] for result in response.json()['results']]
+        self.api_post('/api/bookings/batch/', {'operations': [{'op': 'cancel', 'id': created[0]}]})
+        
+        series = create_series(BookingSeries(
+            user=self.teacher_user, room=self.room2, time_slot=self.slot_evening,
+            start_date=tomorrow, end_date=tomorrow + timedelta(weeks=3), participants=2,
+        ))
+        cancel_series(series, operator=self.teacher_user)
+        
+        Booking.objects.filter(pk=created[1]).update(status='confirmed')
+        rebuild_stats()
+        Booking.objects.filter(pk=created[1]).update(date=timezone.localdate() - timedelta(days=1))
+        rebuild_stats()
+        complete_past_bookings()
+        self.assert_stats(user_key(self.student_user.pk), completed=1, cancelled=1)
+        self.assert_matches_rebuild()
+    
+    def test_deferred_instance_updates_stats(self):
+        """测试用 only()/defer() 加载的预约修改状态后统计仍正确"""
+        booking = self.create_test_booking(status='pending')
+        partial = Booking.objects.only('id', 'status').get(pk=booking.pk)
+        partial.status = 'cancelled'
+        partial.save()
+        self.assert_stats(GLOBAL_KEY, pending=0, cancelled=1)
+        
+        deferred = Booking.objects.defer('status').get(pk=booking.pk)
+        deferred.status = 'pending'
+        deferred.save(update_fields=['status'])
+        self.assert_stats(room_day_key(self.room1.pk, booking.date), pending=1, cancelled=0)
+        self.assert_matches_rebuild()
+    
+    def test_delete_room_with_bookings(self):
+        """测试删除自习室后不留下该自习室的统计行，全站和用户统计随之减少"""
+        booking = self.create_test_booking(status='pending')
+        self.create_test_booking(room=self.room2, status='confirmed')
+        
+        key = room_day_key(self.room1.pk, booking.date)
+        self.room1.delete()
+        
+        self.assertFalse(BookingStats.objects.filter(key=key).exists())
+        self.assert_stats(GLOBAL_KEY, pending=0, confirmed=1, total=1)
+        self.assert_stats(user_key(self.student_user.pk), pending=0, confirmed=1)
+        self.assert_matches_rebuild()
+    
+    def test_list_views_read_stats_row(self):
+        """测试列表页从统计表读取数量"""
+        self.create_test_booking(status='pending')
+        self.create_test_booking(time_slot=self.slot_afternoon, status='confirmed')
+        
+        self.login_student()
+        response = self.client.get(reverse('bookings:booking_list'))
+        self.assertEqual(response.context['total_bookings'], 2)
+        self.assertEqual(response.context['pending_count'], 1)
+        self.assertEqual(response.context['confirmed_count'], 1)
+        
+        self.login_admin()
+        response = self.client.get(reverse('bookings:admin_booking_list'))
+        self.assertEqual(response.context['total_bookings'], 2)
+        self.assertEqual(response.context['confirmed_count'], 1)
+
+
+class KeysetPaginationTest(BaseTestCase, APITestMixin, QueryPlanMixin):
+    """游标分页测试"""
+    
+    def create_bookings(self, count, user=None):
+        now = timezone.now()
+        bookings = [
+            self.create_test_booking(user=user, booking_date=timezone.now().date() + timedelta(days=day))
+            for day in range(1, count + 1)
+        ]
+        # 一半预约使用相同的创建时间，验证按 id 区分并列
+        for index, booking in enumerate(bookings):
+            Booking.objects.filter(pk=booking.pk).update(created_at=now - timedelta(minutes=index // 2))
+        return list(Booking.objects.filter(pk__in=[b.pk for b in bookings]).order_by('-created_at', '-pk'))
+    
+    def test_api_walks_forward_and_backward(self):
+        """测试API逐页前进和后退覆盖全部预约且不重复"""
+        expected = [b.pk for b in self.create_bookings(45)]
+        self.login_student()
+        
+        pages, url = [], '/api/bookings/'
+        while url:
+            data = self.assert_api_success(self.client.get(url))
+            self.assertNotIn('count', data)
+            pages.append([item['id'] for item in data['results']])
+            last, url = data, data['next']
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), expected)
+        
+        data = self.assert_api_success(self.client.get(last['previous']))
+        self.assertEqual([item['id'] for item in data['results']], pages[1])
+        data = self.assert_api_success(self.client.get(data['previous']))
+        self.assertEqual([item['id'] for item in data['results']], pages[0])
+        self.assertIsNone(data['previous'])
+    
+    def test_api_count_on_request(self):
+        """测试?count=1时返回总数"""
+        self.create_bookings(3)
+        self.login_student()
+        data = self.assert_api_success(self.api_get('/api/bookings/', {'count': 1}))
+        self.assertEqual(data['count'], 3)
+    
+    def test_invalid_cursor(self):
+        """测试无效游标返回404"""
+        self.login_student()
+        self.assert_api_error(self.api_get('/api/bookings/', {'cursor': 'invalid'}), 404)
+        self.login_admin()
+        response = self.client.get(reverse('bookings:admin_booking_list'), {'cursor': 'bm90IGEgY3Vyc29y'})
+        self.assertEqual(response.status_code, 404)
+    
+    def test_admin_list_deep_page_costs_same(self):
+        """测试管理员列表深页与首页查询次数相同且不使用OFFSET"""
+        self.create_bookings(65)
+        self.login_admin()
+        url = reverse('bookings:admin_booking_list')
+        
+        response = self.client.get(url)
+        cursor = response.context['page_obj'].next_cursor
+        for _ in range(2):
+            cursor = self.client.get(url, {'cursor': cursor}).context['page_obj'].next_cursor
+        
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as deep:
+            response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(len(response.context['bookings']), 5)
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertEqual(len(first), len(deep))
+        self.assertFalse(any('OFFSET' in query['sql'] for query in deep.captured_queries))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in deep.captured_queries))
+    
+    def test_admin_list_keeps_filters(self):
+        """测试翻页链接保留筛选条件"""
+        self.create_bookings(25)
+        self.login_admin()
+        response = self.client.get(reverse('bookings:admin_booking_list'), {'status': 'pending'})
+        self.assertContains(response, 'status=pending&amp;cursor=')
+    
+    def test_keyset_query_uses_index(self):
+        """测试游标翻页查询使用索引且无需排序"""
+        bookings = self.create_bookings(3)
+        cursor = encode_cursor('n', bookings[0])
+        direction, created_at, pk = decode_cursor(cursor)
+        queryset = Booking.objects.filter(user=self.student_user).filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+        ).order_by('-created_at', '-pk')[:21]
+        self.assert_uses_index(queryset, 'booking_user_created_idx')
+
+
+class ConditionalRequestTest(BaseTestCase, APITestMixin):
+    """ETag/Last-Modified 条件请求测试"""
+    
+    def assert_not_modified(self, url, data=None):
+        """首次请求返回验证器，携带验证器再次请求返回 304"""
+        response = self.api_get(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        response = self.client.get(url, data, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        return response['ETag']
+    
+    def assert_modified(self, url, etag, data=None):
+        response = self.client.get(url, data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_catalog_endpoints(self):
+        """测试自习室和时间段接口在目录变化后失效"""
+        self.login_student()
+        rooms = self.assert_not_modified('/api/rooms/')
+        slots = self.assert_not_modified('/api/timeslots/')
+        detail = self.assert_not_modified(f'/api/rooms/{self.room1.pk}/')
+        self.slot_evening.name = '夜间'
+        self.slot_evening.save()
+        self.assert_modified('/api/rooms/', rooms)
+        self.assert_modified('/api/timeslots/', slots)
+        self.assert_modified(f'/api/rooms/{self.room1.pk}/', detail)
+    
+    def test_last_modified(self):
+        """测试按 If-Modified-Since 返回 304"""
+        self.login_student()
+        response = self.api_get('/api/timeslots/')
+        response = self.client.get('/api/timeslots/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_not_modified_skips_view(self):
+        """测试未变化时只计算验证器：会话、用户、目录版本号各一次"""
+        self.login_student()
+        etag = self.api_get('/api/rooms/')['ETag']
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/rooms/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+    
+    def test_availability_endpoints(self):
+        """测试可用性接口在占用变化后失效"""
+        self.login_student()
+        day = timezone.localdate() + timedelta(days=1)
+        slots_url = f'/api/available-slots/{self.room1.pk}/{day.isoformat()}/'
+        slots = self.assert_not_modified(slots_url)
+        grid = self.assert_not_modified('/api/availability-grid/')
+        self.create_test_booking(room=self.room1, booking_date=day)
+        self.assert_modified(slots_url, slots)
+        self.assert_modified('/api/availability-grid/', grid)
+        # 包含过去日期的矩阵不使用验证器
+        response = self.api_get('/api/availability-grid/', {'start': (day - timedelta(days=3)).isoformat()})
+        self.assertFalse(response.has_header('ETag'))
+    
+    def test_booking_endpoints(self):
+        """测试预约接口在预约变化后失效，且 ETag 因用户而异"""
+        booking = self.create_test_booking()
+        self.login_student()
+        bookings = self.assert_not_modified('/api/bookings/')
+        detail = self.assert_not_modified(f'/api/bookings/{booking.pk}/')
+        
+        self.login_admin()
+        self.assert_modified(f'/api/bookings/{booking.pk}/', detail)
+        
+        self.login_student()
+        Booking.objects.filter(pk=booking.pk).update(purpose='已修改', updated_at=timezone.now())
+        self.assert_modified('/api/bookings/', bookings)
+        self.assert_modified(f'/api/bookings/{booking.pk}/', detail)
+
+
+class BookingReadPathTest(BaseTestCase, APITestMixin):
+    """预约API读路径测试：预加载和 values() 投影"""
+    
+    def create_bookings(self, count, start=1):
+        today = timezone.localdate()
+        slots = [self.slot_morning, self.slot_afternoon, self.slot_evening]
+        for i in range(count):
+            self.create_test_booking(
+                room=self.room1, time_slot=slots[i % 3], booking_date=today + timedelta(days=start + i // 3)
+            )
+    
+    def test_related_lookups_follow_declared_fields(self):
+        """测试预加载路径由声明的嵌套序列化器决定"""
+        self.assertEqual(BookingSerializer.related_lookups(), (['user', 'room', 'time_slot'], []))
+    
+    def test_projection_matches_serializer(self):
+        """测试投影输出与 BookingSerializer 一致"""
+        self.create_bookings(3)
+        self.login_student()
+        response = self.api_get('/api/bookings/')
+        bookings = Booking.objects.filter(user=self.student_user).order_by('-created_at', '-pk')
+        request = response.wsgi_request
+        expected = BookingSerializer(bookings, many=True, context={'request': request}).data
+        self.assertEqual(response.json()['results'], json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+    
+    def test_projection_rejects_unsupported_fields(self):
+        """测试无法投影的字段报错"""
+        class MethodSerializer(BookingSerializer):
+            extra = serializers.SerializerMethodField()
+            
+            class Meta(BookingSerializer.Meta):
+                fields = BookingSerializer.Meta.fields + ['extra']
+        
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesProjection(MethodSerializer)
+    
+    def test_list_queries_independent_of_page_size(self):
+        """测试列表查询次数不随条数增长：会话、用户、ETag 聚合、目录版本号、整页一次"""
+        self.login_student()
+        self.create_bookings(2)
+        with self.assertNumQueries(5):
+            self.api_get('/api/bookings/')
+        self.create_bookings(30, start=10)
+        with self.assertNumQueries(5):
+            response = self.api_get('/api/bookings/')
+        self.assertEqual(len(response.json()['results']), 20)
+    
+    def test_detail_loads_nested_in_one_query(self):
+        """测试详情接口一次联表读取预约及嵌套对象"""
+        booking = self.create_test_booking()
+        self.login_student()
+        self.api_get(f'/api/bookings/{booking.pk}/')
+        # 会话、用户、ETag、目录版本号、预约
+        with self.assertNumQueries(5):
+            response = self.api_get(f'/api/bookings/{booking.pk}/')
+        self.assertEqual(response.json()['room']['name'], self.room1.name)
+
+
+class SparseFieldsTest(BaseTestCase, APITestMixin):
+    """?fields= 和 ?expand= 测试"""
+    
+    def setUp(self):
+        super().setUp()
+        self.booking = self.create_test_booking()
+        self.login_student()
+    
+    def test_default_output_unchanged(self):
+        """测试未提供参数时输出完整的嵌套对象"""
+        item = self.api_get('/api/bookings/').json()['results'][0]
+        self.assertEqual(item['room']['description'], self.room1.description)
+        self.assertEqual(item['user']['username'], 'student1')
+    
+    def test_fields_collapse_relations_to_ids(self):
+        """测试选择字段后未展开的关联只输出主键，且不联表"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_get('/api/bookings/', {'fields': 'id,status,room'})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.booking.pk, 'status': 'pending', 'room': self.room1.pk}
+        ])
+        data_query = queries.captured_queries[-1]['sql']
+        self.assertNotIn('JOIN', data_query)
+        self.assertNotIn('"purpose"', data_query)
+    
+    def test_expand_and_nested_fields(self):
+        """测试 expand 展开关联，room.name 只选择嵌套对象的部分字段"""
+        response = self.api_get('/api/bookings/', {'fields': 'id,room.name,time_slot', 'expand': 'time_slot'})
+        item = response.json()['results'][0]
+        self.assertEqual(item['room'], {'name': self.room1.name})
+        self.assertEqual(item['time_slot']['start_time'], '08:00:00')
+        self.assertEqual(set(item), {'id', 'room', 'time_slot'})
+        
+        response = self.api_get('/api/bookings/', {'expand': 'room'})
+        item = response.json()['results'][0]
+        self.assertEqual(item['user'], self.student_user.pk)
+        self.assertEqual(item['room']['capacity'], self.room1.capacity)
+    
+    def test_detail_pushes_projection_down(self):
+        """测试详情接口用 only() 只读取选择的列"""
+        url = f'/api/bookings/{self.booking.pk}/'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_get(url, {'fields': 'id,status,room.name'})
+        self.assertEqual(response.json(), {'id': self.booking.pk, 'status': 'pending', 'room': {'name': self.room1.name}})
+        sql = next(q['sql'] for q in queries.captured_queries if 'FROM "bookings_booking"' in q['sql'] and 'JOIN' in q['sql'])
+        self.assertNotIn('"purpose"', sql)
+        self.assertNotIn('"description"', sql)
+    
+    def test_catalog_endpoints(self):
+        """测试自习室和时间段接口支持字段选择"""
+        response = self.api_get('/api/rooms/', {'fields': 'id,name'})
+        self.assertEqual(response.json()['results'][0], {'id': self.room1.pk, 'name': self.room1.name})
+    
+    def test_unknown_field(self):
+        """测试未知字段返回400"""
+        response = self.api_get('/api/bookings/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_payload_shrinks(self):
+        """测试移动端常用的精简字段使响应缩小一个数量级"""
+        for i in range(2, 12):
+            self.create_test_booking(booking_date=timezone.localdate() + timedelta(days=i))
+        full = self.api_get('/api/bookings/').content
+        sparse = self.api_get('/api/bookings/', {'fields': 'id,status,date,room,time_slot'}).content
+        self.assertLess(len(sparse) * 5, len(full))
+
+
+class BookingExportTest(BaseTestCase):
+    """预约导出测试"""
+    
+    def setUp(self):
+        super().setUp()
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        self.booking1 = self.create_test_booking(room=self.room1, status='confirmed')
+        self.booking2 = self.create_test_booking(room=self.room2, booking_date=self.tomorrow)
+        BookingHistory.objects.create(booking=self.booking1, action='审批通过', operator=self.admin_user)
+        self.url = reverse('bookings:booking_export')
+    
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+    
+    def test_csv_export(self):
+        """测试CSV导出包含表头和状态名称"""
+        self.login_admin()
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        lines = self.read(response).lstrip('\ufeff').splitlines()
+        self.assertTrue(lines[0].startswith('编号,预约用户,自习室'))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('已确认', lines[1])
+    
+    def test_csv_export_escapes_formulas(self):
+        """测试CSV导出转义以公式字符开头的文本，NDJSON保持原值"""
+        purpose = '=HYPERLINK("http://example.com","点击")'
+        Booking.objects.filter(pk=self.booking1.pk).update(purpose=purpose)
+        BookingHistory.objects.filter(booking=self.booking1).update(notes='@SUM(1)')
+        self.login_admin()
+        rows = csv.reader(self.read(self.client.get(self.url)).lstrip('\ufeff').splitlines())
+        row = next(row for row in rows if row[0] == str(self.booking1.pk))
+        self.assertIn("'" + purpose, row)
+        history = self.read(self.client.get(self.url, {'kind': 'history'}))
+        self.assertIn("'@SUM(1)", history)
+        rows = [json.loads(line) for line in self.read(self.client.get(self.url, {'format': 'ndjson'})).splitlines()]
+        self.assertIn(purpose, [row['purpose'] for row in rows])
+    
+    def test_ndjson_export_applies_list_filters(self):
+        """测试NDJSON导出使用与列表相同的自习室、日期和状态筛选"""
+        self.login_admin()
+        params = {'format': 'ndjson', 'room': self.room2.pk, 'date': self.tomorrow.isoformat(), 'status': 'pending'}
+        rows = [json.loads(line) for line in self.read(self.client.get(self.url, params)).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], self.booking2.pk)
+        self.assertEqual(rows[0]['room'], self.room2.name)
+        self.assertEqual(rows[0]['date'], self.tomorrow.isoformat())
+        
+        response = self.client.get(reverse('bookings:admin_booking_list'), {'room': self.room2.pk})
+        self.assertEqual(list(response.context['bookings']), [self.booking2])
+    
+    def test_history_export(self):
+        """测试导出筛选后预约的历史记录"""
+        self.login_admin()
+        response = self.client.get(self.url, {'kind': 'history', 'format': 'ndjson', 'status': 'confirmed'})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([(row['booking'], row['action'], row['operator']) for row in rows], [
+            (self.booking1.pk, '审批通过', 'admin1')
+        ])
+    
+    def test_search_export_not_limited(self):
+        """测试搜索导出包含全部匹配的预约，不受列表页搜索结果条数限制"""
+        matched = [self.booking1.pk, self.booking2.pk]
+        for i in range(2, 7):
+            matched.append(self.create_test_booking(booking_date=timezone.localdate() + timedelta(days=i)).pk)
+        Booking.objects.filter(pk__in=matched).update(purpose='期末复习')
+        reindex_bookings(Booking.objects.all())
+        self.login_admin()
+        with self.settings(SEARCH_MAX_RESULTS=3, BOOKING_EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(self.url, {'format': 'ndjson', 'search': '期末'})
+            rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(matched))
+    
+    def test_reads_in_keyset_chunks(self):
+        """测试按主键分批读取，每批一条查询"""
+        for i in range(2, 7):
+            self.create_test_booking(booking_date=timezone.localdate() + timedelta(days=i))
+        self.login_admin()
+        with self.settings(BOOKING_EXPORT_CHUNK_SIZE=3):
+            response = self.client.get(self.url, {'format': 'ndjson'})
+            with CaptureQueriesContext(connection) as queries:
+                lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(all('LIMIT 3' in query['sql'] for query in queries.captured_queries))
+    
+    def test_invalid_and_forbidden(self):
+        """测试无效参数返回400，非管理员不能导出"""
+        self.login_admin()
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, 400)
+        self.login_student()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+    
+    def test_admin_action(self):
+        """测试后台管理导出所选预约"""
+        self.client.login(username='superuser', password='testpass123')
+        response = self.client.post(reverse('admin:bookings_booking_changelist'), {
+            'action': 'export_csv', '_selected_action': [self.booking2.pk],
+        })
+        lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{self.booking2.pk},'))
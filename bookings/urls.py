@@ -6,8 +6,12 @@ app_name = 'bookings'
 urlpatterns = [
     path('', views.BookingListView.as_view(), name='booking_list'),
     path('create/<int:room_id>/', views.BookingCreateView.as_view(), name='booking_create'),
+    path('series/create/<int:room_id>/', views.BookingSeriesCreateView.as_view(), name='series_create'),
+    path('series/<int:pk>/cancel/', views.BookingSeriesCancelView.as_view(), name='series_cancel'),
     path('<int:pk>/', views.BookingDetailView.as_view(), name='booking_detail'),
     path('<int:pk>/cancel/', views.BookingCancelView.as_view(), name='booking_cancel'),
     path('admin/', views.AdminBookingListView.as_view(), name='admin_booking_list'),
+    path('admin/export/', views.BookingExportView.as_view(), name='booking_export'),
+    path('admin/batch/', views.BookingBatchApproveView.as_view(), name='booking_batch_approve'),
     path('admin/<int:pk>/approve/', views.BookingApproveView.as_view(), name='booking_approve'),
 ]
@@ -3,15 +3,36 @@ from django.views.generic import ListView, DetailView, CreateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.urls import reverse_lazy, reverse
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.utils import timezone
-from django.http import JsonResponse
-from django.db.models import Q
-from datetime import datetime, date
-from .models import Booking, BookingHistory
-from rooms.models import StudyRoom, TimeSlot
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.conf import settings
+from datetime import datetime, date, timedelta
+from .models import Booking, BookingHistory, BookingSeries
+from .availability import annotate_slots, get_mask, parse_day
+from .exports import BOOKINGS, FORMATS, HISTORY, export_queryset, filter_bookings, stream_export
+from .pagination import InvalidCursor, KeysetPage, paginate_keyset
+from .stats import GLOBAL_KEY, get_stats, user_key
+from .services import (
+    SlotUnavailable, admit_booking, cancel_series, create_series, transition_booking, transition_bookings
+)
+from rooms.catalog import CatalogChoiceField, active_rooms, active_time_slots, get_room
+from rooms.models import TimeSlot
+from monitoring.metrics import ACCEPTED, CONFLICT, INVALID, record_admission
 from django import forms
 
 
+def catalog_time_slot_field(field):
+    """将表单的时间段字段替换为从目录缓存读取选项的字段"""
+    return CatalogChoiceField(
+        active_time_slots,
+        TimeSlot.objects.filter(is_active=True),
+        label=field.label,
+        required=field.required,
+        widget=field.widget,
+    )
+
+
 class BookingForm(forms.ModelForm):
     """预约表单"""
     class Meta:
@@ -24,7 +45,7 @@ class BookingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.room = kwargs.pop('room', None)
         super().__init__(*args, **kwargs)
-        self.fields['time_slot'].queryset = TimeSlot.objects.filter(is_active=True)
+        self.fields['time_slot'] = catalog_time_slot_field(self.fields['time_slot'])
         
     def clean_date(self):
         date_value = self.cleaned_data['date']
@@ -40,8 +61,56 @@ class BookingForm(forms.ModelForm):
         return participants
 
 
+class BookingSeriesForm(forms.ModelForm):
+    """周期预约表单"""
+    class Meta:
+        model = BookingSeries
+        fields = ['time_slot', 'start_date', 'end_date', 'interval_weeks', 'purpose', 'participants']
+        widgets = {
+            'start_date': forms.DateInput(attrs={'type': 'date', 'min': date.today()}),
+            'end_date': forms.DateInput(attrs={'type': 'date', 'min': date.today()}),
+            'purpose': forms.Textarea(attrs={'rows': 3}),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        self.room = kwargs.pop('room', None)
+        super().__init__(*args, **kwargs)
+        self.fields['time_slot'] = catalog_time_slot_field(self.fields['time_slot'])
+    
+    def clean_start_date(self):
+        start_date = self.cleaned_data['start_date']
+        if start_date < timezone.now().date():
+            raise forms.ValidationError('不能预约过去的日期')
+        return start_date
+    
+    def clean_participants(self):
+        participants = self.cleaned_data['participants']
+        if self.room and participants > self.room.capacity:
+            raise forms.ValidationError(f'参与人数不能超过房间容量({self.room.capacity})')
+        return participants
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, end_date = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start_date and end_date:
+            if end_date < start_date:
+                raise forms.ValidationError('结束日期不能早于开始日期')
+            if end_date - start_date > timedelta(days=366):
+                raise forms.ValidationError('周期预约最长为一年')
+        return cleaned_data
+
+
+def get_active_room_or_404(room_id):
+    """从目录缓存读取启用的自习室"""
+    room = get_room(room_id)
+    if room is None:
+        raise Http404('自习室不存在或已停用')
+    return room
+
+
 class BookingListView(LoginRequiredMixin, ListView):
     """用户预约列表视图"""
+    query_budget = 8
     model = Booking
     template_name = 'bookings/booking_list.html'
     context_object_name = 'bookings'
@@ -52,17 +121,22 @@ class BookingListView(LoginRequiredMixin, ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # 计算用户不同状态预约的统计数据
-        user_bookings = Booking.objects.filter(user=self.request.user)
-        context['total_bookings'] = user_bookings.count()
-        context['pending_count'] = user_bookings.filter(status='pending').count()
-        context['confirmed_count'] = user_bookings.filter(status='confirmed').count()
-        context['cancelled_count'] = user_bookings.filter(status='cancelled').count()
+        # 用户各状态预约数量从统计表按主键读取
+        stats = get_stats(user_key(self.request.user.pk))
+        context['total_bookings'] = stats.total
+        context['pending_count'] = stats.pending
+        context['confirmed_count'] = stats.confirmed
+        context['cancelled_count'] = stats.cancelled
+        # 周期预约只按规则展示，不展开为逐次预约
+        context['series_list'] = BookingSeries.objects.filter(
+            user=self.request.user, status='active', end_date__gte=timezone.now().date()
+        ).select_related('room', 'time_slot')
         return context
 
 
 class BookingCreateView(LoginRequiredMixin, CreateView):
     """创建预约视图"""
+    query_budget = {'GET': 8, 'POST': 16}
     model = Booking
     form_class = BookingForm
     template_name = 'bookings/booking_create.html'
@@ -73,50 +147,113 @@ class BookingCreateView(LoginRequiredMixin, CreateView):
         return kwargs
     
     def get_room(self):
-        return get_object_or_404(StudyRoom, pk=self.kwargs['room_id'], is_active=True)
+        # 同一请求内只读取一次目录缓存
+        if not hasattr(self, '_room'):
+            self._room = get_active_room_or_404(self.kwargs['room_id'])
+        return self._room
     
     def form_valid(self, form):
         form.instance.user = self.request.user
         form.instance.room = self.get_room()
         
-        # 检查时间段是否已被预约
-        existing_booking = Booking.objects.filter(
-            room=form.instance.room,
-            time_slot=form.instance.time_slot,
-            date=form.instance.date,
-            status__in=['pending', 'confirmed']
-        ).exists()
-        
-        if existing_booking:
-            messages.error(self.request, '该时间段已被预约，请选择其他时间段')
-            return self.form_invalid(form)
-        
-        response = super().form_valid(form)
-        
-        # 记录预约历史        
-        BookingHistory.objects.create(
-            booking=self.object,
-            action='创建预约',
-            operator=self.request.user,
-            notes=f'用户{self.request.user.username}创建了预约'
-        )
+        # 冲突由数据库约束判定，插入失败即表示时间段已被预约
+        try:
+            self.object = admit_booking(
+                form.instance,
+                operator=self.request.user,
+                notes=f'用户{self.request.user.username}创建了预约'
+            )
+        except SlotUnavailable as exc:
+            record_admission(CONFLICT)
+            messages.error(self.request, exc.message)
+            # 跳过本类的 form_invalid，冲突不计为校验失败
+            return super().form_invalid(form)
         
+        record_admission(ACCEPTED)
         messages.success(self.request, '预约申请提交成功，请等待管理员审核')
-        return response
+        return redirect(self.get_success_url())
+    
+    def form_invalid(self, form):
+        record_admission(INVALID)
+        return super().form_invalid(form)
     
     def get_success_url(self):
         return reverse('bookings:booking_list')
     
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        room = self.get_room()
+        today = timezone.now().date()
+        # 表单回显时使用提交的日期，否则使用 ?date= 参数，默认今天
+        selected_date = parse_day(self.request.POST.get('date') or self.request.GET.get('date'))
+        selected_date = max(selected_date or today, today)
+        context['room'] = room
+        context['time_slots'] = annotate_slots(active_time_slots(), get_mask(room.pk, selected_date))
+        context['selected_date'] = selected_date
+        context['today'] = today
+        return context
+
+
+class SeriesPermissionMixin(UserPassesTestMixin):
+    """周期预约仅对教师和管理员开放"""
+    def test_func(self):
+        user = self.request.user
+        return user.is_authenticated and (user.user_type in ('teacher', 'admin') or user.is_superuser)
+
+
+class BookingSeriesCreateView(SeriesPermissionMixin, CreateView):
+    """创建周期预约视图"""
+    query_budget = {'GET': 7, 'POST': 22}
+    model = BookingSeries
+    form_class = BookingSeriesForm
+    template_name = 'bookings/series_create.html'
+    
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['room'] = self.get_room()
+        return kwargs
+    
+    def get_room(self):
+        if not hasattr(self, '_room'):
+            self._room = get_active_room_or_404(self.kwargs['room_id'])
+        return self._room
+    
+    def form_valid(self, form):
+        form.instance.user = self.request.user
+        form.instance.room = self.get_room()
+        
+        # 整个周期的冲突一次性检测，任一日期被占用则不创建
+        try:
+            self.object = create_series(form.instance)
+        except SlotUnavailable as exc:
+            messages.error(self.request, exc.message)
+            return self.form_invalid(form)
+        
+        messages.success(self.request, f'周期预约已提交，共{self.object.occurrence_count}次，请等待管理员审核')
+        return redirect('bookings:booking_list')
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['room'] = self.get_room()
-        context['time_slots'] = TimeSlot.objects.filter(is_active=True).order_by('start_time')
         context['today'] = timezone.now().date()
         return context
 
 
+class BookingSeriesCancelView(LoginRequiredMixin, View):
+    """取消周期预约视图"""
+    query_budget = 11
+    def post(self, request, pk):
+        series = get_object_or_404(BookingSeries, pk=pk, user=request.user, status='active')
+        if cancel_series(series, operator=request.user):
+            messages.success(request, '周期预约已取消')
+        else:
+            messages.error(request, '周期预约状态已变更，无法取消')
+        return redirect('bookings:booking_list')
+
+
 class BookingDetailView(LoginRequiredMixin, DetailView):
     """预约详情视图"""
+    query_budget = 11
     model = Booking
     template_name = 'bookings/booking_detail.html'
     context_object_name = 'booking'
@@ -137,6 +274,7 @@ class BookingDetailView(LoginRequiredMixin, DetailView):
 
 class BookingCancelView(LoginRequiredMixin, View):
     """取消预约视图"""
+    query_budget = 12
     def get(self, request, pk):
         # GET请求直接取消
         return self.cancel_booking(request, pk)
@@ -147,24 +285,26 @@ class BookingCancelView(LoginRequiredMixin, View):
     
     def cancel_booking(self, request, pk):
         booking = get_object_or_404(
-            Booking, 
+            Booking.objects.only('id', 'status', 'user_id', 'room_id', 'date'),
             pk=pk, 
             user=request.user,
-            status__in=['pending', 'confirmed']
+            status__in=Booking.ACTIVE_STATUSES
         )
         
-        booking.status = 'cancelled'
-        booking.save()
-        
-        # 记录预约历史
-        BookingHistory.objects.create(
-            booking=booking,
-            action='取消预约',
+        # 更新状态并记录预约历史
+        cancelled = transition_booking(
+            booking,
+            'cancelled',
             operator=request.user,
-            notes=f'用户{request.user.username}取消了预约'
+            action='取消预约',
+            notes=f'用户{request.user.username}取消了预约',
+            from_statuses=Booking.ACTIVE_STATUSES
         )
         
-        messages.success(request, '预约已取消')
+        if cancelled:
+            messages.success(request, '预约已取消')
+        else:
+            messages.error(request, '预约状态已变更，无法取消')
         return redirect('bookings:booking_list')
 
 
@@ -177,47 +317,87 @@ class AdminRequiredMixin(UserPassesTestMixin):
 
 class AdminBookingListView(AdminRequiredMixin, ListView):
     """管理员预约列表视图"""
+    query_budget = 9
     model = Booking
     template_name = 'bookings/admin_booking_list.html'
     context_object_name = 'bookings'
     paginate_by = 20
+    
+    def paginate_queryset(self, queryset, page_size):
+        """按 (created_at, id) 游标分页，不使用 OFFSET；?count=1 时统计总数"""
+        if self.get_search():
+            # 搜索结果按相关度排序且已限制条数，一页显示
+            page = KeysetPage(list(queryset[:settings.SEARCH_MAX_RESULTS]), None, None)
+            return None, page, page.object_list, False
+        try:
+            page = paginate_keyset(
+                queryset,
+                self.request.GET.get('cursor'),
+                page_size,
+                with_count=self.request.GET.get('count') == '1',
+            )
+        except InvalidCursor:
+            raise Http404('无效的游标')
+        return None, page, page.object_list, page.has_other_pages()
+    
     def get_queryset(self):
         queryset = Booking.objects.select_related('room', 'time_slot', 'user').all().order_by('-created_at')
-        status = self.request.GET.get('status')
-        if status:
-            queryset = queryset.filter(status=status)
-        
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(user__username__icontains=search) |
-                Q(room__name__icontains=search) |
-                Q(purpose__icontains=search)
-            )
-        return queryset
+        # 按状态、自习室、日期过滤，搜索结果按相关度排序
+        return filter_bookings(queryset, self.request.GET)
+    
+    def get_search(self):
+        return self.request.GET.get('search', '').strip()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # 添加统计数据
-        all_bookings = Booking.objects.all()
-        context['total_bookings'] = all_bookings.count()
-        context['pending_count'] = all_bookings.filter(status='pending').count()
-        context['confirmed_count'] = all_bookings.filter(status='confirmed').count()
-        context['cancelled_count'] = all_bookings.filter(status='cancelled').count()
+        # 全站各状态预约数量从统计表按主键读取
+        stats = get_stats(GLOBAL_KEY)
+        context['total_bookings'] = stats.total
+        context['pending_count'] = stats.pending
+        context['confirmed_count'] = stats.confirmed
+        context['cancelled_count'] = stats.cancelled
         
         # 添加自习室列表用于过滤
-        context['rooms'] = StudyRoom.objects.filter(is_active=True)
+        context['rooms'] = active_rooms()
         
         # 添加过滤参数
         context['status_filter'] = self.request.GET.get('status', 'all')
-        context['search'] = self.request.GET.get('search', '')
+        context['search'] = self.get_search()
+        context['search_limit'] = settings.SEARCH_MAX_RESULTS
+        # 翻页链接保留筛选参数
+        query = self.request.GET.copy()
+        query.pop('cursor', None)
+        context['page_query'] = query.urlencode()
         
         return context
 
 
+class BookingExportView(AdminRequiredMixin, View):
+    """预约导出视图
+
+    按管理员预约列表的筛选条件流式导出预约（kind=bookings）或预约历史
+    （kind=history），format 为 csv 或 ndjson。
+    """
+    query_budget = 6
+    def get(self, request):
+        kind = request.GET.get('kind', BOOKINGS)
+        fmt = request.GET.get('format', 'csv')
+        if kind not in (BOOKINGS, HISTORY) or fmt not in FORMATS:
+            return HttpResponseBadRequest('无效的导出类型或格式')
+        return stream_export(export_queryset(kind, request.GET), kind, fmt)
+
+
+# 审批操作：(目标状态, 历史记录动作, 成功提示)
+APPROVAL_ACTIONS = {
+    'approve': ('confirmed', '审批通过', '预约已审批通过'),
+    'reject': ('cancelled', '审批拒绝', '预约已被拒绝'),
+}
+
+
 class BookingApproveView(AdminRequiredMixin, View):
     """预约审批视图"""
+    query_budget = 10
     def get(self, request, pk):
         # GET请求默认为批准
         return self.handle_booking_action(request, pk, 'approve')
@@ -227,29 +407,60 @@ class BookingApproveView(AdminRequiredMixin, View):
         return self.handle_booking_action(request, pk, action)
     
     def handle_booking_action(self, request, pk, action):
-        booking = get_object_or_404(Booking, pk=pk)
+        booking = get_object_or_404(Booking.objects.only('id', 'status', 'user_id', 'room_id', 'date'), pk=pk)
         notes = request.POST.get('notes', '') if request.method == 'POST' else ''
         
-        if action == 'approve':
-            booking.status = 'confirmed'
-            action_text = '审批通过'
-            message = '预约已审批通过'
-        elif action == 'reject':
-            booking.status = 'cancelled'
-            action_text = '审批拒绝'
-            message = '预约已被拒绝'
-        else:
+        if action not in APPROVAL_ACTIONS:
             messages.error(request, '无效的操作')
             return redirect(reverse('bookings:admin_booking_list'))
-        booking.save()
+        new_status, action_text, message = APPROVAL_ACTIONS[action]
         
-        # 记录预约历史
-        BookingHistory.objects.create(
-            booking=booking,
-            action=action_text,
+        # 更新状态并记录预约历史
+        done = transition_booking(
+            booking,
+            new_status,
             operator=request.user,
-            notes=notes or f'管理员{request.user.username}{action_text}了预约'
+            action=action_text,
+            notes=notes or f'管理员{request.user.username}{action_text}了预约',
+            from_statuses=('pending',)
         )
         
-        messages.success(request, message)
+        if done:
+            messages.success(request, message)
+        else:
+            messages.error(request, '只能审批待确认的预约')
         return redirect(reverse('bookings:admin_booking_list'))
+
+
+class BookingBatchApproveView(AdminRequiredMixin, View):
+    """批量审批视图"""
+    query_budget = 10
+    def post(self, request):
+        action = request.POST.get('action')
+        try:
+            booking_ids = [int(pk) for pk in request.POST.getlist('booking_ids')]
+        except ValueError:
+            booking_ids = []
+        if action not in APPROVAL_ACTIONS or not booking_ids:
+            messages.error(request, '请选择要审批的预约和操作')
+            return redirect(reverse('bookings:admin_booking_list'))
+        
+        new_status, action_text, message = APPROVAL_ACTIONS[action]
+        changed = transition_bookings(
+            booking_ids,
+            new_status,
+            operator=request.user,
+            action=action_text,
+            notes=request.POST.get('notes') or f'管理员{request.user.username}批量{action_text}了预约',
+        )
+        
+        skipped = len(set(booking_ids)) - len(changed)
+        if changed:
+            messages.success(request, f'{message}，共{len(changed)}条')
+        if skipped:
+            messages.warning(request, f'{skipped}条预约不是待审核状态，已跳过')
+        # 返回提交前的筛选页面
+        next_url = request.POST.get('next')
+        if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+            next_url = reverse('bookings:admin_booking_list')
+        return redirect(next_url)
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "monitoring"
+    verbose_name = "性能监控"
+
+    def ready(self):
+        from .slowlog import install
+
+        # 每个新建的数据库连接都记录慢查询
+        connection_created.connect(install, dispatch_uid='monitoring.slowlog')
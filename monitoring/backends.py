@@ -0,0 +1,29 @@
+"""
+带计时的模板后端
+
+与 Django 自带的 DjangoTemplates 相同，渲染耗时记入 Server-Timing 的 tpl。
+在 TEMPLATES 的 BACKEND 中使用。
+"""
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .timing import TEMPLATE, measure
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with measure(TEMPLATE):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,63 @@
+"""
+视图查询预算
+
+视图声明每个请求最多执行的 SQL 查询数，开发环境（DEBUG）和测试中由
+QueryBudgetMiddleware 检查，超出时抛出 QueryBudgetExceeded 并列出重复的 SQL，
+模板循环中新增的 N+1 查询会立即暴露。
+
+类视图（包括 DRF 的 APIView）设置类属性：
+    class BookingListView(LoginRequiredMixin, ListView):
+        query_budget = 8
+
+函数视图或 urls.py 中的 as_view() 使用装饰器：
+    path('login/', query_budget(6)(LoginView.as_view()), name='login')
+
+预算可以是整数，也可以是按请求方法区分的字典，如 {'GET': 6, 'POST': 15}，
+字典中没有的方法不检查。
+"""
+from collections import Counter
+
+
+class QueryBudgetExceeded(AssertionError):
+    """请求执行的查询数超过视图声明的预算"""
+
+
+def query_budget(budget):
+    """为函数视图、as_view() 返回的视图或视图类声明查询预算"""
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def declared_budget(view_func):
+    """视图声明的预算（整数或字典），未声明时返回 None"""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        budget = getattr(view_class, 'query_budget', None)
+    return budget
+
+
+def get_budget(view_func, method):
+    """取视图对请求方法的查询预算，未声明时返回 None"""
+    budget = declared_budget(view_func)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+def view_name(view_func):
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    view = view_class or view_func
+    return f'{view.__module__}.{view.__qualname__}'
+
+
+def budget_report(request, view, budget, statements, top=5):
+    """超出预算的说明：查询总数和重复次数最多的 SQL"""
+    lines = [f'{view} 处理 {request.method} {request.path} 执行了 {len(statements)} 条查询，预算为 {budget}']
+    duplicates = [(sql, count) for sql, count in Counter(statements).most_common(top) if count > 1]
+    if duplicates:
+        lines.append('重复的 SQL：')
+        lines += [f'  {count}× {sql}' for sql, count in duplicates]
+    return '\n'.join(lines)
@@ -0,0 +1,301 @@
+"""
+按路由的延迟直方图和计数器
+
+每个 worker 进程在内存中累计指标，并定期（METRICS_FLUSH_INTERVAL 秒）把全部
+累计值写入 METRICS_DIR 下自己的 JSON 文件。抓取时读取目录中所有进程的文件
+（当前进程直接用内存中的值）相加，一次抓取即可得到整台主机上所有 gunicorn
+worker 的数据。
+
+每个新进程启动时把已退出进程的文件合并进 dead.json 后删除（见 compact()），
+计数器不会因 worker 重启、runserver 重新加载而回退，目录中的文件数也不会
+随重启次数增长。部署新版本时可清空 METRICS_DIR（见 clear_metrics()）。
+
+指标：
+    http_request_duration_seconds  直方图，标签 route、method
+    http_request_queries           直方图，标签 route（需启用 ServerTimingMiddleware）
+    http_responses_total           计数器，标签 route、method、status
+    booking_admissions_total       计数器，标签 outcome（accepted、conflict、invalid）
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 上没有 fcntl，不合并文件（多进程部署使用 gunicorn，只在 POSIX 上运行）
+    fcntl = None
+
+COUNTER, HISTOGRAM = 'counter', 'histogram'
+ACCEPTED, CONFLICT, INVALID = 'accepted', 'conflict', 'invalid'
+DEAD_FILE = 'dead.json'
+_WORKER_FILE = re.compile(r'^(\d+)-[0-9a-f]+\.json$')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# 指标名 -> (类型, 说明, 标签, 直方图分桶)
+METRICS = {
+    'http_request_duration_seconds': (HISTOGRAM, '请求耗时（秒）', ('route', 'method'), DURATION_BUCKETS),
+    'http_request_queries': (HISTOGRAM, '每个请求执行的 SQL 查询数', ('route',), QUERY_BUCKETS),
+    'http_responses_total': (COUNTER, '响应数', ('route', 'method', 'status'), None),
+    'booking_admissions_total': (COUNTER, '单次预约创建结果', ('outcome',), None),
+}
+
+
+class Registry:
+    """一个进程内的指标累计值
+
+    计数器为 {(指标, 标签值): 值}，直方图为 {(指标, 标签值): [各分桶计数..., 总和, 总数]}，
+    分桶计数不累加，输出时再转换为 Prometheus 的累计分桶。
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.name = f'{self.pid}-{uuid.uuid4().hex[:8]}.json'
+        self.counters = {}
+        self.histograms = {}
+        self.flushed_at = 0.0
+        self.lock = threading.Lock()
+        # 多线程服务器（runserver）中多个线程可能同时写入，共用临时文件名时后者会找不到文件
+        self.flush_lock = threading.Lock()
+
+    def inc(self, metric, labels, amount=1):
+        key = (metric, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, metric, labels, value):
+        buckets = METRICS[metric][3]
+        key = (metric, tuple(labels))
+        with self.lock:
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [[metric, list(labels), value] for (metric, labels), value in self.counters.items()],
+                'histograms': [[metric, list(labels), list(state)] for (metric, labels), state in self.histograms.items()],
+            }
+
+    def flush(self, directory=None):
+        """把累计值写入 directory（默认 METRICS_DIR）下本进程的文件"""
+        directory = Path(directory or settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        temporary = directory / f'.{self.name}.tmp'
+        with self.flush_lock:
+            temporary.write_text(json.dumps(self.dump()))
+            # 原子替换，抓取时不会读到写了一半的文件
+            os.replace(temporary, directory / self.name)
+            self.flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def registry():
+    """当前进程的 Registry；fork 出的 worker 重新创建，不继承主进程的数据"""
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.pid != os.getpid():
+            _registry = Registry()
+            try:
+                compact(current=_registry)
+            except OSError:
+                # 合并失败不影响请求，下一个新进程启动时重试
+                pass
+    return _registry
+
+
+@atexit.register
+def _flush_on_exit():
+    if _registry is not None and _registry.pid == os.getpid() and (_registry.counters or _registry.histograms):
+        try:
+            _registry.flush()
+        except OSError:
+            pass
+
+
+def observe_request(route, method, status, duration, queries=None):
+    current = registry()
+    current.observe('http_request_duration_seconds', (route, method), duration)
+    current.inc('http_responses_total', (route, method, str(status)))
+    if queries is not None:
+        current.observe('http_request_queries', (route,), queries)
+    current.maybe_flush()
+
+
+def record_admission(outcome):
+    """记录一次单次预约创建的结果：ACCEPTED、CONFLICT 或 INVALID"""
+    registry().inc('booking_admissions_total', (outcome,))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 进程存在但属于其他用户
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        # 文件可能已被合并或清理
+        return None
+
+
+def _merge(dumps):
+    counters, histograms = {}, {}
+    for data in dumps:
+        for metric, labels, value in data['counters']:
+            key = (metric, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, state in data['histograms']:
+            key = (metric, tuple(labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], state)]
+            else:
+                histograms[key] = list(state)
+    return counters, histograms
+
+
+def compact(directory=None, current=None):
+    """把已退出进程的文件合并进 dead.json 并删除，返回合并的文件数
+
+    dead.json 的 folded 记录已合并的文件名，先原子替换 dead.json 再删除这些文件，
+    抓取时跳过 folded 中的文件，合并前后的抓取结果一致。多个进程同时启动时用
+    文件锁串行执行。
+    """
+    if fcntl is None:
+        return 0
+    directory = Path(directory or settings.METRICS_DIR)
+    if not directory.is_dir():
+        return 0
+    own = current.name if current is not None else None
+    with open(directory / '.compact.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = _read(directory / DEAD_FILE) or {'counters': [], 'histograms': [], 'folded': []}
+        # 上次已合并但还没删除的文件（如删除前进程退出）
+        folded = [name for name in dead.get('folded', ()) if (directory / name).exists()]
+        dumps, names = [dead], []
+        for path in directory.glob('*.json'):
+            match = _WORKER_FILE.match(path.name)
+            if not match or path.name == own or path.name in folded:
+                continue
+            pid = int(match.group(1))
+            # 与当前进程同 pid 的其他文件属于先前已退出的同号进程
+            if pid != os.getpid() and _alive(pid):
+                continue
+            data = _read(path)
+            if data is not None:
+                dumps.append(data)
+                names.append(path.name)
+        if not names and not folded:
+            return 0
+        counters, histograms = _merge(dumps)
+        merged = {
+            'counters': [[metric, list(labels), value] for (metric, labels), value in counters.items()],
+            'histograms': [[metric, list(labels), state] for (metric, labels), state in histograms.items()],
+            'folded': folded + names,
+        }
+        temporary = directory / f'.{DEAD_FILE}.tmp'
+        temporary.write_text(json.dumps(merged))
+        os.replace(temporary, directory / DEAD_FILE)
+        for name in merged['folded']:
+            (directory / name).unlink(missing_ok=True)
+    return len(names)
+
+
+def collect(directory=None):
+    """合并目录中所有进程的指标和当前进程内存中的指标"""
+    directory = Path(directory or settings.METRICS_DIR)
+    current = registry()
+    files = {}
+    if directory.is_dir():
+        for path in directory.glob('*.json'):
+            if path.name in (current.name, DEAD_FILE):
+                continue
+            data = _read(path)
+            if data is not None:
+                files[path.name] = data
+    # 最后读取 dead.json：期间发生的合并已计入其中，跳过被合并的文件，不会重复或遗漏
+    dead = _read(directory / DEAD_FILE)
+    dumps = [current.dump()]
+    if dead is not None:
+        dumps.append(dead)
+        for name in dead.get('folded', ()):
+            files.pop(name, None)
+    return _merge(dumps + list(files.values()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics(directory=None):
+    """Prometheus 文本格式（0.0.4）的全部指标"""
+    counters, histograms = collect(directory)
+    lines = []
+    for metric, (kind, description, names, buckets) in METRICS.items():
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {kind}']
+        if kind == COUNTER:
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f'{metric}{_labels(names, labels)} {_number(value)}')
+            continue
+        for (name, labels), state in sorted(histograms.items()):
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, state):
+                cumulative += count
+                lines.append(f'{metric}_bucket{_labels(names, labels, [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{metric}_bucket{_labels(names, labels, [("le", "+Inf")])} {state[-1]}')
+            lines.append(f'{metric}_sum{_labels(names, labels)} {_number(state[-2])}')
+            lines.append(f'{metric}_count{_labels(names, labels)} {state[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def clear_metrics(directory=None):
+    """删除目录中所有进程的指标文件，并清空当前进程的累计值"""
+    global _registry
+    directory = Path(directory or settings.METRICS_DIR)
+    if directory.is_dir():
+        for path in directory.glob('*.json'):
+            path.unlink(missing_ok=True)
+    with _registry_lock:
+        _registry = None
@@ -0,0 +1,124 @@
+"""
+性能监控中间件
+"""
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .budgets import QueryBudgetExceeded, budget_report, get_budget, view_name
+from .metrics import observe_request
+from .timing import DB, VIEW, end_request, record, start_request
+
+# 事务控制语句不计入预算：测试用例外层的事务使视图中的 atomic() 变为保存点
+TRANSACTION_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT', 'ROLLBACK')
+
+
+class QueryBudgetMiddleware:
+    """检查视图的查询预算
+
+    只在 QUERY_BUDGET_ENFORCE 为 True 时启用（默认与 DEBUG 相同，测试中开启），
+    生产环境不加载。统计整个请求（包括会话和用户的加载）执行的查询，
+    流式响应在返回后读取的数据不计入。应放在 MIDDLEWARE 的最前面。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENFORCE', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if not sql.lstrip().upper().startswith(TRANSACTION_PREFIXES):
+                statements.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+            response = self.get_response(request)
+
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and len(statements) > budget[1]:
+            raise QueryBudgetExceeded(budget_report(request, budget[0], budget[1], statements))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = get_budget(view_func, request.method)
+        if budget is not None:
+            request._query_budget = (view_name(view_func), budget)
+        return None
+
+
+class MetricsMiddleware:
+    """按路由累计请求耗时、状态码和查询次数，见 monitoring.metrics
+
+    METRICS_ENABLED 为 False 时不加载。应放在 ServerTimingMiddleware 之前，
+    以便读取其统计的查询次数。路由标签为 URL 名称，未匹配的请求记为 unmatched。
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        timings = getattr(request, 'timings', None)
+        observe_request(
+            match.view_name if match else 'unmatched',
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            timings.queries if timings else None,
+        )
+        return response
+
+
+class ServerTimingMiddleware:
+    """记录每个请求的耗时分解，写入 Server-Timing 响应头和按视图的环形缓冲区
+
+    SERVER_TIMING_ENABLED 为 False 时不加载。应放在 QueryBudgetMiddleware 之后、
+    其他中间件之前。流式响应在返回后生成的内容不计入。
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings, token = start_request()
+        request.timings = timings
+
+        def execute(execute, sql, params, many, context):
+            timings.queries += 1
+            timings.enter(DB)
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                timings.exit()
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(execute))
+                response = self.get_response(request)
+        finally:
+            end_request(token)
+        timings.finish()
+        response['Server-Timing'] = timings.header()
+        if timings.view is not None:
+            record(timings.view, timings, response.status_code)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timings.view = view_name(view_func)
+        request.timings.enter(VIEW)
+        return None
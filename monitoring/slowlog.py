@@ -0,0 +1,195 @@
+"""
+慢查询日志
+
+每个数据库连接建立时安装一个 execute_wrapper（见 MonitoringConfig.ready），
+执行时间不少于 SLOW_QUERY_THRESHOLD_MS 毫秒的查询写入 SLOW_QUERY_LOG，
+每条记录包含：
+    sql       规范化的 SQL（IN 列表和字面量替换为占位符，同一语句的记录可以归并）
+    params    参数（过长的值截断）
+    view      发起查询的视图（需启用 ServerTimingMiddleware，管理命令等为空）
+    location  项目代码中发起查询的位置，如 bookings/views.py:120 in get_queryset
+    plan      EXPLAIN QUERY PLAN（SQLite）或 EXPLAIN 的输出
+
+日志为 JSON Lines，超过 SLOW_QUERY_LOG_MAX_BYTES 时轮转为 .1 文件，磁盘上
+最多保留两个文件。测试中心的“慢查询”页面按语句汇总并列出最近的记录。
+"""
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .timing import current_timings
+
+MAX_PARAMS = 20
+MAX_PARAM_LENGTH = 200
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+_lock = threading.Lock()
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """把参数占位符、IN 列表和字面量统一替换，使同一语句的不同执行归为一类"""
+    sql = _SPACES.sub(' ', sql).strip()
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return sql.replace('%s', '?')
+
+
+def _param(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} 字节>'
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    value = str(value)
+    return value if len(value) <= MAX_PARAM_LENGTH else value[:MAX_PARAM_LENGTH] + '…'
+
+
+def _params(params, many):
+    if params is None:
+        return []
+    if many:
+        return [f'<{len(params)} 组参数>'] if hasattr(params, '__len__') else ['<多组参数>']
+    if isinstance(params, dict):
+        return {key: _param(value) for key, value in list(params.items())[:MAX_PARAMS]}
+    return [_param(value) for value in list(params)[:MAX_PARAMS]]
+
+
+def _location():
+    """调用栈中最内层的项目代码（排除本应用和第三方包）"""
+    base = str(settings.BASE_DIR) + os.sep
+    own = os.path.dirname(__file__) + os.sep
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if filename.startswith(base) and not filename.startswith(own) and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, base)}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def _format_plan(vendor, rows):
+    if vendor != 'sqlite':
+        return [' '.join(str(value) for value in row) for row in rows]
+    # SQLite 的 EXPLAIN QUERY PLAN 每行为 (id, parent, notused, detail)，按 parent 缩进成树
+    depth, lines = {}, []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def explain(connection, sql, params):
+    """返回查询计划的文本行，不能解释的语句返回空列表
+
+    使用 create_cursor() 创建的底层游标执行，不经过 execute_wrapper，
+    不计入查询预算和 Server-Timing，也不会再次触发慢查询记录。
+    """
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(prefix + sql, params)
+        return _format_plan(connection.vendor, cursor.fetchall())
+    except (DatabaseError, connection.Database.Error) as exc:
+        # 底层游标抛出的是驱动自身的异常
+        return [f'无法获取查询计划：{exc}']
+    finally:
+        cursor.close()
+
+
+def write_record(record):
+    """追加一条记录，超出大小时轮转"""
+    path = Path(settings.SLOW_QUERY_LOG)
+    line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as handle:
+            handle.write(line)
+        if path.stat().st_size > settings.SLOW_QUERY_LOG_MAX_BYTES:
+            os.replace(path, f'{path}.1')
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = (time.perf_counter() - started) * 1000
+    if duration >= threshold:
+        connection = context['connection']
+        timings = current_timings()
+        write_record({
+            'at': time.time(),
+            'duration_ms': round(duration, 3),
+            'sql': normalize_sql(sql),
+            'params': _params(params, many),
+            'view': timings.view if timings else None,
+            'location': _location(),
+            'plan': [] if many else explain(connection, sql, params),
+            'database': connection.alias,
+        })
+    return result
+
+
+def install(sender, connection, **kwargs):
+    """connection_created 信号的接收者：为新连接安装慢查询记录"""
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_queries)
+
+
+def read_slow_queries(limit=200):
+    """最近的慢查询记录，最新的在前"""
+    path = Path(settings.SLOW_QUERY_LOG)
+    records = []
+    for candidate in (Path(f'{path}.1'), path):
+        try:
+            with open(candidate, encoding='utf-8') as handle:
+                lines = handle.readlines()
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # 轮转或并发写入时可能截断的行
+                continue
+    records.reverse()
+    return records[:limit]
+
+
+def summarize_slow_queries(records):
+    """按规范化的 SQL 汇总：次数、最长和平均耗时、最近一次的视图、位置和查询计划，按总耗时倒序"""
+    groups = {}
+    for record in records:
+        group = groups.get(record['sql'])
+        if group is None:
+            # records 最新的在前，第一条即最近一次
+            group = groups[record['sql']] = {
+                'sql': record['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'view': record['view'], 'location': record['location'], 'plan': record['plan'],
+            }
+        group['count'] += 1
+        group['total_ms'] += record['duration_ms']
+        group['max_ms'] = max(group['max_ms'], record['duration_ms'])
+    for group in groups.values():
+        group['mean_ms'] = round(group['total_ms'] / group['count'], 3)
+        group['total_ms'] = round(group['total_ms'], 3)
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+
+
+def clear_slow_queries():
+    path = Path(settings.SLOW_QUERY_LOG)
+    with _lock:
+        for candidate in (path, Path(f'{path}.1')):
+            candidate.unlink(missing_ok=True)
@@ -0,0 +1,425 @@
+"""
+性能监控测试
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.urls import path, reverse
+from django.utils import timezone
+from django.views import View
+
+from rooms.models import StudyRoom
+from tests.base import BaseTestCase
+from tests.benchmark import Fixtures, Runner, budget_violations, cases, unbudgeted_patterns
+from tests.datagen import DatasetGenerator
+from .budgets import QueryBudgetExceeded, get_budget, query_budget
+from .metrics import DEAD_FILE, Registry, clear_metrics, compact, render_metrics
+from .slowlog import log_slow_queries, normalize_sql, read_slow_queries, summarize_slow_queries, write_record
+from .middleware import QueryBudgetMiddleware, ServerTimingMiddleware
+from .timing import (
+    DB, METRICS, SERIALIZER, TEMPLATE, TOTAL, VIEW, RequestTimings, clear_recent, current_timings, measure,
+    recent_timings, timing_summary,
+)
+
+
+@query_budget(2)
+def room_names(request):
+    """逐个按主键读取自习室，典型的 N+1 查询"""
+    names = [StudyRoom.objects.get(pk=pk).name for pk in StudyRoom.objects.values_list('pk', flat=True)]
+    return HttpResponse(','.join(names))
+
+
+@query_budget(1)
+def atomic_count(request):
+    with transaction.atomic():
+        return HttpResponse(StudyRoom.objects.count())
+
+
+def unbudgeted(request):
+    return HttpResponse(len([StudyRoom.objects.count() for _ in range(5)]))
+
+
+class PerMethodView(View):
+    query_budget = {'GET': 1}
+
+    def get(self, request):
+        return HttpResponse(StudyRoom.objects.count() + StudyRoom.objects.count())
+
+    def post(self, request):
+        return HttpResponse(StudyRoom.objects.count() + StudyRoom.objects.count())
+
+
+urlpatterns = [
+    path('names/', room_names),
+    path('atomic/', atomic_count),
+    path('unbudgeted/', unbudgeted),
+    path('per-method/', PerMethodView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF='monitoring.tests')
+class QueryBudgetMiddlewareTest(TestCase):
+    """查询预算中间件测试"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(4):
+            StudyRoom.objects.create(name=f'预算测试{number}', description='测试', capacity=10, location='A栋')
+
+    def test_exceeded_budget_reports_duplicate_sql(self):
+        with self.assertRaises(QueryBudgetExceeded) as cm:
+            self.client.get('/names/')
+        report = str(cm.exception)
+        self.assertIn('monitoring.tests.room_names', report)
+        self.assertIn('执行了 5 条查询，预算为 2', report)
+        self.assertIn('4× SELECT', report)
+
+    def test_transaction_statements_not_counted(self):
+        self.assertEqual(self.client.get('/atomic/').status_code, 200)
+
+    def test_view_without_budget_not_checked(self):
+        self.assertEqual(self.client.get('/unbudgeted/').status_code, 200)
+
+    def test_per_method_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/per-method/')
+        # 字典中没有 POST，不检查
+        self.assertEqual(self.client.post('/per-method/').status_code, 200)
+        self.assertEqual(get_budget(PerMethodView.as_view(), 'GET'), 1)
+        self.assertIsNone(get_budget(PerMethodView.as_view(), 'POST'))
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False)
+    def test_disabled_when_not_enforced(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryBudgetMiddleware(lambda request: HttpResponse())
+
+
+class QueryBudgetCoverageTest(TestCase):
+    """每个路由都声明查询预算，并在真实规模的数据上不超出"""
+
+    @classmethod
+    def setUpTestData(cls):
+        DatasetGenerator(
+            rooms=10, users=40, bookings=400, days_back=10, days_ahead=7, seed=1, prefix='bench',
+        ).generate()
+
+    def test_every_route_declares_budget(self):
+        self.assertEqual(unbudgeted_patterns(), [])
+
+    def test_routes_within_budget(self):
+        fixtures = Fixtures('synthetic123')
+        violations = budget_violations(Runner(fixtures, warmup=0, runs=1), cases(fixtures))
+        self.assertEqual(violations, [], '\n\n'.join(violations))
+
+
+def parse_server_timing(header):
+    """解析 Server-Timing 头，返回 {类别: (毫秒, desc)}"""
+    metrics = {}
+    for part in header.split(', '):
+        name, *params = part.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        metrics[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+    return metrics
+
+
+class ServerTimingTest(BaseTestCase):
+    """Server-Timing 耗时分解测试"""
+
+    def setUp(self):
+        super().setUp()
+        clear_recent()
+        self.login_student()
+
+    def test_page_reports_db_and_template(self):
+        response = self.client.get(reverse('rooms:room_list'))
+        metrics = parse_server_timing(response['Server-Timing'])
+        self.assertIn(TOTAL, metrics)
+        self.assertIn(TEMPLATE, metrics)
+        duration, desc = metrics[DB]
+        self.assertGreater(int(desc.split()[0]), 0)
+        # 各类互不重叠，之和等于 total
+        parts = sum(value for name, (value, _) in metrics.items() if name != TOTAL)
+        self.assertAlmostEqual(parts, metrics[TOTAL][0], delta=0.1)
+
+    def test_api_reports_serializer(self):
+        self.create_test_booking(status='confirmed')
+        response = self.client.get(reverse('api:booking_list_create'))
+        self.assertIn(SERIALIZER, parse_server_timing(response['Server-Timing']))
+        response = self.client.get(reverse('api:room_detail', kwargs={'pk': self.room1.pk}))
+        self.assertIn(SERIALIZER, parse_server_timing(response['Server-Timing']))
+
+    @override_settings(SERVER_TIMING_BUFFER_SIZE=2)
+    def test_recent_timings_per_view(self):
+        for _ in range(3):
+            self.client.get(reverse('rooms:room_list'))
+        self.client.get(reverse('api:timeslot_list'))
+        samples = recent_timings('rooms.views.RoomListView')
+        self.assertEqual(len(samples), 2)
+        self.assertEqual(samples[-1]['status'], 200)
+        self.assertGreater(samples[-1]['queries'], 0)
+        summary = timing_summary()
+        self.assertEqual(summary['rooms.views.RoomListView']['count'], 2)
+        self.assertEqual(summary['bookings.api_views.TimeSlotListAPIView']['count'], 1)
+
+    def test_nested_measure_is_exclusive(self):
+        timings = RequestTimings()
+        timings.enter(VIEW)
+        timings.enter(TEMPLATE)
+        timings.enter(DB)
+        timings.exit()
+        timings.exit()
+        timings.finish()
+        durations = timings.durations
+        self.assertAlmostEqual(sum(durations[metric] for metric in METRICS if metric != TOTAL), durations[TOTAL])
+
+    def test_measure_outside_request(self):
+        self.assertIsNone(current_timings())
+        with measure(DB):
+            pass
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ServerTimingMiddleware(lambda request: HttpResponse())
+
+
+class MetricsTest(BaseTestCase):
+    """Prometheus 指标测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        override = override_settings(METRICS_DIR=self.metrics_dir, METRICS_TOKEN='scrape-token')
+        override.enable()
+        self.addCleanup(override.disable)
+        clear_metrics()
+        self.addCleanup(clear_metrics)
+
+    def scrape(self):
+        self.login_admin()
+        response = self.client.get(reverse('monitoring:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_route_latency_and_status(self):
+        self.login_student()
+        self.client.get(reverse('rooms:room_list'))
+        self.client.get(reverse('rooms:room_list'))
+        self.client.get('/no-such-page/')
+        body = self.scrape()
+        self.assertIn(
+            'http_request_duration_seconds_bucket{route="rooms:room_list",method="GET",le="+Inf"} 2', body
+        )
+        self.assertIn('http_request_duration_seconds_count{route="rooms:room_list",method="GET"} 2', body)
+        self.assertIn('http_responses_total{route="rooms:room_list",method="GET",status="200"} 2', body)
+        self.assertIn('http_responses_total{route="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('http_request_queries_count{route="rooms:room_list"} 2', body)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+
+    def test_admission_outcomes(self):
+        self.login_student()
+        data = {
+            'room_id': self.room1.pk, 'time_slot_id': self.slot_morning.pk,
+            'date': (timezone.localdate() + timedelta(days=1)).isoformat(), 'purpose': '指标',
+        }
+        url = reverse('api:booking_list_create')
+        self.assertEqual(self.client.post(url, data).status_code, 201)
+        self.assertEqual(self.client.post(url, data).status_code, 409)
+        self.assertEqual(self.client.post(url, {**data, 'participants': 100}).status_code, 400)
+        body = self.scrape()
+        for outcome in ('accepted', 'conflict', 'invalid'):
+            self.assertIn(f'booking_admissions_total{{outcome="{outcome}"}} 1', body)
+
+    def test_aggregates_other_workers(self):
+        self.login_student()
+        self.client.get(reverse('rooms:room_list'))
+        # 另一个 worker 进程写入的文件
+        other = Registry()
+        other.observe('http_request_duration_seconds', ('rooms:room_list', 'GET'), 0.3)
+        other.inc('booking_admissions_total', ('accepted',), 4)
+        other.flush(self.metrics_dir)
+        body = render_metrics()
+        self.assertIn('http_request_duration_seconds_count{route="rooms:room_list",method="GET"} 2', body)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{route="rooms:room_list",method="GET",le="0.25"} 1', body
+        )
+        self.assertIn('booking_admissions_total{outcome="accepted"} 4', body)
+
+    def test_flush_writes_worker_file(self):
+        self.login_student()
+        with override_settings(METRICS_FLUSH_INTERVAL=0):
+            self.client.get(reverse('rooms:room_list'))
+        files = [name for name in os.listdir(self.metrics_dir) if name.endswith('.json')]
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(self.metrics_dir, files[0])) as handle:
+            self.assertTrue(json.load(handle)['histograms'])
+
+    def test_concurrent_flush(self):
+        # 多线程服务器中的多个线程同时写入同一进程的文件
+        current = Registry()
+        current.inc('booking_admissions_total', ('accepted',))
+        errors = []
+
+        def flush():
+            try:
+                for _ in range(50):
+                    current.flush(self.metrics_dir)
+            except OSError as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=flush) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.metrics_dir), [current.name])
+
+    def test_compact_exited_workers(self):
+        # 先创建当前进程的 Registry，之后由测试显式合并
+        render_metrics()
+        # 已退出的进程号
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        for value in (2, 3):
+            worker = Registry()
+            worker.name = f'{exited.pid}-{value:08x}.json'
+            worker.inc('booking_admissions_total', ('accepted',), value)
+            worker.observe('http_request_duration_seconds', ('rooms:room_list', 'GET'), 0.3)
+            worker.flush(self.metrics_dir)
+        # 仍在运行的进程（测试进程的父进程）的文件保留
+        running = Registry()
+        running.name = f'{os.getppid()}-00000001.json'
+        running.inc('booking_admissions_total', ('accepted',), 1)
+        running.flush(self.metrics_dir)
+        before = render_metrics()
+        self.assertIn('booking_admissions_total{outcome="accepted"} 6', before)
+
+        self.assertEqual(compact(self.metrics_dir), 2)
+        files = sorted(name for name in os.listdir(self.metrics_dir) if name.endswith('.json'))
+        self.assertEqual(files, [running.name, DEAD_FILE])
+        self.assertEqual(render_metrics(), before)
+        self.assertEqual(compact(self.metrics_dir), 0)
+
+        # 下一次合并把新退出的进程累加到 dead.json
+        worker.name = f'{exited.pid}-00000004.json'
+        worker.flush(self.metrics_dir)
+        self.assertEqual(compact(self.metrics_dir), 1)
+        self.assertIn('booking_admissions_total{outcome="accepted"} 9', render_metrics())
+        self.assertIn('http_request_duration_seconds_count{route="rooms:room_list",method="GET"} 3', render_metrics())
+
+    def test_new_process_compacts(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        worker = Registry()
+        worker.name = f'{exited.pid}-00000001.json'
+        worker.inc('booking_admissions_total', ('accepted',), 5)
+        worker.flush(self.metrics_dir)
+        # clear_metrics 清空了当前进程的 Registry，下次使用时按新进程重新创建
+        body = render_metrics()
+        self.assertIn('booking_admissions_total{outcome="accepted"} 5', body)
+        self.assertFalse(os.path.exists(os.path.join(self.metrics_dir, worker.name)))
+        self.assertTrue(os.path.exists(os.path.join(self.metrics_dir, DEAD_FILE)))
+
+    def test_staff_only(self):
+        url = reverse('monitoring:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.login_student()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+
+class SlowQueryLogTest(BaseTestCase):
+    """慢查询日志测试"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.log_path = os.path.join(directory, 'slow.jsonl')
+        override = override_settings(SLOW_QUERY_LOG=self.log_path)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_installed_on_connection(self):
+        self.assertIn(log_slow_queries, connection.execute_wrappers)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_records_view_location_and_plan(self):
+        self.create_test_booking()
+        self.login_student()
+        # EXPLAIN 不经过 execute_wrapper，不会使视图超出查询预算
+        response = self.client.get(reverse('api:booking_list_create'))
+        self.assertEqual(response.status_code, 200)
+        records = [
+            record for record in read_slow_queries()
+            if record['view'] == 'bookings.api_views.BookingListCreateAPIView'
+            and 'FROM "bookings_booking"' in record['sql']
+        ]
+        self.assertTrue(records)
+        record = records[0]
+        self.assertTrue(record['location'].startswith('bookings/'))
+        self.assertIn(self.student_user.pk, record['params'])
+        self.assertTrue(any('SEARCH' in line or 'SCAN' in line for line in record['plan']))
+        summary = summarize_slow_queries(read_slow_queries())
+        self.assertEqual(summary, sorted(summary, key=lambda group: group['total_ms'], reverse=True))
+
+    def test_below_threshold_not_recorded(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=10000):
+            StudyRoom.objects.count()
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=None):
+            StudyRoom.objects.count()
+        self.assertEqual(read_slow_queries(), [])
+
+    def test_normalize_sql(self):
+        sql = (
+            'SELECT "U0"."id" FROM "bookings_booking" U0\n  WHERE "U0"."id" IN (%s, %s, %s) '
+            "AND \"U0\".\"status\" = 'pending' LIMIT 21"
+        )
+        self.assertEqual(
+            normalize_sql(sql),
+            'SELECT "U0"."id" FROM "bookings_booking" U0 WHERE "U0"."id" IN (...) AND "U0"."status" = ? LIMIT ?',
+        )
+
+    @override_settings(SLOW_QUERY_LOG_MAX_BYTES=1000)
+    def test_log_is_bounded(self):
+        for number in range(50):
+            write_record({'at': number, 'duration_ms': 1.0, 'sql': f'SELECT {number}', 'params': [],
+                          'view': None, 'location': None, 'plan': []})
+        self.assertTrue(os.path.exists(self.log_path + '.1'))
+        # 刚轮转后当前文件可能还不存在
+        size = sum(os.path.getsize(path) for path in (self.log_path, self.log_path + '.1') if os.path.exists(path))
+        self.assertLessEqual(size, 2 * 1000 + 200)
+        records = read_slow_queries()
+        self.assertEqual(records[0]['sql'], 'SELECT 49')
+        self.assertLess(len(records), 50)
+
+    def test_dashboard_page(self):
+        write_record({'at': 0, 'duration_ms': 250.0, 'sql': 'SELECT "rooms_studyroom"."id" FROM "rooms_studyroom"',
+                      'params': [], 'view': 'rooms.views.RoomListView', 'location': 'rooms/views.py:30 in get',
+                      'plan': ['SCAN rooms_studyroom']})
+        url = reverse('tests:slow_queries')
+        self.login_student()
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.login_admin()
+        response = self.client.get(url)
+        self.assertContains(response, 'rooms.views.RoomListView', count=2)
+        self.assertContains(response, 'SCAN rooms_studyroom')
+        self.client.post(reverse('tests:slow_queries_clear'))
+        self.assertEqual(read_slow_queries(), [])
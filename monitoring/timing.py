@@ -0,0 +1,150 @@
+"""
+请求耗时分解
+
+ServerTimingMiddleware 为每个请求创建 RequestTimings，把耗时分到互不重叠的几类：
+    db     SQL 执行（连接的 execute_wrapper），同时统计查询次数
+    tpl    模板渲染（monitoring.backends.TimedDjangoTemplates）
+    ser    DRF 序列化（TimedSerializerMixin、ValuesProjection）
+    view   视图中其余的 Python 代码
+    mw     进入视图之前的中间件（会话、认证等）
+    total  整个请求
+计时按栈进行，某段时间只记入最内层的类别：模板中惰性执行的查询记入 db，
+不会同时计入 tpl，各类之和等于 total。
+
+结果写入 Server-Timing 响应头，并按视图保存在进程内的环形缓冲区中，
+可通过 recent_timings()、timing_summary() 查看最近的请求。开销只是每个
+计时点一次 perf_counter()，生产环境也可以开启。
+"""
+import statistics
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DB, TEMPLATE, SERIALIZER, VIEW, MIDDLEWARE, TOTAL = 'db', 'tpl', 'ser', 'view', 'mw', 'total'
+# Server-Timing 中的输出顺序
+METRICS = (TOTAL, DB, VIEW, TEMPLATE, SERIALIZER, MIDDLEWARE)
+
+_current = ContextVar('request_timings', default=None)
+_recent = {}
+_lock = threading.Lock()
+
+
+class RequestTimings:
+    """一个请求的耗时（秒）和查询次数，view 为处理请求的视图名称"""
+
+    def __init__(self):
+        self.started = self._mark = time.perf_counter()
+        self.view = None
+        self.durations = dict.fromkeys(METRICS, 0.0)
+        self.queries = 0
+        self._stack = [MIDDLEWARE]
+
+    def enter(self, metric):
+        now = time.perf_counter()
+        self.durations[self._stack[-1]] += now - self._mark
+        self._stack.append(metric)
+        self._mark = now
+
+    def exit(self):
+        now = time.perf_counter()
+        self.durations[self._stack.pop()] += now - self._mark
+        self._mark = now
+
+    def finish(self):
+        while self._stack:
+            self.exit()
+        self.durations[TOTAL] = self._mark - self.started
+
+    def milliseconds(self):
+        return {metric: round(seconds * 1000, 3) for metric, seconds in self.durations.items()}
+
+    def header(self):
+        """Server-Timing 响应头的值，省略耗时为 0 的类别"""
+        parts = []
+        for metric, ms in self.milliseconds().items():
+            if metric == DB:
+                parts.append(f'{DB};desc="{self.queries} queries";dur={ms:.2f}')
+            elif ms or metric == TOTAL:
+                parts.append(f'{metric};dur={ms:.2f}')
+        return ', '.join(parts)
+
+
+class measure:
+    """把代码块的耗时记入当前请求的某一类，不在请求中时不做任何事"""
+    __slots__ = ('metric', 'timings')
+
+    def __init__(self, metric):
+        self.metric = metric
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is not None:
+            self.timings.enter(self.metric)
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.exit()
+
+
+def start_request():
+    """开始记录当前请求，返回 (RequestTimings, 用于 end_request 的令牌)"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_timings():
+    return _current.get()
+
+
+def record(view, timings, status):
+    """把一个请求的耗时放入该视图的环形缓冲区"""
+    sample = timings.milliseconds()
+    sample.update(queries=timings.queries, status=status, at=time.time())
+    with _lock:
+        buffer = _recent.get(view)
+        if buffer is None:
+            buffer = _recent[view] = deque(maxlen=settings.SERVER_TIMING_BUFFER_SIZE)
+        buffer.append(sample)
+
+
+def recent_timings(view=None):
+    """最近的请求耗时：指定视图时返回样本列表，否则返回 {视图: 样本列表}"""
+    with _lock:
+        if view is not None:
+            return list(_recent.get(view, ()))
+        return {name: list(buffer) for name, buffer in _recent.items()}
+
+
+def timing_summary():
+    """按视图汇总缓冲区中的样本：请求数、total 的 p50/p95、各类平均耗时和平均查询数"""
+    summary = {}
+    for view, samples in recent_timings().items():
+        totals = sorted(sample[TOTAL] for sample in samples)
+        summary[view] = {
+            'count': len(samples),
+            'p50': totals[(len(totals) - 1) // 2],
+            'p95': totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            **{metric: round(statistics.fmean(s[metric] for s in samples), 3) for metric in METRICS},
+            'queries': round(statistics.fmean(s['queries'] for s in samples), 1),
+        }
+    return summary
+
+
+def clear_recent():
+    with _lock:
+        _recent.clear()
+
+
+class TimedSerializerMixin:
+    """DRF 序列化器的 to_representation 耗时记入 ser"""
+
+    def to_representation(self, instance):
+        with measure(SERIALIZER):
+            return super().to_representation(instance)
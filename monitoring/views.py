@@ -0,0 +1,28 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .budgets import query_budget
+from .metrics import render_metrics
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _authorized(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        # Prometheus 抓取时使用 Authorization: Bearer <METRICS_TOKEN>
+        header = request.headers.get('Authorization', '')
+        if hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+    user = request.user
+    return user.is_authenticated and (user.is_staff or user.is_superuser or user.user_type == 'admin')
+
+
+@query_budget(3)
+def metrics(request):
+    """Prometheus 格式的指标，仅管理员或持有 METRICS_TOKEN 的抓取方可访问"""
+    if not _authorized(request):
+        return HttpResponseForbidden('无权访问')
+    return HttpResponse(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
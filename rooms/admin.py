@@ -1,9 +1,22 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from search.admin import IndexedSearchAdminMixin
+from search.index import ROOM
+from .importer import CatalogImportError, import_catalog
 from .models import StudyRoom, TimeSlot
 
 
+class CatalogImportForm(forms.Form):
+    """目录导入表单"""
+    file = forms.FileField(label='目录文件', widget=forms.ClearableFileInput(attrs={'accept': '.csv,.json'}))
+    dry_run = forms.BooleanField(label='试运行（只显示变化，不写入）', required=False, initial=True)
+
+
 @admin.register(StudyRoom)
-class StudyRoomAdmin(admin.ModelAdmin):
+class StudyRoomAdmin(IndexedSearchAdminMixin, admin.ModelAdmin):
     """自习室管理
     
     定义自习室在Django管理后台的展示和编辑方式。
@@ -12,12 +25,15 @@ class StudyRoomAdmin(admin.ModelAdmin):
     list_display = ('name', 'capacity', 'location', 'is_active', 'created_at')
     # 右侧过滤器选项
     list_filter = ('is_active', 'created_at', 'capacity')
-    # 搜索字段配置
+    # 搜索字段配置，实际通过全文索引搜索
     search_fields = ('name', 'location', 'description')
+    search_index_kind = ROOM
     # 默认排序
     ordering = ('name',)
     # 只读字段，不可在编辑页面修改
     readonly_fields = ('created_at', 'updated_at')
+    # 列表页增加批量导入入口
+    change_list_template = 'admin/rooms/catalog_change_list.html'
     
     # 编辑页面的字段分组
     fieldsets = (
@@ -32,6 +48,39 @@ class StudyRoomAdmin(admin.ModelAdmin):
             'classes': ('collapse',)  # 可折叠的分组
         }),
     )
+    
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='rooms_catalog_import'),
+        ]
+        return urls + super().get_urls()
+    
+    def import_view(self, request):
+        """上传 CSV/JSON 批量导入自习室和时间段目录"""
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        plan, errors, dry_run = None, [], True
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            dry_run = form.cleaned_data['dry_run']
+            try:
+                plan = import_catalog([(upload.name, upload.read())], dry_run=dry_run)
+            except CatalogImportError as exc:
+                errors = exc.errors
+            else:
+                if not dry_run:
+                    self.message_user(request, '；'.join(plan.summary()), messages.SUCCESS)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': '批量导入自习室和时间段',
+            'form': form,
+            'plan': plan,
+            'errors': errors,
+            'dry_run': dry_run,
+        }
+        return TemplateResponse(request, 'admin/rooms/catalog_import.html', context)
 
 
 @admin.register(TimeSlot)
@@ -48,3 +97,5 @@ class TimeSlotAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     # 默认排序
     ordering = ('start_time',)
+    # 列表页增加批量导入入口
+    change_list_template = 'admin/rooms/catalog_change_list.html'
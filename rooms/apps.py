@@ -10,3 +10,7 @@ class RoomsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     # 应用名称
     name = "rooms"
+    
+    def ready(self):
+        """注册信号处理，自习室和时间段变化时使目录缓存失效"""
+        from . import signals  # noqa: F401
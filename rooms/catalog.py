@@ -0,0 +1,152 @@
+"""
+自习室目录缓存
+
+启用的自习室和时间段每学期只变动几次，却几乎每个请求都要读取。这里把它们
+缓存在进程内，并用 CatalogVersion 中的版本号判断是否过期：StudyRoom/TimeSlot
+保存或删除时由 signals 递增版本号，各 gunicorn 进程在每个请求首次读取目录时
+比对一次版本号，不一致即丢弃本地副本重新加载。
+
+返回的是缓存对象的浅拷贝，调用方可以像查询结果一样设置属性而不影响缓存。
+"""
+import copy
+import threading
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogVersion, StudyRoom, TimeSlot
+
+ROOMS, TIME_SLOTS = 'rooms', 'time_slots'
+LOADERS = {
+    ROOMS: lambda: list(StudyRoom.objects.filter(is_active=True).order_by('name')),
+    TIME_SLOTS: lambda: list(TimeSlot.objects.filter(is_active=True).order_by('start_time')),
+}
+
+_lock = threading.Lock()
+_entries = {}
+_version = None
+# 当前线程在本次请求中是否已比对过版本号
+_local = threading.local()
+
+
+def current_version():
+    return CatalogVersion.objects.filter(pk=CatalogVersion.SINGLETON_ID).values_list('version', flat=True).first() or 0
+
+
+def _check(version):
+    global _version
+    with _lock:
+        if version != _version:
+            _entries.clear()
+            _version = version
+    _local.checked = True
+
+
+def _sync():
+    if not getattr(_local, 'checked', False):
+        _check(current_version())
+
+
+def version_info():
+    """读取目录版本号和最近修改时间，用作 HTTP 缓存验证器
+
+    同时完成本次请求的版本比对，之后读取目录不再查询版本号。
+    """
+    row = CatalogVersion.objects.filter(pk=CatalogVersion.SINGLETON_ID).values_list('version', 'updated_at').first()
+    version, updated_at = row or (0, None)
+    _check(version)
+    return version, updated_at
+
+
+def _get(kind):
+    _sync()
+    objects = _entries.get(kind)
+    if objects is None:
+        loaded_version = _version
+        objects = LOADERS[kind]()
+        with _lock:
+            # 加载期间目录已失效时不写入，下次读取重新加载
+            if _version == loaded_version:
+                _entries[kind] = objects
+    return [copy.copy(obj) for obj in objects]
+
+
+def active_rooms():
+    """启用的自习室列表，按名称排序"""
+    return _get(ROOMS)
+
+
+def active_time_slots():
+    """启用的时间段列表，按开始时间排序"""
+    return _get(TIME_SLOTS)
+
+
+def get_room(pk):
+    """按主键取启用的自习室，不存在或已停用时返回 None"""
+    return next((room for room in active_rooms() if room.pk == pk), None)
+
+
+def invalidate():
+    """丢弃本进程的目录缓存"""
+    global _version
+    with _lock:
+        _entries.clear()
+        _version = None
+    _local.checked = False
+
+
+def bump_version():
+    """递增目录版本号，使所有进程的目录缓存失效"""
+    updated = CatalogVersion.objects.filter(pk=CatalogVersion.SINGLETON_ID).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=CatalogVersion.SINGLETON_ID, defaults={'version': 1})
+    invalidate()
+    # 本进程可能在提交前重新加载了未提交的数据，提交后再丢弃一次
+    transaction.on_commit(invalidate)
+
+
+def _start_request(**kwargs):
+    _local.checked = False
+
+
+request_started.connect(_start_request, dispatch_uid='rooms_catalog_request_started')
+request_finished.connect(_start_request, dispatch_uid='rooms_catalog_request_finished')
+
+
+class CatalogChoiceField(forms.ModelChoiceField):
+    """选项和校验都从目录缓存读取的 ModelChoiceField
+
+    queryset 仅用于兼容 ModelChoiceField 的接口，不会被查询。
+    """
+
+    def __init__(self, get_objects, queryset, **kwargs):
+        self.get_objects = get_objects
+        super().__init__(queryset, **kwargs)
+
+    def _get_choices(self):
+        choices = [(obj.pk, self.label_from_instance(obj)) for obj in self.get_objects()]
+        if self.empty_label is not None:
+            choices.insert(0, ('', self.empty_label))
+        return choices
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            value = value.pk
+        for obj in self.get_objects():
+            if str(obj.pk) == str(value):
+                return obj
+        raise ValidationError(
+            self.error_messages['invalid_choice'],
+            code='invalid_choice',
+            params={'value': value},
+        )
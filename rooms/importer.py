@@ -0,0 +1,220 @@
+"""
+自习室和时间段目录批量导入
+
+从 CSV 或 JSON 读取自习室、时间段目录，按名称与现有数据比对：每种目录只用
+一条查询读出同名的现有行，新增行 bulk_create，有变化的行 bulk_update，
+全部在一个事务中完成。批量写不触发 save() 信号，因此在最后统一更新搜索索引
+并递增一次目录版本号，而不是每行一次。
+
+- JSON：{"rooms": [...], "time_slots": [...]}，或只含一种目录的对象数组
+- CSV：一个文件一种目录，按表头判断（含 start_time 为时间段，含 capacity 为自习室），
+  表头可以用字段名或中文名称（如“容量”）
+
+行中未提供的字段保持现有值，新行使用模型默认值。任何一行校验失败都不会写入。
+"""
+import csv
+import io
+import json
+import os
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from search.index import index_rooms
+from .catalog import ROOMS, TIME_SLOTS, bump_version
+from .models import StudyRoom, TimeSlot
+
+# 目录类型 -> (模型, 可导入字段)，第一个字段 name 用于匹配现有行
+SPECS = {
+    ROOMS: (StudyRoom, ('name', 'description', 'capacity', 'location', 'equipment', 'is_active')),
+    TIME_SLOTS: (TimeSlot, ('name', 'start_time', 'end_time', 'is_active')),
+}
+LABELS = {ROOMS: '自习室', TIME_SLOTS: '时间段'}
+
+FALSE_VALUES = ('0', 'false', 'no', 'n', '否', '停用')
+
+
+class CatalogImportError(Exception):
+    """导入数据无效，errors 为逐行的错误信息"""
+
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+class CatalogPlan:
+    """导入计划：每种目录的新增对象、(对象, 变化字段) 和未变化的行数"""
+
+    def __init__(self):
+        self.created = {kind: [] for kind in SPECS}
+        self.updated = {kind: [] for kind in SPECS}
+        self.unchanged = {kind: 0 for kind in SPECS}
+
+    @property
+    def has_changes(self):
+        return any(self.created.values()) or any(self.updated.values())
+
+    def summary(self):
+        return [
+            f'{LABELS[kind]}：新增 {len(self.created[kind])}，更新 {len(self.updated[kind])}，'
+            f'未变化 {self.unchanged[kind]}'
+            for kind in SPECS
+        ]
+
+    def details(self):
+        lines = []
+        for kind in SPECS:
+            lines += [f'新增{LABELS[kind]} {obj.name}' for obj in self.created[kind]]
+            lines += [
+                f'更新{LABELS[kind]} {obj.name}：{"、".join(fields)}'
+                for obj, fields in self.updated[kind]
+            ]
+        return lines
+
+
+def _header_aliases(kind):
+    model, fields = SPECS[kind]
+    aliases = {}
+    for name in fields:
+        aliases[name] = name
+        aliases[str(model._meta.get_field(name).verbose_name)] = name
+    return aliases
+
+
+def _normalize(kind, row):
+    aliases = _header_aliases(kind)
+    return {aliases[key.strip()]: value for key, value in row.items() if key and key.strip() in aliases}
+
+
+def _detect_kind(columns):
+    columns = set(columns)
+    for kind in (TIME_SLOTS, ROOMS):
+        aliases = _header_aliases(kind)
+        required = 'start_time' if kind == TIME_SLOTS else 'capacity'
+        if any(aliases.get(column.strip()) == required for column in columns if column):
+            return kind
+    return None
+
+
+def parse_catalog(content, filename):
+    """解析 CSV 或 JSON 内容，返回 {目录类型: [(行号, 字段字典)]}"""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    rows = {kind: [] for kind in SPECS}
+    if os.path.splitext(filename)[1].lower() == '.json':
+        try:
+            data = json.loads(content)
+        except ValueError as exc:
+            raise CatalogImportError([f'{filename}：JSON 格式错误（{exc}）'])
+        if isinstance(data, list):
+            kind = _detect_kind(data[0]) if data and isinstance(data[0], dict) else None
+            if kind is None:
+                raise CatalogImportError([f'{filename}：无法判断目录类型'])
+            data = {kind: data}
+        if not isinstance(data, dict) or not set(data) <= set(SPECS):
+            raise CatalogImportError([f'{filename}：JSON 应为包含 rooms、time_slots 的对象'])
+        for kind, items in data.items():
+            for number, item in enumerate(items, 1):
+                if not isinstance(item, dict):
+                    raise CatalogImportError([f'{filename} 第{number}项：应为对象'])
+                rows[kind].append((number, _normalize(kind, item)))
+        return rows
+
+    reader = csv.DictReader(io.StringIO(content))
+    kind = _detect_kind(reader.fieldnames or ())
+    if kind is None:
+        raise CatalogImportError([f'{filename}：无法根据表头判断目录类型'])
+    # 第 1 行是表头
+    rows[kind] = [(number, _normalize(kind, row)) for number, row in enumerate(reader, 2)]
+    return rows
+
+
+def _clean_value(model, name, value):
+    field = model._meta.get_field(name)
+    if name == 'is_active' and isinstance(value, str):
+        return value.strip().lower() not in FALSE_VALUES
+    if isinstance(value, str):
+        value = value.strip()
+    return field.formfield().clean(value)
+
+
+def build_plan(rows):
+    """与现有目录比对生成导入计划，数据无效时抛出 CatalogImportError"""
+    plan = CatalogPlan()
+    errors = []
+    for kind, (model, fields) in SPECS.items():
+        items = rows.get(kind, [])
+        if not items:
+            continue
+        names = [str(values.get('name', '')).strip() for _, values in items]
+        # 一条查询读出全部同名的现有行，重名时匹配主键最小的一行
+        existing = {}
+        for obj in model.objects.filter(name__in=names).order_by('-pk'):
+            existing[obj.name] = obj
+        seen = set()
+        for (number, values), name in zip(items, names):
+            where = f'{LABELS[kind]}第{number}行'
+            if not name:
+                errors.append(f'{where}：缺少名称')
+                continue
+            if name in seen:
+                errors.append(f'{where}：名称“{name}”重复')
+                continue
+            seen.add(name)
+            obj = existing.get(name) or model(name=name)
+            changed = []
+            try:
+                for field in fields[1:]:
+                    if field not in values:
+                        continue
+                    value = _clean_value(model, field, values[field])
+                    if getattr(obj, field) != value:
+                        setattr(obj, field, value)
+                        changed.append(field)
+                obj.full_clean(exclude=['image'], validate_unique=False)
+            except ValidationError as exc:
+                errors.append(f'{where}（{name}）：{"；".join(exc.messages)}')
+                continue
+            if obj.pk is None:
+                plan.created[kind].append(obj)
+            elif changed:
+                plan.updated[kind].append((obj, changed))
+            else:
+                plan.unchanged[kind] += 1
+    if errors:
+        raise CatalogImportError(errors)
+    return plan
+
+
+@transaction.atomic
+def apply_plan(plan):
+    """在一个事务中批量写入导入计划，之后更新搜索索引并使目录缓存失效一次"""
+    now = timezone.now()
+    for kind, (model, _) in SPECS.items():
+        model.objects.bulk_create(plan.created[kind])
+        updated = [obj for obj, _ in plan.updated[kind]]
+        if updated:
+            fields = {field for _, changed in plan.updated[kind] for field in changed}
+            if kind == ROOMS:
+                # bulk_update 不会处理 auto_now
+                for obj in updated:
+                    obj.updated_at = now
+                fields.add('updated_at')
+            model.objects.bulk_update(updated, sorted(fields))
+    index_rooms(plan.created[ROOMS], created=True)
+    index_rooms([obj for obj, _ in plan.updated[ROOMS]])
+    if plan.has_changes:
+        bump_version()
+
+
+def import_catalog(sources, dry_run=False):
+    """导入 [(文件名, 内容)]，dry_run 为 True 时只生成计划不写入，返回 CatalogPlan"""
+    rows = {kind: [] for kind in SPECS}
+    for filename, content in sources:
+        for kind, items in parse_catalog(content, filename).items():
+            rows[kind] += items
+    plan = build_plan(rows)
+    if not dry_run:
+        apply_plan(plan)
+    return plan
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rooms.importer import CatalogImportError, import_catalog
+
+
+class Command(BaseCommand):
+    """批量导入自习室和时间段目录
+
+    按名称与现有数据比对，在一个事务中批量新增和更新，例如：
+        python manage.py import_catalog rooms.csv time_slots.csv --dry-run
+    """
+    help = '从 CSV 或 JSON 文件批量导入自习室和时间段'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='CSV 或 JSON 目录文件')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只显示将要新增和更新的数据，不写入数据库'
+        )
+
+    def handle(self, *args, **options):
+        sources = []
+        for path in options['files']:
+            try:
+                with open(path, 'rb') as f:
+                    sources.append((path, f.read()))
+            except OSError as exc:
+                raise CommandError(f'无法读取 {path}：{exc}')
+        try:
+            plan = import_catalog(sources, dry_run=options['dry_run'])
+        except CatalogImportError as exc:
+            raise CommandError('导入数据无效，未写入任何数据：\n' + '\n'.join(exc.errors))
+
+        if options['verbosity'] > 1 or options['dry_run']:
+            for line in plan.details():
+                self.stdout.write(f'  {line}')
+        for line in plan.summary():
+            self.stdout.write(line)
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('试运行，未写入数据库'))
+        else:
+            self.stdout.write(self.style.SUCCESS('目录导入完成'))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studyroom',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='room_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['start_time'], name='timeslot_active_start_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_version(apps, schema_editor):
+    CatalogVersion = apps.get_model('rooms', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0002_active_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='版本号')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '目录版本',
+                'verbose_name_plural': '目录版本',
+            },
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
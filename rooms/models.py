@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 
 class StudyRoom(models.Model):
@@ -28,6 +29,10 @@ class StudyRoom(models.Model):
         verbose_name = '自习室'  # 后台显示的单数名称
         verbose_name_plural = '自习室'  # 后台显示的复数名称
         ordering = ['name']  # 默认排序字段
+        indexes = [
+            # 只索引启用的自习室，用于按名称排序的自习室列表
+            models.Index(fields=['name'], condition=models.Q(is_active=True), name='room_active_name_idx'),
+        ]
     
     def __str__(self):
         """返回自习室名称作为对象的字符串表示"""
@@ -50,6 +55,10 @@ class TimeSlot(models.Model):
         verbose_name = '时间段'  # 后台显示的单数名称
         verbose_name_plural = '时间段'  # 后台显示的复数名称
         ordering = ['start_time']  # 默认按开始时间排序
+        indexes = [
+            # 只索引启用的时间段，用于按开始时间排序的时间段列表
+            models.Index(fields=['start_time'], condition=models.Q(is_active=True), name='timeslot_active_start_idx'),
+        ]
     
     def clean(self):
         """
@@ -62,3 +71,23 @@ class TimeSlot(models.Model):
     def __str__(self):
         """返回格式化的时间段信息作为对象的字符串表示"""
         return f"{self.name} ({self.start_time}-{self.end_time})"
+
+
+class CatalogVersion(models.Model):
+    """自习室目录版本号
+    
+    单行表，自习室或时间段保存、删除时递增版本号。
+    各进程据此判断进程内的目录缓存是否过期。
+    """
+    SINGLETON_ID = 1
+    
+    version = models.PositiveBigIntegerField(default=0, verbose_name='版本号')  # 每次目录变化加一
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name='更新时间')  # 最近一次目录变化的时间
+    
+    class Meta:
+        """模型元数据选项"""
+        verbose_name = '目录版本'
+        verbose_name_plural = '目录版本'
+    
+    def __str__(self):
+        return f"v{self.version}"
@@ -0,0 +1,20 @@
+"""
+自习室相关信号处理
+
+自习室或时间段变化时递增目录版本号，使各进程的目录缓存失效。
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_version
+from .models import StudyRoom, TimeSlot
+
+
+@receiver(post_save, sender=StudyRoom)
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=StudyRoom)
+@receiver(post_delete, sender=TimeSlot)
+def invalidate_catalog(sender, raw=False, **kwargs):
+    if raw:
+        return
+    bump_version()
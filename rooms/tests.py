@@ -5,17 +5,29 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from datetime import time, datetime
+from datetime import time, datetime, timedelta
 import os
 import sys
+import tempfile
 
 # 添加项目根目录到路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from tests.base import BaseTestCase, TestDataFactory
-from .models import StudyRoom, TimeSlot
+from django.core.signals import request_started
+from django.db.models import F
+from django.utils import timezone
+from tests.base import BaseTestCase, TestDataFactory, QueryPlanMixin
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+from search.index import ROOM, search_ids
+from . import catalog
+from .importer import CatalogImportError, import_catalog
+from .models import CatalogVersion, StudyRoom, TimeSlot
 
 
 class StudyRoomModelTest(BaseTestCase):
@@ -338,3 +350,216 @@ class RoomViewsIntegrationTest(BaseTestCase):
         # 检查是否有预约相关的链接或按钮
         booking_url = reverse('bookings:booking_create', kwargs={'room_id': self.room1.pk})
         self.assertContains(response, booking_url)
+
+
+class RoomQueryPlanTest(BaseTestCase, QueryPlanMixin):
+    """自习室和时间段查询的执行计划测试"""
+    
+    def test_active_rooms_use_partial_index(self):
+        """测试启用自习室列表使用部分索引"""
+        self.assert_uses_index(StudyRoom.objects.filter(is_active=True), 'room_active_name_idx')
+    
+    def test_active_time_slots_use_partial_index(self):
+        """测试启用时间段列表使用部分索引"""
+        self.assert_uses_index(
+            TimeSlot.objects.filter(is_active=True).order_by('start_time'), 'timeslot_active_start_idx'
+        )
+
+
+class CatalogCacheTest(BaseTestCase):
+    """自习室目录缓存测试"""
+    
+    def setUp(self):
+        super().setUp()
+        catalog.invalidate()
+    
+    def new_request(self):
+        """模拟进程处理下一个请求"""
+        request_started.send(sender=self.__class__)
+    
+    def test_cached_within_request(self):
+        """测试同一请求内只比对一次版本号，之后不再查询"""
+        with self.assertNumQueries(3):
+            rooms = catalog.active_rooms()
+            catalog.active_time_slots()
+        self.assertEqual(rooms, [self.room1, self.room2])
+        with self.assertNumQueries(0):
+            catalog.active_rooms()
+            catalog.get_room(self.room2.pk)
+        self.new_request()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(catalog.active_time_slots()), 3)
+    
+    def test_save_and_delete_bump_version(self):
+        """测试自习室和时间段保存、删除时递增版本号并丢弃缓存"""
+        version = catalog.current_version()
+        catalog.active_rooms()
+        self.room2.name = '202讨论室'
+        self.room2.save()
+        self.assertEqual(catalog.current_version(), version + 1)
+        self.assertEqual(catalog.get_room(self.room2.pk).name, '202讨论室')
+        self.slot_evening.delete()
+        self.assertEqual(catalog.current_version(), version + 2)
+        self.assertEqual(len(catalog.active_time_slots()), 2)
+    
+    def test_other_process_change_detected_on_next_request(self):
+        """测试其他进程修改目录后，下一个请求丢弃本地副本"""
+        catalog.active_rooms()
+        # 其他进程的修改：数据库已变化且版本号递增，本进程未收到信号
+        StudyRoom.objects.filter(pk=self.room1.pk).update(is_active=False)
+        CatalogVersion.objects.filter(pk=CatalogVersion.SINGLETON_ID).update(version=F('version') + 1)
+        self.assertEqual(len(catalog.active_rooms()), 2)
+        self.new_request()
+        self.assertEqual(catalog.active_rooms(), [self.room2])
+        self.assertIsNone(catalog.get_room(self.room1.pk))
+    
+    def test_returns_copies(self):
+        """测试调用方设置的属性不会写入缓存"""
+        slot = catalog.active_time_slots()[0]
+        slot.is_available = False
+        self.assertFalse(hasattr(catalog.active_time_slots()[0], 'is_available'))
+    
+    def test_choice_field(self):
+        """测试表单时间段字段从目录缓存校验"""
+        field = catalog.CatalogChoiceField(catalog.active_time_slots, TimeSlot.objects.filter(is_active=True))
+        self.assertEqual(field.clean(str(self.slot_morning.pk)), self.slot_morning)
+        self.assertEqual(len(field.choices), 4)
+        with self.assertRaises(ValidationError):
+            field.clean(str(self.slot_inactive.pk))
+    
+    def test_views_read_catalog(self):
+        """测试列表页和API使用目录缓存"""
+        self.login_student()
+        self.client.get(reverse('rooms:room_list'))
+        # 会话、用户、目录版本号
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('rooms:room_list'))
+        self.assertEqual(list(response.context['rooms']), [self.room1, self.room2])
+        self.client.get('/api/timeslots/')
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/timeslots/')
+        self.assertEqual(response.json()['count'], 3)
+
+
+class RoomConditionalViewTest(BaseTestCase):
+    """自习室页面条件请求测试"""
+    
+    def test_room_list_not_modified(self):
+        """测试自习室列表未变化时返回 304，目录变化或换用户后重新渲染"""
+        self.login_student()
+        url = reverse('rooms:room_list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        self.room1.description = '新的描述'
+        self.room1.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url)['ETag']
+        self.login_teacher()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_room_detail_tracks_occupancy(self):
+        """测试自习室详情随所选日期的占用变化失效"""
+        self.login_student()
+        url = reverse('rooms:room_detail', kwargs={'pk': self.room1.pk})
+        day = timezone.localdate() + timedelta(days=1)
+        etag = self.client.get(url, {'date': day.isoformat()})['ETag']
+        response = self.client.get(url, {'date': day.isoformat()}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.create_test_booking(room=self.room1, booking_date=day)
+        response = self.client.get(url, {'date': day.isoformat()}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class CatalogImportTest(BaseTestCase):
+    """目录批量导入测试"""
+    
+    ROOMS_CSV = (
+        'name,capacity,location,description,is_active\n'
+        '101自习室,60,教学楼A-101,扩容后的自习室,1\n'
+        '新建研讨室,12,图书馆三楼,,是\n'
+        '201讨论室,8,教学楼A-201,小组讨论专用，配备白板和会议桌,1\n'
+    )
+    
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp_dir = tmp.name
+    
+    def test_diff_and_bulk_apply(self):
+        """测试比对现有数据，新增和更新在少量查询内完成"""
+        version = catalog.current_version()
+        with CaptureQueriesContext(connection) as queries:
+            plan = import_catalog([('rooms.csv', self.ROOMS_CSV.encode())])
+        self.assertEqual(plan.summary()[0], '自习室：新增 1，更新 1，未变化 1')
+        # 比对一次 + 插入 + 更新 + 索引 + 版本号，与行数无关
+        self.assertLessEqual(len(queries), 12)
+        
+        self.room1.refresh_from_db()
+        self.assertEqual((self.room1.capacity, self.room1.description), (60, '扩容后的自习室'))
+        created = StudyRoom.objects.get(name='新建研讨室')
+        self.assertTrue(created.is_active)
+        self.assertEqual(search_ids(ROOM, '图书馆三楼'), [created.pk])
+        # 目录版本只递增一次
+        self.assertEqual(catalog.current_version(), version + 1)
+    
+    def test_dry_run(self):
+        """测试试运行只生成报告不写入"""
+        plan = import_catalog([('rooms.csv', self.ROOMS_CSV)], dry_run=True)
+        self.assertIn('新增自习室 新建研讨室', plan.details())
+        self.assertIn('更新自习室 101自习室：description、capacity', plan.details())
+        self.assertFalse(StudyRoom.objects.filter(name='新建研讨室').exists())
+        self.room1.refresh_from_db()
+        self.assertEqual(self.room1.capacity, 30)
+    
+    def test_json_time_slots_and_chinese_headers(self):
+        """测试 JSON 时间段目录和中文表头的 CSV"""
+        content = '{"time_slots": [{"name": "上午", "start_time": "08:30", "end_time": "11:30"}, ' \
+                  '{"name": "午间", "start_time": "12:00", "end_time": "13:30", "is_active": false}]}'
+        import_catalog([
+            ('slots.json', content),
+            ('rooms.csv', '自习室名称,容量,位置\n静音室,20,实验楼\n'),
+        ])
+        self.slot_morning.refresh_from_db()
+        self.assertEqual(self.slot_morning.start_time, time(8, 30))
+        self.assertFalse(TimeSlot.objects.get(name='午间').is_active)
+        self.assertEqual(StudyRoom.objects.get(name='静音室').capacity, 20)
+    
+    def test_invalid_rows_write_nothing(self):
+        """测试任意一行无效时整个文件都不写入"""
+        content = 'name,start_time,end_time\n夜间,22:00,21:00\n下午,14:00,17:00\n'
+        with self.assertRaises(CatalogImportError) as raised:
+            import_catalog([('slots.csv', content)])
+        self.assertEqual(len(raised.exception.errors), 1)
+        self.assertIn('第2行', raised.exception.errors[0])
+        self.slot_afternoon.refresh_from_db()
+        self.assertEqual(self.slot_afternoon.start_time, time(14, 0))
+    
+    def test_management_command(self):
+        """测试导入命令和试运行报告"""
+        path = os.path.join(self.tmp_dir, 'rooms.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.ROOMS_CSV)
+        out = StringIO()
+        call_command('import_catalog', path, '--dry-run', stdout=out)
+        self.assertIn('试运行', out.getvalue())
+        self.assertFalse(StudyRoom.objects.filter(name='新建研讨室').exists())
+        call_command('import_catalog', path, stdout=StringIO())
+        self.assertTrue(StudyRoom.objects.filter(name='新建研讨室').exists())
+        with self.assertRaises(CommandError):
+            call_command('import_catalog', os.path.join(self.tmp_dir, 'missing.csv'))
+    
+    def test_admin_upload(self):
+        """测试后台上传导入"""
+        self.client.login(username='superuser', password='testpass123')
+        url = reverse('admin:rooms_catalog_import')
+        self.assertContains(self.client.get(reverse('admin:rooms_studyroom_changelist')), url)
+        upload = SimpleUploadedFile('rooms.csv', self.ROOMS_CSV.encode('utf-8-sig'), content_type='text/csv')
+        response = self.client.post(url, {'file': upload})
+        self.assertContains(response, '自习室：新增 1，更新 1，未变化 1')
+        self.assertTrue(StudyRoom.objects.filter(name='新建研讨室').exists())
+        
+        self.login_student()
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+    
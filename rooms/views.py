@@ -1,16 +1,25 @@
 from django.shortcuts import render
 from django.views.generic import ListView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
-from .models import StudyRoom, TimeSlot
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from bookings.availability import annotate_slots, get_mask, parse_day
+from bookings.conditional import room_detail_page_etag, room_list_page_etag
+from search.index import ROOM, search_queryset
+from .catalog import active_rooms, active_time_slots
+from .models import StudyRoom
 
 
+@method_decorator(condition(etag_func=room_list_page_etag), name='get')
 class RoomListView(LoginRequiredMixin, ListView):
     """自习室列表视图
     
     显示所有活跃的自习室列表，支持搜索功能。
     继承LoginRequiredMixin确保只有登录用户可以访问。
+    按目录版本号发送 ETag，自习室未变化时返回 304。
     """
+    query_budget = 8  # 每个请求最多执行的查询数，见 monitoring.budgets
     model = StudyRoom  # 使用StudyRoom模型
     template_name = 'rooms/room_list.html'  # 指定模板文件
     context_object_name = 'rooms'  # 在模板中使用的变量名
@@ -21,18 +30,14 @@ class RoomListView(LoginRequiredMixin, ListView):
         获取查询集
         
         返回所有活跃的自习室，并根据搜索条件过滤结果。
-        支持按名称、位置和描述进行模糊搜索。
+        搜索通过全文索引匹配名称、位置和描述（支持中文分词），结果按相关度排序；
+        不搜索时直接使用目录缓存。
         """
-        queryset = StudyRoom.objects.filter(is_active=True)  # 只获取活跃的自习室
-        search = self.request.GET.get('search')  # 获取搜索参数
+        search = self.request.GET.get('search', '').strip()  # 获取搜索参数
         if search:
-            # 使用Q对象实现OR查询，搜索名称、位置或描述中包含搜索词的自习室
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(location__icontains=search) |
-                Q(description__icontains=search)
-            )
-        return queryset.order_by('name')  # 按名称排序结果
+            queryset = StudyRoom.objects.filter(is_active=True).order_by('name')  # 只获取活跃的自习室，按名称排序
+            return search_queryset(queryset, ROOM, search, ('name', 'location', 'description'))
+        return active_rooms()  # 目录缓存中的活跃自习室，已按名称排序
     
     def get_context_data(self, **kwargs):
         """
@@ -45,12 +50,15 @@ class RoomListView(LoginRequiredMixin, ListView):
         return context
 
 
+@method_decorator(condition(etag_func=room_detail_page_etag), name='get')
 class RoomDetailView(LoginRequiredMixin, DetailView):
     """自习室详情视图
     
     显示单个自习室的详细信息。
     继承LoginRequiredMixin确保只有登录用户可以访问。
+    按目录版本号和所选日期的占用位图发送 ETag。
     """
+    query_budget = 9  # 每个请求最多执行的查询数，见 monitoring.budgets
     model = StudyRoom  # 使用StudyRoom模型
     template_name = 'rooms/room_detail.html'  # 指定模板文件
     context_object_name = 'room'  # 在模板中使用的变量名
@@ -59,8 +67,12 @@ class RoomDetailView(LoginRequiredMixin, DetailView):
         """
         获取上下文数据
         
-        添加时间段列表到上下文，用于预约时间选择。
+        添加时间段列表到上下文，并根据占用索引标注所选日期各时间段是否可预约。
+        日期通过 ?date=YYYY-MM-DD 指定，默认为今天。
         """
         context = super().get_context_data(**kwargs)  # 获取父类上下文
-        context['time_slots'] = TimeSlot.objects.filter(is_active=True).order_by('start_time')  # 添加可用时间段
+        selected_date = parse_day(self.request.GET.get('date')) or timezone.localdate()
+        time_slots = active_time_slots()  # 目录缓存中的时间段，已按开始时间排序
+        context['selected_date'] = selected_date  # 当前查看的日期
+        context['time_slots'] = annotate_slots(time_slots, get_mask(self.object.pk, selected_date))  # 带可用状态的时间段
         return context
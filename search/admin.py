@@ -0,0 +1,17 @@
+from .index import search_queryset
+
+
+class IndexedSearchAdminMixin:
+    """后台搜索改用全文索引
+
+    search_fields 仍需配置以显示搜索框，并作为不支持 FTS5 时的 icontains 回退。
+    后台列表会按 ordering 重新排序，因此这里只过滤不排序。
+    """
+    search_index_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        fallback = [field.lstrip('^=@') for field in self.get_search_fields(request)]
+        return search_queryset(queryset, self.search_index_kind, search_term, fallback, ranked=False), False
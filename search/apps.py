@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class SearchConfig(AppConfig):
+    """全文搜索应用配置
+
+    为自习室和预约维护 SQLite FTS5 二元分词索引，供列表页和后台搜索使用。
+    """
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "search"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .index import create_tables
+
+        # search 没有模型，不会作为 sender 收到 post_migrate，因此不限定 sender
+        post_migrate.connect(create_tables, dispatch_uid='search.create_tables')
@@ -0,0 +1,171 @@
+"""
+全文搜索索引
+
+每种对象一张 FTS5 虚拟表，rowid 即对象主键，title 列为名称类字段，body 列为
+描述类字段。写入的文本由 tokenizer 预先切成中文二元组，查询时按 bm25 排序
+（title 权重更高）。单条 save()/delete() 由 signals 同步，批量写操作需要自行
+调用 index_bookings/index_documents/reindex_bookings。非 SQLite 数据库回退为 icontains 过滤。
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .tokenizer import index_tokens, match_expression
+
+ROOM, BOOKING = 'room', 'booking'
+TABLES = {
+    ROOM: 'search_room_fts',
+    BOOKING: 'search_booking_fts',
+}
+# bm25 中 title 与 body 列的权重
+COLUMN_WEIGHTS = (10.0, 1.0)
+CHUNK_SIZE = 1000
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def create_tables(sender=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """创建（已存在则跳过）索引表，post_migrate 的接收者
+
+    索引表由 search 的迁移创建并回填。未运行迁移建立的数据库（如 pytest 的
+    --nomigrations）也需要这些表，否则每次保存自习室和预约都会出错；这种情况下
+    表是空的，已有数据需执行 rebuild_search_index。
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for table in TABLES.values():
+            cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(title, body)')
+
+
+def room_document(room):
+    return room.pk, index_tokens(room.name), index_tokens(room.location, room.description, room.equipment)
+
+
+def booking_document(pk, username, room_name, purpose):
+    return pk, index_tokens(username, room_name), index_tokens(purpose)
+
+
+def index_documents(kind, documents, created=False):
+    """写入 (rowid, title, body) 文档，已存在的先删除；created 为 True 表示均为新对象，跳过删除"""
+    documents = list(documents)
+    if not documents or not is_enabled():
+        return
+    table = TABLES[kind]
+    with connection.cursor() as cursor:
+        if not created:
+            _delete(cursor, table, [pk for pk, _, _ in documents])
+        cursor.executemany(f'INSERT INTO {table}(rowid, title, body) VALUES (%s, %s, %s)', documents)
+
+
+def _delete(cursor, table, ids):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({placeholders})', chunk)
+
+
+def index_rooms(rooms, created=False):
+    index_documents(ROOM, (room_document(room) for room in rooms), created)
+
+
+def index_bookings(bookings, created=False):
+    """索引已关联 user 和 room 对象的预约实例，不额外查询"""
+    index_documents(
+        BOOKING,
+        (booking_document(b.pk, b.user.username, b.room.name, b.purpose) for b in bookings),
+        created,
+    )
+
+
+def reindex_bookings(queryset):
+    """按查询集重建预约索引，用户名和自习室名称通过一次联表查询读取"""
+    rows = queryset.order_by().values_list('pk', 'user__username', 'room__name', 'purpose')
+    index_documents(BOOKING, (booking_document(*row) for row in rows.iterator(chunk_size=CHUNK_SIZE)))
+
+
+def remove(kind, ids):
+    if ids and is_enabled():
+        with connection.cursor() as cursor:
+            _delete(cursor, TABLES[kind], list(ids))
+
+
+def rebuild_index():
+    """清空并重建全部索引，返回 {类型: 文档数}
+
+    在一个事务中分块写入：自动提交模式下每行插入都是一次提交，百万级预约时极慢。
+    """
+    from bookings.models import Booking
+    from rooms.models import StudyRoom
+
+    if not is_enabled():
+        return {}
+    rows = Booking.objects.order_by().values_list('pk', 'user__username', 'room__name', 'purpose')
+    documents = (booking_document(*row) for row in rows.iterator(chunk_size=CHUNK_SIZE))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for table in TABLES.values():
+                cursor.execute(f'DELETE FROM {table}')
+        index_rooms(StudyRoom.objects.order_by().iterator(chunk_size=CHUNK_SIZE), created=True)
+        while chunk := list(islice(documents, CHUNK_SIZE)):
+            index_documents(BOOKING, chunk, created=True)
+    return {kind: _count(table) for kind, table in TABLES.items()}
+
+
+def _count(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        return cursor.fetchone()[0]
+
+
+def search_ids(kind, query, limit=None):
+    """返回按相关度排序的对象主键列表，最多 limit 条"""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    limit = limit or settings.SEARCH_MAX_RESULTS
+    table = TABLES[kind]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s '
+            f'ORDER BY bm25({table}, %s, %s) LIMIT %s',
+            [expression, *COLUMN_WEIGHTS, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_queryset(queryset, kind, query, fallback_fields=(), ranked=True):
+    """按搜索词过滤查询集
+
+    匹配条件是对索引表的子查询，不限制条数，与调用方的其他过滤条件在同一条
+    SQL 中生效；需要限制条数的调用方在全部过滤之后切片。ranked 为 True 时结果
+    按相关度排序，否则保留查询集原有排序。
+    不支持 FTS5 的数据库对 fallback_fields 做 icontains 过滤。
+    """
+    if not is_enabled():
+        condition = Q()
+        for field in fallback_fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition)
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    table = TABLES[kind]
+    queryset = queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [expression]))
+    if ranked:
+        # 按 rowid 相关子查询计算 bm25，FTS5 直接定位该行，不重新扫描全部匹配
+        meta, qn = queryset.model._meta, connection.ops.quote_name
+        rank = RawSQL(
+            f'SELECT bm25({table}, %s, %s) FROM {table} WHERE {table} MATCH %s '
+            f'AND rowid = {qn(meta.db_table)}.{qn(meta.pk.column)}',
+            [*COLUMN_WEIGHTS, expression],
+            output_field=FloatField(),
+        )
+        queryset = queryset.annotate(search_rank=rank).order_by('search_rank', 'pk')
+    return queryset
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from search.index import rebuild_index
+
+
+class Command(BaseCommand):
+    """重建全文搜索索引
+
+    索引由 save()/delete() 信号和批量写操作同步维护，直接修改数据库后执行。
+    """
+    help = '根据自习室和预约数据重建全文搜索索引'
+
+    def handle(self, *args, **options):
+        counts = rebuild_index()
+        if not counts:
+            self.stdout.write(self.style.WARNING('当前数据库不支持 FTS5，搜索使用 icontains 回退'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'搜索索引已重建：自习室 {counts["room"]} 条，预约 {counts["booking"]} 条'
+        ))
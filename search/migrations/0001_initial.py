@@ -0,0 +1,49 @@
+from django.db import migrations
+
+from search.tokenizer import index_tokens
+
+TABLES = ('search_room_fts', 'search_booking_fts')
+
+
+def create_index(apps, schema_editor):
+    # FTS5 虚拟表只在 SQLite 上创建，其他数据库回退为 icontains 过滤
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in TABLES:
+        # 表可能已由 post_migrate 提前创建（见 search.index.create_tables）
+        schema_editor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(title, body)')
+        schema_editor.execute(f'DELETE FROM {table}')
+
+    StudyRoom = apps.get_model('rooms', 'StudyRoom')
+    Booking = apps.get_model('bookings', 'Booking')
+    insert = 'INSERT INTO {}(rowid, title, body) VALUES (%s, %s, %s)'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(insert.format('search_room_fts'), [
+            (room.pk, index_tokens(room.name), index_tokens(room.location, room.description, room.equipment))
+            for room in StudyRoom.objects.all()
+        ])
+        rows = Booking.objects.values_list('pk', 'user__username', 'room__name', 'purpose')
+        cursor.executemany(insert.format('search_booking_fts'), [
+            (pk, index_tokens(username, room_name), index_tokens(purpose))
+            for pk, username, room_name, purpose in rows
+        ])
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('rooms', '0002_active_partial_indexes'),
+        ('bookings', '0008_keyset_ascending_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
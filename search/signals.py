@@ -0,0 +1,76 @@
+"""
+搜索索引同步
+
+自习室、预约保存或删除时更新对应的索引文档。自习室改名、用户改名会影响
+预约文档的 title，需要重建相关预约的索引。
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from bookings.models import Booking
+from rooms.models import StudyRoom
+from . import index
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=StudyRoom)
+def remember_room_name(sender, instance, raw=False, **kwargs):
+    """记录保存前的名称，用于判断是否需要重建该自习室的预约索引"""
+    if raw or instance.pk is None:
+        return
+    instance._indexed_name = StudyRoom.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=StudyRoom)
+def index_room(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    index.index_rooms([instance], created=created)
+    old_name = getattr(instance, '_indexed_name', None)
+    if not created and old_name is not None and old_name != instance.name:
+        index.reindex_bookings(Booking.objects.filter(room=instance))
+    instance._indexed_name = instance.name
+
+
+@receiver(post_delete, sender=StudyRoom)
+def unindex_room(sender, instance, **kwargs):
+    index.remove(index.ROOM, [instance.pk])
+
+
+@receiver(post_save, sender=Booking)
+def index_booking(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'user', 'room', 'purpose'} & set(update_fields):
+        return
+    index.index_bookings([instance], created=created)
+
+
+@receiver(post_delete, sender=Booking)
+def unindex_booking(sender, instance, **kwargs):
+    index.remove(index.BOOKING, [instance.pk])
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, raw=False, update_fields=None, **kwargs):
+    """记录保存前的用户名，用于判断是否需要重建该用户的预约索引"""
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        # 如登录时只更新 last_login，不读取旧值
+        instance._indexed_username = instance.username
+        return
+    instance._indexed_username = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def reindex_user_bookings(sender, instance, created, raw=False, **kwargs):
+    """用户名写入预约文档，用户名变化后重建其预约索引"""
+    if raw or created:
+        return
+    old_username = getattr(instance, '_indexed_username', None)
+    if old_username is not None and old_username != instance.username:
+        index.reindex_bookings(Booking.objects.filter(user=instance))
+    instance._indexed_username = instance.username
@@ -0,0 +1,179 @@
+"""
+全文搜索测试
+"""
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from tests.base import BaseTestCase
+from bookings.models import Booking
+from bookings.services import apply_booking_batch
+from rooms.models import StudyRoom
+from .index import BOOKING, ROOM, TABLES, create_tables, rebuild_index, reindex_bookings, search_ids
+from .tokenizer import index_tokens, match_expression
+
+
+class TokenizerTest(BaseTestCase):
+    """分词测试"""
+
+    def test_chinese_unigrams_and_bigrams(self):
+        """测试中文切分为单字和二元组，英文数字保留为单词"""
+        tokens = index_tokens('图书馆一楼A区').split()
+        self.assertIn('图书', tokens)
+        self.assertIn('一楼', tokens)
+        self.assertIn('馆', tokens)
+        self.assertIn('a', tokens)
+        self.assertIn('区', tokens)
+
+    def test_match_expression(self):
+        """测试查询转换为二元组 AND 和英文前缀匹配"""
+        self.assertEqual(match_expression('图书馆'), '"图书" "书馆"')
+        self.assertEqual(match_expression('楼'), '"楼"')
+        self.assertEqual(match_expression('Room 10'), '"room"* "10"*')
+        # 全角字符归一化，标点忽略
+        self.assertEqual(match_expression('ＡＢ！'), '"ab"*')
+        self.assertEqual(match_expression('"*()'), '')
+
+
+class SearchIndexTest(BaseTestCase):
+    """索引同步和排序测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.library = StudyRoom.objects.create(
+            name='阅览室', description='靠窗座位', capacity=20, location='图书馆一楼A区'
+        )
+
+    def test_search_chinese_segments(self):
+        """测试连续中文的任意片段都能检索到"""
+        for query in ('一楼', 'A区', '图书馆', '馆一', '阅览'):
+            self.assertEqual(search_ids(ROOM, query), [self.library.pk], query)
+        self.assertEqual(search_ids(ROOM, '二楼'), [])
+
+    def test_sync_on_save_and_delete(self):
+        """测试保存和删除时同步索引"""
+        self.library.location = '实验楼二楼'
+        self.library.save()
+        self.assertEqual(search_ids(ROOM, '一楼'), [])
+        self.assertEqual(search_ids(ROOM, '二楼'), [self.library.pk])
+
+        pk = self.library.pk
+        self.library.delete()
+        self.assertEqual(search_ids(ROOM, '二楼'), [])
+        self.assertNotIn(pk, search_ids(ROOM, '阅览'))
+
+    def test_title_ranks_higher(self):
+        """测试名称匹配排在描述匹配之前"""
+        described = StudyRoom.objects.create(
+            name='静音室', description='阅览和自习均可', capacity=10, location='实验楼'
+        )
+        self.assertEqual(search_ids(ROOM, '阅览'), [self.library.pk, described.pk])
+
+    def test_booking_index_follows_renames(self):
+        """测试自习室和用户改名后预约索引随之更新"""
+        booking = self.create_test_booking(room=self.library)
+        self.assertEqual(search_ids(BOOKING, '阅览'), [booking.pk])
+        self.assertEqual(search_ids(BOOKING, 'student'), [booking.pk])
+
+        self.library.name = '研讨室'
+        self.library.save()
+        self.assertEqual(search_ids(BOOKING, '阅览'), [])
+        self.assertEqual(search_ids(BOOKING, '研讨'), [booking.pk])
+
+        self.student_user.username = 'renamed'
+        self.student_user.save()
+        self.assertEqual(search_ids(BOOKING, 'student'), [])
+        self.assertEqual(search_ids(BOOKING, 'renamed'), [booking.pk])
+
+    def test_profile_save_without_rename_skips_reindex(self):
+        """测试用户名未变的资料保存不重建预约索引"""
+        self.create_test_booking(room=self.library)
+        self.student_user.email = 'changed@test.com'
+        with CaptureQueriesContext(connection) as queries:
+            self.student_user.save()
+        self.assertFalse(any('search_booking_fts' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(search_ids(BOOKING, 'student'), [Booking.objects.get().pk])
+
+    def test_tables_created_without_migrations(self):
+        """测试未运行迁移建立的数据库在 post_migrate 时补建索引表"""
+        with connection.cursor() as cursor:
+            for table in TABLES.values():
+                cursor.execute(f'DROP TABLE {table}')
+        create_tables(using=connection.alias)
+        create_tables(using=connection.alias)
+        room = StudyRoom.objects.create(name='研讨间', description='白板', capacity=6, location='二号楼')
+        self.assertEqual(search_ids(ROOM, '研讨'), [room.pk])
+
+    def test_bulk_writes_are_indexed(self):
+        """测试批量创建的预约写入索引"""
+        day = timezone.localdate() + timedelta(days=1)
+        results = apply_booking_batch(self.student_user, [{
+            'op': 'create', 'room_id': self.room2.pk, 'time_slot_id': self.slot_morning.pk,
+            'date': day, 'purpose': '小组讨论期末复习', 'participants': 3,
+        }])
+        self.assertEqual(search_ids(BOOKING, '期末'), [results[0]['id']])
+
+    def test_rebuild_index(self):
+        """测试重建索引"""
+        booking = self.create_test_booking(room=self.library)
+        Booking.objects.filter(pk=booking.pk).update(purpose='数学建模')
+        self.assertEqual(search_ids(BOOKING, '建模'), [])
+        counts = rebuild_index()
+        self.assertEqual(counts, {ROOM: StudyRoom.objects.count(), BOOKING: 1})
+        self.assertEqual(search_ids(BOOKING, '建模'), [booking.pk])
+
+
+class SearchViewTest(BaseTestCase):
+    """列表页和后台搜索测试"""
+
+    def test_room_list_search(self):
+        """测试自习室列表通过索引搜索"""
+        self.login_student()
+        response = self.client.get(reverse('rooms:room_list'), {'search': '讨论'})
+        self.assertEqual(list(response.context['rooms']), [self.room2])
+        # 停用的自习室即使匹配也不显示
+        response = self.client.get(reverse('rooms:room_list'), {'search': '机房'})
+        self.assertEqual(list(response.context['rooms']), [])
+
+    def test_admin_booking_list_search(self):
+        """测试管理员预约列表按相关度显示搜索结果"""
+        in_purpose = self.create_test_booking(room=self.room1)
+        Booking.objects.filter(pk=in_purpose.pk).update(purpose='讨论课题')
+        in_room = self.create_test_booking(room=self.room2)
+        self.create_test_booking(room=self.room1, time_slot=self.slot_afternoon)
+        reindex_bookings(Booking.objects.filter(pk=in_purpose.pk))
+
+        self.login_admin()
+        response = self.client.get(reverse('bookings:admin_booking_list'), {'search': '讨论'})
+        self.assertEqual(list(response.context['bookings']), [in_room, in_purpose])
+        self.assertFalse(response.context['is_paginated'])
+
+    @override_settings(SEARCH_MAX_RESULTS=2)
+    def test_admin_search_filters_before_limit(self):
+        """测试状态筛选在条数限制之前生效：相关度更高的其他状态预约不会挤掉待审批的预约"""
+        day = timezone.localdate() + timedelta(days=1)
+        for slot in (self.slot_morning, self.slot_afternoon, self.slot_evening):
+            booking = self.create_test_booking(room=self.room1, time_slot=slot, booking_date=day, status='confirmed')
+            Booking.objects.filter(pk=booking.pk).update(purpose='期末复习')
+        pending = self.create_test_booking(room=self.room2, status='pending')
+        Booking.objects.filter(pk=pending.pk).update(purpose='期末复习，顺便讨论课程设计和实验报告的分工安排')
+        reindex_bookings(Booking.objects.all())
+
+        self.login_admin()
+        url = reverse('bookings:admin_booking_list')
+        response = self.client.get(url, {'search': '期末', 'status': 'pending'})
+        self.assertEqual(list(response.context['bookings']), [pending])
+        # 不筛选时限制在过滤之后生效
+        self.assertEqual(len(self.client.get(url, {'search': '期末'}).context['bookings']), 2)
+
+    def test_django_admin_search(self):
+        """测试后台管理搜索使用索引"""
+        self.client.login(username='superuser', password='testpass123')
+        response = self.client.get(reverse('admin:rooms_studyroom_changelist'), {'q': 'A-201'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.room2])
+        booking = self.create_test_booking(room=self.room2)
+        response = self.client.get(reverse('admin:bookings_booking_changelist'), {'q': '讨论室'})
+        self.assertEqual(list(response.context['cl'].result_list), [booking])
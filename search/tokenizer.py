@@ -0,0 +1,49 @@
+"""
+中文友好的分词
+
+SQLite 自带的 unicode61 分词器按空白和标点切分，无法切分"图书馆一楼A区"这样
+连续的中文。写入索引前先在 Python 中分词：连续的中日韩文字切成单字和相邻
+二元组（bigram），英文和数字按单词保留，再以空格连接交给 FTS5。
+"""
+import re
+import unicodedata
+
+CJK_RANGES = '㐀-䶿一-鿿豈-﫿'
+TOKEN_RE = re.compile(f'[{CJK_RANGES}]+|[0-9a-z]+')
+CJK_RE = re.compile(f'[{CJK_RANGES}]')
+
+
+def _normalize(text):
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def _bigrams(run):
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def index_tokens(*parts):
+    """生成写入索引的分词文本：中文为单字加二元组，英文数字为单词"""
+    tokens = []
+    for part in parts:
+        for run in TOKEN_RE.findall(_normalize(part)):
+            if CJK_RE.match(run):
+                tokens.extend(run)
+                tokens.extend(_bigrams(run))
+            else:
+                tokens.append(run)
+    return ' '.join(tokens)
+
+
+def match_expression(query):
+    """将用户输入转换为 FTS5 MATCH 表达式，无可搜索内容时返回空字符串
+
+    中文取二元组（单个汉字取单字），各词之间为 AND；英文数字按前缀匹配，
+    便于边输入边搜索。
+    """
+    terms = []
+    for run in TOKEN_RE.findall(_normalize(query)):
+        if CJK_RE.match(run):
+            terms.extend(f'"{token}"' for token in (_bigrams(run) or [run]))
+        else:
+            terms.append(f'"{run}"*')
+    return ' '.join(terms)
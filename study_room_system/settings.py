@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,11 +43,19 @@ INSTALLED_APPS = [
     "accounts",
     "rooms",
     "bookings",
+    "search",  # 全文搜索索引
+    "monitoring",  # 查询预算等性能监控
     "tests",  # 添加tests应用
     "test_dashboard",  # 添加测试仪表板应用
 ]
 
 MIDDLEWARE = [
+    # 开发环境检查视图查询预算，需在最前面以统计整个请求
+    "monitoring.middleware.QueryBudgetMiddleware",
+    # 按路由的延迟直方图和计数器（/monitoring/metrics/）
+    "monitoring.middleware.MetricsMiddleware",
+    # 请求耗时分解（Server-Timing 响应头）
+    "monitoring.middleware.ServerTimingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -61,7 +70,7 @@ ROOT_URLCONF = "study_room_system.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "monitoring.backends.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -178,3 +187,42 @@ LOGOUT_REDIRECT_URL = '/accounts/login/'
 
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
+
+# 时间段占用索引预建天数
+AVAILABILITY_PREBUILD_DAYS = 14
+
+# 可用性矩阵API单次查询的最大天数
+AVAILABILITY_GRID_MAX_DAYS = 31
+
+# 批量预约API单次请求的最大操作数
+BOOKING_BATCH_MAX_OPERATIONS = 500
+
+# 周期预约提前生成预约行的天数，之后的日期只按规则占用
+BOOKING_SERIES_HORIZON_DAYS = 14
+
+# 预约导出每批读取的行数
+BOOKING_EXPORT_CHUNK_SIZE = 2000
+
+# 搜索最多返回的结果数（按相关度排序）
+SEARCH_MAX_RESULTS = 200
+
+# 是否检查视图的查询预算（超出时抛出异常），默认只在开发环境检查
+QUERY_BUDGET_ENFORCE = DEBUG
+
+# 是否在响应中添加 Server-Timing 头，以及每个视图保留的最近请求数
+SERVER_TIMING_ENABLED = True
+SERVER_TIMING_BUFFER_SIZE = 200
+
+# Prometheus 指标：各 worker 进程的累计值写入 METRICS_DIR 供抓取时合并，
+# 写入间隔为 METRICS_FLUSH_INTERVAL 秒；设置 METRICS_TOKEN 后抓取方可用
+# Authorization: Bearer <METRICS_TOKEN> 访问，否则只有管理员可以访问
+METRICS_ENABLED = True
+METRICS_DIR = Path(tempfile.gettempdir()) / "study_room_metrics"
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_TOKEN = ""
+
+# 慢查询日志：不少于 SLOW_QUERY_THRESHOLD_MS 毫秒的查询连同查询计划写入
+# SLOW_QUERY_LOG，超过 SLOW_QUERY_LOG_MAX_BYTES 时轮转；阈值为 None 时不记录
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = Path(tempfile.gettempdir()) / "study_room_slow_queries.jsonl"
+SLOW_QUERY_LOG_MAX_BYTES = 1024 * 1024
@@ -47,6 +47,9 @@ MEDIA_ROOT = '/tmp/test_media/'
 
 # 加速测试的中间件设置
 MIDDLEWARE = [
+    'monitoring.middleware.QueryBudgetMiddleware',
+    'monitoring.middleware.MetricsMiddleware',
+    'monitoring.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +58,13 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
 ]
 
+# 测试中检查视图的查询预算
+QUERY_BUDGET_ENFORCE = True
+
+# 测试的指标文件与运行中的服务分开
+METRICS_DIR = Path(tempfile.gettempdir()) / 'study_room_test_metrics'
+SLOW_QUERY_LOG = Path(tempfile.gettempdir()) / 'study_room_test_slow_queries.jsonl'
+
 # 测试时使用的秘钥
 SECRET_KEY = 'test-secret-key-for-testing-only'
 
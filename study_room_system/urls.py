@@ -24,9 +24,11 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("", include("rooms.urls", namespace="rooms")),
     path("bookings/", include("bookings.urls", namespace="bookings")),
+    path("api/", include("bookings.api_urls", namespace="api")),
     path("accounts/", include("accounts.urls", namespace="accounts")),
     path("accounts/", include("django.contrib.auth.urls")),
     path("tests/", include("test_dashboard.urls", namespace="tests")),
+    path("monitoring/", include("monitoring.urls", namespace="monitoring")),
 ]
 
 # 开发环境下提供媒体文件的服务
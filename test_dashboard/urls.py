@@ -9,4 +9,6 @@ urlpatterns = [
     path('detail/<int:test_id>/', views.test_detail, name='test_detail'),
     path('progress/<int:test_id>/', views.test_progress, name='test_progress'),
     path('results/<int:test_id>/', views.test_results, name='test_results'),
+    path('slow-queries/', views.slow_queries, name='slow_queries'),
+    path('slow-queries/clear/', views.slow_queries_clear, name='slow_queries_clear'),
 ]
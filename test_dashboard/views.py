@@ -4,7 +4,11 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.http import require_POST
 from django.urls import reverse
 from django.contrib import messages
+from django.conf import settings
 
+from datetime import datetime, timezone as dt_timezone
+
+from monitoring.slowlog import clear_slow_queries, read_slow_queries, summarize_slow_queries
 from .models import TestRun, TestResult
 from .test_manager import TestManager
 
@@ -106,3 +110,25 @@ def test_results(request, test_id):
         })
     
     return JsonResponse(data)
+
+
+@user_passes_test(is_admin)
+def slow_queries(request):
+    """慢查询日志：按语句汇总及最近的记录（含查询计划），记录中有查询参数，仅管理员可见"""
+    records = read_slow_queries()
+    for record in records:
+        record['time'] = datetime.fromtimestamp(record['at'], tz=dt_timezone.utc)
+    return render(request, 'test_dashboard/slow_queries.html', {
+        'summary': summarize_slow_queries(records),
+        'records': records[:50],
+        'threshold': settings.SLOW_QUERY_THRESHOLD_MS,
+    })
+
+
+@user_passes_test(is_admin)
+@require_POST
+def slow_queries_clear(request):
+    """清空慢查询日志"""
+    clear_slow_queries()
+    messages.success(request, '慢查询日志已清空')
+    return redirect('tests:slow_queries')
@@ -7,6 +7,7 @@ from django.urls import reverse
 from django.utils import timezone
 from datetime import datetime, date, time, timedelta
 import json
+import re
 
 from accounts.models import User
 from rooms.models import StudyRoom, TimeSlot
@@ -213,6 +214,23 @@ class APITestMixin:
         self.assertEqual(response.status_code, status_code)
 
 
+class QueryPlanMixin:
+    """查询计划断言混入类（SQLite EXPLAIN QUERY PLAN）"""
+    
+    # "SCAN 表名" 后没有 USING INDEX 即为全表扫描
+    FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)')
+    
+    def assert_uses_index(self, queryset, index_name, allow_sort=False):
+        """断言查询使用指定索引且没有全表扫描，返回查询计划"""
+        plan = queryset.explain()
+        full_scan = self.FULL_SCAN.search(plan + '\n')
+        self.assertIsNone(full_scan, f'查询回退到全表扫描:\n{plan}\n{queryset.query}')
+        self.assertIn(index_name, plan, f'查询未使用索引 {index_name}:\n{plan}')
+        if not allow_sort:
+            self.assertNotIn('TEMP B-TREE', plan, f'查询需要额外排序:\n{plan}')
+        return plan
+
+
 class TestDataFactory:
     """测试数据工厂类"""
     
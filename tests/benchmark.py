@@ -0,0 +1,320 @@
+"""
+接口基准测试
+
+覆盖 rooms、bookings、api、accounts、monitoring 各组 URL 的每个路由。每个用例先预热，再重复
+请求若干次，统计 p50/p95/p99 延迟和每次请求的查询次数，结果可保存为 JSON 基线，
+之后与基线比较，延迟或查询次数超过阈值即视为性能回退。
+
+写操作用例在事务中执行并在计时后回滚，重复执行时数据保持不变。
+"""
+import json
+import statistics
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings.models import Booking, BookingSeries
+from bookings.services import create_series
+from monitoring.budgets import QueryBudgetExceeded, declared_budget
+from rooms import catalog
+from rooms.models import StudyRoom, TimeSlot
+
+User = get_user_model()
+
+# 需要覆盖的 URL 配置：模块 -> 命名空间
+URLCONFS = {
+    'rooms.urls': 'rooms',
+    'bookings.urls': 'bookings',
+    'bookings.api_urls': 'api',
+    'accounts.urls': 'accounts',
+    'monitoring.urls': 'monitoring',
+}
+ANONYMOUS, STUDENT, TEACHER, ADMIN = 'anonymous', 'student', 'teacher', 'admin'
+PERCENTILES = ('p50', 'p95', 'p99')
+
+
+class Case:
+    """一个基准用例：以某个角色请求一个命名 URL"""
+
+    def __init__(self, url_name, role=STUDENT, method='GET', kwargs=None, query=None, data=None,
+                 json_body=False, label=None, resets_session=False, expect=None):
+        self.url_name = url_name
+        self.role = role
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.query = query or {}
+        self.data = data
+        self.json_body = json_body
+        self.resets_session = resets_session
+        # 预期状态码：页面和查询 200，JSON 创建 201，表单提交成功后重定向
+        self.expect = expect or (200 if method == 'GET' else 201 if json_body else 302)
+        suffix = '&'.join(f'{key}={value}' for key, value in self.query.items())
+        self.label = label or f'{method} {url_name}' + (f'?{suffix}' if suffix else '')
+
+    @property
+    def is_write(self):
+        return self.method != 'GET'
+
+    def request(self, client):
+        path = reverse(self.url_name, kwargs=self.kwargs)
+        if self.method == 'GET':
+            return client.get(path, self.query)
+        send = getattr(client, self.method.lower())
+        if self.json_body:
+            return send(path, json.dumps(self.data), content_type='application/json')
+        return send(path, self.data or {})
+
+
+class Fixtures:
+    """从当前数据库中选出基准用例使用的用户、自习室和预约"""
+
+    def __init__(self, password):
+        self.password = password
+        self.today = timezone.localdate()
+        active = Q(booking__status__in=Booking.ACTIVE_STATUSES)
+        self.student = self._busiest(User.objects.filter(user_type='student', is_active=True), active)
+        self.teacher = User.objects.filter(user_type='teacher', is_active=True).order_by('pk').first()
+        self.admin = User.objects.filter(user_type='admin', is_active=True).order_by('pk').first()
+        self.room = self._busiest(StudyRoom.objects.filter(is_active=True), Q(booking__date__gte=self.today))
+        self.slot = TimeSlot.objects.filter(is_active=True).order_by('start_time').first()
+        self.booking = (
+            Booking.objects.filter(user=self.student, status__in=Booking.ACTIVE_STATUSES, date__gte=self.today)
+            .order_by('date').first()
+            or Booking.objects.filter(user=self.student).order_by('-pk').first()
+        )
+        self.pending = Booking.objects.filter(status='pending', date__gte=self.today).order_by('date').first()
+        # 数据集之后的日期一定空闲，写操作用例在这里预约
+        last_day = Booking.objects.order_by('-date').values_list('date', flat=True).first() or self.today
+        self.free_day = max(last_day, self.today) + timedelta(days=7)
+        self.series = self._series()
+
+    @staticmethod
+    def _busiest(queryset, condition):
+        return queryset.annotate(n=Count('booking', filter=condition)).order_by('-n', 'pk').first()
+
+    def _series(self):
+        series = BookingSeries.objects.filter(user=self.teacher, status='active').first()
+        if series is None:
+            start = self.free_day + timedelta(days=7)
+            series = create_series(BookingSeries(
+                user=self.teacher, room=self.room, time_slot=self.slot,
+                start_date=start, end_date=start + timedelta(weeks=3), purpose='基准测试周期预约',
+            ))
+        return series
+
+    def user(self, role):
+        return {STUDENT: self.student, TEACHER: self.teacher, ADMIN: self.admin}.get(role)
+
+
+def cases(f):
+    """全部基准用例，f 为 Fixtures"""
+    day, free_day = (f.today + timedelta(days=1)).isoformat(), f.free_day.isoformat()
+    create = {'time_slot': f.slot.pk, 'date': free_day, 'purpose': '基准测试', 'participants': 1}
+    api_create = {'room_id': f.room.pk, 'time_slot_id': f.slot.pk, 'date': free_day, 'purpose': '基准测试'}
+    series_start = f.free_day + timedelta(days=42)
+    return [
+        # rooms
+        Case('rooms:room_list'),
+        Case('rooms:room_list', query={'search': '自习'}),
+        Case('rooms:room_detail', kwargs={'pk': f.room.pk}),
+        # bookings
+        Case('bookings:booking_list'),
+        Case('bookings:booking_create', kwargs={'room_id': f.room.pk}),
+        Case('bookings:booking_create', method='POST', kwargs={'room_id': f.room.pk}, data=create),
+        Case('bookings:series_create', role=TEACHER, kwargs={'room_id': f.room.pk}),
+        Case('bookings:series_create', role=TEACHER, method='POST', kwargs={'room_id': f.room.pk}, data={
+            'time_slot': f.slot.pk, 'start_date': series_start.isoformat(),
+            'end_date': (series_start + timedelta(weeks=3)).isoformat(),
+            'interval_weeks': 1, 'purpose': '基准测试', 'participants': 1,
+        }),
+        Case('bookings:series_cancel', role=TEACHER, method='POST', kwargs={'pk': f.series.pk}),
+        Case('bookings:booking_detail', kwargs={'pk': f.booking.pk}),
+        Case('bookings:booking_cancel', method='POST', kwargs={'pk': f.booking.pk}),
+        Case('bookings:admin_booking_list', role=ADMIN),
+        Case('bookings:admin_booking_list', role=ADMIN, query={'status': 'pending'}),
+        Case('bookings:admin_booking_list', role=ADMIN, query={'search': f.room.name}),
+        Case('bookings:booking_export', role=ADMIN, query={'format': 'csv', 'date': day}),
+        Case('bookings:booking_batch_approve', role=ADMIN, method='POST', data={
+            'action': 'approve', 'booking_ids': [f.pending.pk] if f.pending else [],
+        }),
+        Case('bookings:booking_approve', role=ADMIN, method='POST', kwargs={'pk': (f.pending or f.booking).pk}),
+        # api
+        Case('api:room_list'),
+        Case('api:room_detail', kwargs={'pk': f.room.pk}),
+        Case('api:booking_list_create'),
+        Case('api:booking_list_create', query={'fields': 'id,status,date,room,time_slot'}),
+        Case('api:booking_list_create', method='POST', data=api_create, json_body=True),
+        Case('api:booking_batch', method='POST', json_body=True, expect=200, data={'operations': [
+            {'op': 'create', **api_create},
+            {'op': 'create', **api_create, 'date': (f.free_day + timedelta(days=1)).isoformat()},
+        ]}),
+        Case('api:booking_detail', kwargs={'pk': f.booking.pk}),
+        Case('api:timeslot_list'),
+        Case('api:available_slots', kwargs={'room_id': f.room.pk, 'date': day}),
+        Case('api:availability_grid'),
+        # accounts
+        Case('accounts:login', role=ANONYMOUS),
+        Case('accounts:login', role=ANONYMOUS, method='POST', resets_session=True, data={
+            'username': f.student.username, 'password': f.password,
+        }),
+        Case('accounts:logout', method='POST', resets_session=True),
+        Case('accounts:register', role=ANONYMOUS),
+        Case('accounts:register', role=ANONYMOUS, method='POST', resets_session=True, data={
+            'username': 'benchmark_new_user', 'email': 'benchmark@example.com', 'user_type': 'student',
+            'password1': 'Qz7#pLm2xV9w', 'password2': 'Qz7#pLm2xV9w',
+        }),
+        Case('accounts:profile'),
+        # monitoring
+        Case('monitoring:metrics', role=ADMIN),
+    ]
+
+
+def uncovered_patterns(case_list):
+    """URLCONFS 中没有基准用例的路由名称"""
+    names = {
+        f'{namespace}:{pattern.name}'
+        for module, namespace in URLCONFS.items()
+        for pattern in import_module(module).urlpatterns
+    }
+    return sorted(names - {case.url_name for case in case_list})
+
+
+def unbudgeted_patterns():
+    """URLCONFS 中没有声明查询预算的路由名称"""
+    return sorted(
+        f'{namespace}:{pattern.name}'
+        for module, namespace in URLCONFS.items()
+        for pattern in import_module(module).urlpatterns
+        if declared_budget(pattern.callback) is None
+    )
+
+
+def budget_violations(runner, case_list):
+    """在目录缓存失效后逐个执行用例一次，返回超出查询预算的报告
+
+    需要启用 QueryBudgetMiddleware（QUERY_BUDGET_ENFORCE 为 True），测试客户端会
+    重新抛出中间件的 QueryBudgetExceeded。
+    """
+    violations = []
+    for case in case_list:
+        # 缓存未命中时查询最多，按最坏情况检查
+        catalog.invalidate()
+        try:
+            runner.run_once(case)
+        except QueryBudgetExceeded as exc:
+            violations.append(str(exc))
+    return violations
+
+
+class Runner:
+    """按角色复用已登录的客户端执行用例"""
+
+    def __init__(self, fixtures, warmup=3, runs=30, log=None):
+        self.fixtures = fixtures
+        self.warmup = warmup
+        self.runs = runs
+        self.log = log or (lambda message: None)
+        self.clients = {}
+
+    def client(self, role, fresh=False):
+        if fresh or role not in self.clients:
+            client = Client()
+            user = self.fixtures.user(role)
+            if user is not None:
+                client.force_login(user)
+            self.clients[role] = client
+        return self.clients[role]
+
+    def run_once(self, case):
+        """执行一次用例，返回 (毫秒, 查询次数, 状态码)"""
+        client = self.client(case.role)
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = case.request(client)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            if case.is_write:
+                transaction.set_rollback(True)
+        if case.resets_session:
+            self.client(case.role, fresh=True)
+        return elapsed * 1000, len(queries), response.status_code
+
+    def run(self, case):
+        for _ in range(self.warmup):
+            self.run_once(case)
+        samples, query_counts, statuses = [], [], set()
+        for _ in range(self.runs):
+            elapsed, queries, status = self.run_once(case)
+            samples.append(elapsed)
+            query_counts.append(queries)
+            statuses.add(status)
+        result = summarize(samples)
+        result.update(
+            method=case.method,
+            queries=max(query_counts),
+            status=max(statuses, key=lambda status: status != case.expect),
+            ok=statuses == {case.expect},
+        )
+        self.log(format_result(case.label, result))
+        return result
+
+    def run_all(self, case_list):
+        return {case.label: self.run(case) for case in case_list}
+
+
+def summarize(samples):
+    """延迟样本（毫秒）的 p50/p95/p99 和平均值"""
+    if len(samples) > 1:
+        cuts = statistics.quantiles(samples, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = samples[0]
+    return {
+        'runs': len(samples),
+        'p50': round(p50, 3),
+        'p95': round(p95, 3),
+        'p99': round(p99, 3),
+        'mean': round(statistics.fmean(samples), 3),
+    }
+
+
+def format_result(label, result):
+    line = (
+        f'{label:<60} p50 {result["p50"]:8.2f}ms  p95 {result["p95"]:8.2f}ms  '
+        f'p99 {result["p99"]:8.2f}ms  查询 {result["queries"]:3d}  状态 {result["status"]}'
+    )
+    # 状态码与预期不符时测得的不是正常路径
+    return line if result['ok'] else line + '（与预期不符）'
+
+
+def compare(baseline, results, threshold=20.0, metric='p95', min_delta=1.0):
+    """与基线比较，返回性能回退的说明列表
+
+    延迟超过基线 threshold 百分比且绝对增加不少于 min_delta 毫秒，或查询次数增加，
+    都视为回退；状态码与预期不符的用例也报告。基线中没有的用例不比较。
+    """
+    regressions = []
+    for label, result in results.items():
+        if not result.get('ok', True):
+            regressions.append(f'{label}：状态码 {result["status"]} 与预期不符')
+        old = baseline.get(label)
+        if old is None:
+            continue
+        before, after = old[metric], result[metric]
+        if after > before * (1 + threshold / 100) and after - before >= min_delta:
+            regressions.append(
+                f'{label}：{metric} {before:.2f}ms -> {after:.2f}ms（+{(after / max(before, 0.001) - 1) * 100:.0f}%）'
+            )
+        if result['queries'] > old['queries']:
+            regressions.append(f'{label}：查询次数 {old["queries"]} -> {result["queries"]}')
+    return regressions
@@ -0,0 +1,300 @@
+"""
+合成数据集生成
+
+按给定规模生成自习室、用户、预约和预约历史，用于负载和容量测试。
+同一个随机种子生成的数据相同（主键除外），便于对比优化前后的测试结果。
+
+- 自习室按楼栋、楼层和类型命名，热门程度服从长尾分布
+- 下午和晚上的时间段按 peak_skew 加权，周末的预约较少
+- 过去的预约大多已完成，未来的预约为待审核或已确认，各有一部分已取消
+- 同一自习室、时间段、日期最多一个未取消的预约，满足唯一约束
+
+所有数据用 bulk_create 分批写入，不触发 save() 信号；生成结束后统一重建
+预约统计、占用索引和搜索索引，并递增一次目录版本号。
+"""
+import random
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from bookings.availability import rebuild_occupancy
+from bookings.models import Booking, BookingHistory
+from bookings.stats import rebuild_stats
+from rooms.catalog import bump_version
+from rooms.models import StudyRoom, TimeSlot
+from search.index import rebuild_index
+
+User = get_user_model()
+
+BUILDINGS = ('图书馆', '教学楼A', '教学楼B', '实验楼', '综合楼')
+# 自习室类型：(名称, 最小容量, 最大容量, 设备)
+ROOM_KINDS = (
+    ('自习室', 30, 120, '空调、WiFi、充电插座'),
+    ('讨论室', 4, 12, '空调、WiFi、白板、会议桌'),
+    ('研讨室', 10, 30, '空调、WiFi、投影仪、白板'),
+    ('阅览室', 40, 200, '空调、WiFi、台灯、书架'),
+)
+PURPOSES = (
+    '期末复习', '考研自习', '小组讨论', '课程设计', '论文写作', '读书会',
+    '英语四六级备考', '数学建模', '项目答辩准备', '编程练习',
+)
+# 用户类型比例
+USER_TYPES = (('student', 0.9), ('teacher', 0.09), ('admin', 0.01))
+# 默认时间段，数据库中没有启用的时间段时创建
+DEFAULT_TIME_SLOTS = (
+    ('上午第一节', time(8, 0), time(9, 30)),
+    ('上午第二节', time(9, 50), time(11, 20)),
+    ('下午第一节', time(14, 0), time(15, 30)),
+    ('下午第二节', time(15, 50), time(17, 20)),
+    ('晚上第一节', time(19, 0), time(20, 30)),
+    ('晚上第二节', time(20, 50), time(22, 20)),
+)
+# 高峰时段的开始小时
+PEAK_HOURS = range(14, 22)
+# 占用单元最多使用的比例，超过时难以找到空闲单元
+MAX_FILL = 0.7
+
+
+@contextmanager
+def manual_timestamps(*models):
+    """暂时关闭 auto_now/auto_now_add，使批量写入使用生成的时间"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class DatasetGenerator:
+    """按规模参数生成合成数据集
+
+    fast_passwords 为 True 时所有用户共用一个预先计算的密码哈希，避免为每个用户
+    计算一次 PBKDF2；用户仍可用 password 登录。
+    """
+
+    def __init__(self, rooms=500, users=10000, bookings=100000, days_back=180, days_ahead=14,
+                 seed=0, prefix='syn', password='synthetic123', fast_passwords=True,
+                 history=True, peak_skew=2.0, batch_size=5000, rebuild_indexes=True, log=None):
+        self.room_count = rooms
+        self.user_count = users
+        self.booking_count = bookings
+        self.days_back = days_back
+        self.days_ahead = days_ahead
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.password = password
+        self.fast_passwords = fast_passwords
+        self.history = history
+        self.peak_skew = peak_skew
+        self.batch_size = batch_size
+        self.rebuild_indexes = rebuild_indexes
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.today = timezone.localdate()
+
+    def check(self):
+        """检查参数，返回错误信息，没有错误时返回 None"""
+        if min(self.room_count, self.user_count) < 1 or self.booking_count < 0:
+            return '自习室和用户数量至少为1，预约数量不能为负数'
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            return f'已存在前缀为 {self.prefix}_ 的用户，请换一个前缀'
+        slots = TimeSlot.objects.filter(is_active=True).count() or len(DEFAULT_TIME_SLOTS)
+        cells = self.room_count * (self.days_back + self.days_ahead) * slots
+        if self.booking_count > cells * MAX_FILL:
+            return f'预约数量超过自习室、日期和时间段组合的 {MAX_FILL:.0%}，请增加自习室或天数'
+        return None
+
+    def generate(self):
+        """生成数据集，返回 {数据类型: 数量}"""
+        counts = {}
+        with manual_timestamps(StudyRoom, User, Booking, BookingHistory):
+            self.time_slots = self._time_slots()
+            counts['rooms'] = self._create_rooms()
+            counts['users'] = self._create_users()
+            counts['bookings'], counts['history'] = self._create_bookings()
+        if self.rebuild_indexes:
+            self.log('重建预约统计、占用索引和搜索索引...')
+            rebuild_stats()
+            rebuild_occupancy()
+            rebuild_index()
+        bump_version()
+        return counts
+
+    # 目录
+
+    def _time_slots(self):
+        slots = list(TimeSlot.objects.filter(is_active=True).order_by('start_time'))
+        if not slots:
+            slots = TimeSlot.objects.bulk_create([
+                TimeSlot(name=name, start_time=start, end_time=end) for name, start, end in DEFAULT_TIME_SLOTS
+            ])
+        return slots
+
+    def _create_rooms(self):
+        rooms = []
+        sequence = {}
+        for _ in range(self.room_count):
+            building = self.rng.choice(BUILDINGS)
+            floor = self.rng.randint(1, 6)
+            kind, low, high, equipment = self.rng.choice(ROOM_KINDS)
+            number = sequence[building, floor] = sequence.get((building, floor), 0) + 1
+            created = self.now - timedelta(days=self.rng.randint(self.days_back, self.days_back + 720))
+            rooms.append(StudyRoom(
+                name=f'{building}{floor}{number:02d}{kind}',
+                description=f'{building}{floor}楼的{kind}',
+                capacity=self.rng.randint(low, high),
+                location=f'{building}{floor}楼{number:02d}室',
+                equipment=equipment,
+                created_at=created,
+                updated_at=created,
+            ))
+        rooms = StudyRoom.objects.bulk_create(rooms, batch_size=self.batch_size)
+        # 热门程度服从长尾分布，与名称顺序无关
+        weights = [1 / (rank + 1) ** 0.6 for rank in range(len(rooms))]
+        self.rng.shuffle(weights)
+        self.rooms = [(room.pk, room.capacity) for room in rooms]
+        self.room_weights = list(accumulate(weights))
+        self.log(f'已创建 {len(rooms)} 个自习室')
+        return len(rooms)
+
+    # 用户
+
+    def _create_users(self):
+        shared_hash = make_password(self.password) if self.fast_passwords else None
+        thresholds = list(accumulate(share for _, share in USER_TYPES))
+        self.user_ids, self.admin_ids = [], []
+        created = 0
+        for start in range(0, self.user_count, self.batch_size):
+            users = []
+            for n in range(start, min(start + self.batch_size, self.user_count)):
+                user_type = USER_TYPES[min(bisect(thresholds, self.rng.random()), len(USER_TYPES) - 1)][0]
+                joined = self.now - timedelta(days=self.rng.randint(0, 1460), seconds=self.rng.randint(0, 86399))
+                username = f'{self.prefix}_{n:07d}'
+                users.append(User(
+                    username=username,
+                    email=f'{username}@example.com',
+                    password=shared_hash or make_password(self.password),
+                    user_type=user_type,
+                    student_id=f'{n:08d}' if user_type == 'student' else None,
+                    date_joined=joined,
+                    created_at=joined,
+                    updated_at=joined,
+                ))
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+            self.user_ids += [user.pk for user in users]
+            self.admin_ids += [user.pk for user in users if user.user_type == 'admin']
+            created += len(users)
+            self.log(f'已创建 {created}/{self.user_count} 个用户')
+        if not self.admin_ids:
+            # 至少需要一个管理员审批预约
+            User.objects.filter(pk=self.user_ids[0]).update(user_type='admin', student_id=None)
+            self.admin_ids = [self.user_ids[0]]
+        return created
+
+    # 预约
+
+    def _day_weights(self):
+        days = [self.today + timedelta(days=offset) for offset in range(-self.days_back, self.days_ahead)]
+        return days, list(accumulate(0.6 if day.weekday() >= 5 else 1.0 for day in days))
+
+    def _pick(self, cumulative):
+        return bisect(cumulative, self.rng.random() * cumulative[-1])
+
+    def _status(self, day):
+        roll = self.rng.random()
+        if day < self.today:
+            return 'completed' if roll < 0.78 else 'cancelled'
+        return 'confirmed' if roll < 0.55 else 'pending' if roll < 0.85 else 'cancelled'
+
+    def _timestamps(self, day, slot, status):
+        """预约创建时间为使用日期前 0-14 天，状态变化在其后（完成在时间段结束后），均不晚于当前时间"""
+        start = timezone.make_aware(datetime.combine(day, slot.start_time))
+        created = start - timedelta(days=self.rng.randint(0, 14), seconds=self.rng.randint(3600, 86399))
+        created = min(created, self.now - timedelta(seconds=self.rng.randint(60, 86399)))
+        if status == 'pending':
+            return created, created
+        if status == 'completed':
+            end = timezone.make_aware(datetime.combine(day, slot.end_time))
+            return created, min(end + timedelta(seconds=self.rng.randint(0, 1800)), self.now)
+        return created, min(created + timedelta(seconds=self.rng.randint(600, 172800)), self.now)
+
+    def _create_bookings(self):
+        days, day_weights = self._day_weights()
+        slot_weights = list(accumulate(
+            1 + self.peak_skew if slot.start_time.hour in PEAK_HOURS else 1 for slot in self.time_slots
+        ))
+        # 每个(自习室, 日期, 时间段)一个字节，标记是否已有未取消的预约
+        occupied = bytearray(len(self.rooms) * len(days) * len(self.time_slots))
+        created = history = 0
+        while created < self.booking_count:
+            bookings = []
+            for _ in range(min(self.batch_size, self.booking_count - created)):
+                status = None
+                while status is None:
+                    room, day, slot = self._pick(self.room_weights), self._pick(day_weights), self._pick(slot_weights)
+                    status = self._status(days[day])
+                    cell = (room * len(days) + day) * len(self.time_slots) + slot
+                    if status != 'cancelled':
+                        if occupied[cell]:
+                            status = None
+                            continue
+                        occupied[cell] = 1
+                room_id, capacity = self.rooms[room]
+                created_at, updated_at = self._timestamps(days[day], self.time_slots[slot], status)
+                bookings.append(Booking(
+                    user_id=self.rng.choice(self.user_ids),
+                    room_id=room_id,
+                    time_slot=self.time_slots[slot],
+                    date=days[day],
+                    purpose=self.rng.choice(PURPOSES),
+                    participants=self.rng.randint(1, min(capacity, 8)),
+                    status=status,
+                    created_at=created_at,
+                    updated_at=updated_at,
+                ))
+            with transaction.atomic():
+                bookings = Booking.objects.bulk_create(bookings)
+                if self.history:
+                    history += len(BookingHistory.objects.bulk_create(self._history(bookings)))
+            created += len(bookings)
+            self.log(f'已创建 {created}/{self.booking_count} 条预约')
+        return created, history
+
+    def _history(self, bookings):
+        """与系统写入的操作记录一致：创建、审批、取消或拒绝、完成"""
+        for booking in bookings:
+            yield BookingHistory(
+                booking_id=booking.pk, action='创建预约', operator_id=booking.user_id, created_at=booking.created_at
+            )
+            if booking.status in ('confirmed', 'completed'):
+                yield BookingHistory(
+                    booking_id=booking.pk, action='审批通过', operator_id=self.rng.choice(self.admin_ids),
+                    created_at=booking.updated_at,
+                )
+            if booking.status == 'completed':
+                yield BookingHistory(
+                    booking_id=booking.pk, action='完成预约', operator_id=booking.user_id,
+                    notes='预约时间已结束，系统自动完成', created_at=booking.updated_at,
+                )
+            elif booking.status == 'cancelled':
+                if self.rng.random() < 0.5:
+                    action, operator = '取消预约', booking.user_id
+                else:
+                    action, operator = '审批拒绝', self.rng.choice(self.admin_ids)
+                yield BookingHistory(
+                    booking_id=booking.pk, action=action, operator_id=operator, created_at=booking.updated_at
+                )
@@ -0,0 +1,294 @@
+"""
+多进程并发压测
+
+启动一个本地服务器（runserver 或 gunicorn），由 N 个工作进程各自持有一个已登录的
+会话，按配置的比例请求预约创建页面、预约 API 和可用性接口。创建请求集中在少量
+“热点”时间段上，不同进程真正同时争抢同一时间段。结束后汇总吞吐量、延迟分位数、
+冲突率、错误数、服务器日志中的 "database is locked"，并检查数据库中是否有
+同一时间段被重复预约。
+
+工作进程只使用标准库发送 HTTP 请求，不访问数据库。到达间隔服从指数分布
+（开环，--rate 为每个进程每秒的请求数），延迟从计划发送时刻算起，进程落后于
+计划时排队的时间也计入延迟；rate 为 0 时每个进程收到响应后立即发送下一个请求。
+"""
+import json
+import random
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from bookings.models import Booking
+from rooms.models import StudyRoom, TimeSlot
+from .benchmark import summarize
+
+User = get_user_model()
+
+CREATE, API_CREATE, AVAILABILITY, GRID = 'create', 'api_create', 'availability', 'grid'
+OPERATIONS = (CREATE, API_CREATE, AVAILABILITY, GRID)
+CREATES = (CREATE, API_CREATE)
+DEFAULT_MIX = {CREATE: 2, API_CREATE: 2, AVAILABILITY: 3, GRID: 1}
+
+OK, ACCEPTED, CONFLICT, INVALID, ERROR = 'ok', 'accepted', 'conflict', 'invalid', 'error'
+LOAD_PURPOSE = '并发压测'
+LOCKED_MESSAGE = 'database is locked'
+
+
+def parse_mix(value):
+    """解析 "create=2,api_create=2,availability=3,grid=1"，返回 {操作: 权重}"""
+    mix = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f'未知的操作 {name}，可选：{"、".join(OPERATIONS)}')
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise ValueError(f'{name} 的权重 {weight} 不是数字')
+        if mix[name] < 0:
+            raise ValueError(f'{name} 的权重不能为负数')
+    if not mix or not any(mix.values()):
+        raise ValueError('至少需要一个权重大于 0 的操作')
+    return mix
+
+
+class Targets:
+    """压测使用的自习室、热点时间段和日期
+
+    热点为数据集之后的空闲日期上的 (自习室, 时间段, 日期)，所有进程的创建请求
+    都在其中随机选择，数量越少争抢越激烈。
+    """
+
+    def __init__(self, hot_slots=20, seed=0):
+        rng = random.Random(seed)
+        today = timezone.localdate()
+        rooms = list(StudyRoom.objects.filter(is_active=True).order_by('pk').values('pk', 'capacity'))
+        slots = list(TimeSlot.objects.filter(is_active=True).order_by('start_time').values_list('pk', flat=True))
+        if not rooms or not slots:
+            raise ValueError('没有启用的自习室或时间段')
+        last_day = Booking.objects.order_by('-date').values_list('date', flat=True).first() or today
+        first_free = max(last_day, today) + timedelta(days=1)
+        self.room_ids = [room['pk'] for room in rooms]
+        self.hot = []
+        candidates = [(room['pk'], slot) for room in rooms for slot in slots]
+        for index in range(hot_slots):
+            room, slot = rng.choice(candidates)
+            self.hot.append((room, slot, (first_free + timedelta(days=index % 7)).isoformat()))
+        self.days = sorted({day for _, _, day in self.hot})
+        # 可用性查询覆盖近期（有数据）和热点日期
+        self.query_days = [(today + timedelta(days=offset)).isoformat() for offset in range(7)] + self.days
+
+    def as_dict(self):
+        return {'room_ids': self.room_ids, 'hot': self.hot, 'query_days': self.query_days}
+
+
+def create_sessions(count):
+    """为 count 个启用的学生建立登录会话，返回 [(用户名, 会话 ID, CSRF 令牌)]
+
+    会话直接写入数据库，工作进程无需各自登录；CSRF 令牌同时作为 Cookie 和
+    X-CSRFToken 请求头发送。
+    """
+    users = list(User.objects.filter(user_type='student', is_active=True).order_by('pk')[:count])
+    if len(users) < count:
+        raise ValueError(f'只有 {len(users)} 个可用的学生用户，少于工作进程数 {count}')
+    sessions = []
+    for user in users:
+        client = Client()
+        client.force_login(user)
+        session_id = client.cookies[settings.SESSION_COOKIE_NAME].value
+        sessions.append((user.username, session_id, get_random_string(32)))
+    return sessions
+
+
+def url_templates():
+    """各操作的 URL 模板，工作进程中不能使用 reverse()"""
+    room, day = 987654321, '1970-01-01'
+    return {
+        CREATE: reverse('bookings:booking_create', kwargs={'room_id': room}).replace(str(room), '{room}'),
+        API_CREATE: reverse('api:booking_list_create'),
+        AVAILABILITY: reverse('api:available_slots', kwargs={'room_id': room, 'date': day})
+        .replace(str(room), '{room}').replace(day, '{date}'),
+        GRID: reverse('api:availability_grid'),
+    }
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """不跟随重定向：表单提交成功的 302 本身就是结果"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _request(opener, method, url, headers, body=None, timeout=30):
+    request = urllib.request.Request(url, data=body, headers=headers, method=method)
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            return response.status, response.read().decode('utf-8', 'replace')
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.read().decode('utf-8', 'replace')
+    except (urllib.error.URLError, OSError) as exc:
+        return 0, str(exc)
+
+
+def classify(operation, status, body):
+    """按操作和响应判断结果"""
+    if status == 0 or status >= 500:
+        return ERROR
+    if operation == CREATE:
+        if status == 302:
+            return ACCEPTED
+        # 冲突时重新显示表单并提示“已被预约”
+        return CONFLICT if '已被预约' in body else INVALID
+    if operation == API_CREATE:
+        return {201: ACCEPTED, 409: CONFLICT}.get(status, INVALID if status == 400 else ERROR)
+    return OK if status in (200, 304) else ERROR
+
+
+def _build(operation, rng, plan):
+    """返回 (方法, URL, 请求体, Content-Type)"""
+    targets, path = plan['targets'], plan['paths'][operation]
+    url = plan['base_url'] + path
+    if operation in CREATES:
+        room, slot, day = rng.choice(targets['hot'])
+        if operation == CREATE:
+            body = urllib.parse.urlencode({
+                'time_slot': slot, 'date': day, 'purpose': LOAD_PURPOSE, 'participants': 1,
+            }).encode()
+            return 'POST', url.format(room=room), body, 'application/x-www-form-urlencoded'
+        body = json.dumps({
+            'room_id': room, 'time_slot_id': slot, 'date': day, 'purpose': LOAD_PURPOSE, 'participants': 1,
+        }).encode()
+        return 'POST', url, body, 'application/json'
+    if operation == AVAILABILITY:
+        room, day = rng.choice(targets['room_ids']), rng.choice(targets['query_days'])
+        return 'GET', url.format(room=room, date=day), None, None
+    rooms = ','.join(map(str, rng.sample(targets['room_ids'], min(5, len(targets['room_ids'])))))
+    query = urllib.parse.urlencode({'rooms': rooms, 'start': rng.choice(targets['query_days'])})
+    return 'GET', f'{url}?{query}', None, None
+
+
+def run_worker(plan, session, results):
+    """工作进程入口：按计划发送请求，把样本 [(操作, 延迟毫秒, 状态码, 结果)] 放入 results 队列"""
+    _, session_id, csrf_token = session
+    rng = random.Random(plan['seed'])
+    operations, weights = zip(*plan['mix'].items())
+    opener = urllib.request.build_opener(_NoRedirect())
+    headers = {
+        'Cookie': f'{plan["session_cookie"]}={session_id}; {plan["csrf_cookie"]}={csrf_token}',
+        'X-CSRFToken': csrf_token,
+        'Referer': plan['base_url'] + '/',
+    }
+    samples = []
+    rate = plan['rate']
+    started = time.perf_counter()
+    deadline = started + plan['duration']
+    scheduled = started
+    while True:
+        if rate:
+            scheduled += rng.expovariate(rate)
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            scheduled = time.perf_counter()
+            if scheduled >= deadline:
+                break
+        operation = rng.choices(operations, weights)[0]
+        method, url, body, content_type = _build(operation, rng, plan)
+        request_headers = dict(headers, **({'Content-Type': content_type} if content_type else {}))
+        status, text = _request(opener, method, url, request_headers, body)
+        latency = (time.perf_counter() - scheduled) * 1000
+        samples.append((operation, latency, status, classify(operation, status, text)))
+    results.put(samples)
+
+
+def double_bookings():
+    """同一 (自习室, 时间段, 日期) 有多个有效预约的情况"""
+    return list(
+        Booking.objects.filter(status__in=Booking.ACTIVE_STATUSES)
+        .values('room_id', 'time_slot_id', 'date')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('date', 'room_id', 'time_slot_id')
+    )
+
+
+def build_report(samples, elapsed, created, locked=0, doubles=()):
+    """汇总全部样本
+
+    created 为数据库中压测实际创建的有效预约数，应等于成功响应数；
+    locked 为服务器日志中 "database is locked" 出现的次数。
+    """
+    by_operation = defaultdict(list)
+    for sample in samples:
+        by_operation[sample[0]].append(sample)
+    operations = {}
+    for operation, items in sorted(by_operation.items()):
+        latency = summarize([latency for _, latency, _, _ in items])
+        operations[operation] = {
+            'requests': len(items),
+            'throughput': round(len(items) / elapsed, 2),
+            **latency,
+            'statuses': dict(sorted(Counter(str(status) for _, _, status, _ in items).items())),
+            'outcomes': dict(sorted(Counter(outcome for _, _, _, outcome in items).items())),
+        }
+    outcomes = Counter(outcome for operation, _, _, outcome in samples if operation in CREATES)
+    attempts = outcomes[ACCEPTED] + outcomes[CONFLICT]
+    return {
+        'elapsed': round(elapsed, 3),
+        'requests': len(samples),
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'operations': operations,
+        'accepted': outcomes[ACCEPTED],
+        'conflicts': outcomes[CONFLICT],
+        'conflict_rate': round(outcomes[CONFLICT] / attempts, 4) if attempts else 0.0,
+        'errors': sum(1 for _, _, _, outcome in samples if outcome == ERROR),
+        'database_locked': locked,
+        'created': created,
+        'double_bookings': [
+            {**row, 'date': row['date'].isoformat() if hasattr(row['date'], 'isoformat') else row['date']}
+            for row in doubles
+        ],
+    }
+
+
+def problems(report):
+    """报告中的正确性问题：重复预约，以及成功响应数与实际写入数不一致"""
+    found = [
+        f'自习室 {row["room_id"]} 时间段 {row["time_slot_id"]} {row["date"]} 有 {row["count"]} 个有效预约'
+        for row in report['double_bookings']
+    ]
+    if report['created'] != report['accepted']:
+        found.append(f'成功响应 {report["accepted"]} 次，数据库中实际创建 {report["created"]} 个预约')
+    return found
+
+
+def format_report(report):
+    lines = [
+        f'{"操作":<14}{"请求":>8}{"吞吐/s":>10}{"p50":>10}{"p95":>10}{"p99":>10}  结果',
+    ]
+    for operation, result in report['operations'].items():
+        outcomes = ' '.join(f'{key}={value}' for key, value in result['outcomes'].items())
+        lines.append(
+            f'{operation:<14}{result["requests"]:>8}{result["throughput"]:>10.1f}'
+            f'{result["p50"]:>9.1f}ms{result["p95"]:>8.1f}ms{result["p99"]:>8.1f}ms  {outcomes}'
+        )
+    lines += [
+        f'总计 {report["requests"]} 个请求，{report["elapsed"]:.1f} 秒，{report["throughput"]:.1f} 请求/秒',
+        f'预约成功 {report["accepted"]}，冲突 {report["conflicts"]}，冲突率 {report["conflict_rate"]:.1%}',
+        f'错误 {report["errors"]}，database is locked {report["database_locked"]} 次',
+        f'重复预约的时间段 {len(report["double_bookings"])} 个',
+    ]
+    return '\n'.join(lines)
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from tests.benchmark import PERCENTILES, Fixtures, Runner, cases, compare, uncovered_patterns
+from tests.datagen import DatasetGenerator
+
+PREFIX = 'bench'
+PASSWORD = 'synthetic123'
+
+
+class Command(BaseCommand):
+    """接口基准测试
+
+    在独立的测试数据库中生成合成数据集，逐个请求 rooms、bookings、api、accounts
+    的全部路由，输出 p50/p95/p99 延迟和查询次数。例如：
+        python manage.py benchmark_endpoints --save baseline.json
+        python manage.py benchmark_endpoints --compare baseline.json --threshold 20
+    比较时任一接口回退则命令失败，可用于 CI。
+    """
+    help = '在合成数据集上对全部接口做基准测试，保存或比较 JSON 基线'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=200, help='数据集的自习室数量')
+        parser.add_argument('--users', type=int, default=2000, help='数据集的用户数量')
+        parser.add_argument('--bookings', type=int, default=20000, help='数据集的预约数量')
+        parser.add_argument('--seed', type=int, default=0, help='数据集的随机种子')
+        parser.add_argument('--warmup', type=int, default=3, help='每个接口预热的请求次数')
+        parser.add_argument('--runs', type=int, default=30, help='每个接口计时的请求次数')
+        parser.add_argument('--filter', default='', help='只运行名称包含该字符串的用例')
+        parser.add_argument('--save', metavar='PATH', help='将结果保存为 JSON 基线')
+        parser.add_argument('--compare', metavar='PATH', help='与 JSON 基线比较')
+        parser.add_argument('--threshold', type=float, default=20.0, help='允许的延迟增长百分比')
+        parser.add_argument('--metric', choices=PERCENTILES, default='p95', help='比较使用的延迟分位数')
+        parser.add_argument(
+            '--min-delta',
+            type=float,
+            default=1.0,
+            help='延迟增长少于该毫秒数时不视为回退，避免极快接口的抖动'
+        )
+        parser.add_argument('--keepdb', action='store_true', help='保留测试数据库和数据集供下次使用')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'无法读取基线 {options["compare"]}：{exc}')
+
+        results = self.run_benchmark(options)
+        dataset = {key: options[key] for key in ('rooms', 'users', 'bookings', 'seed')}
+
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'created_at': timezone.now().isoformat(),
+                    'dataset': dataset,
+                    'warmup': options['warmup'],
+                    'runs': options['runs'],
+                    'endpoints': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'基线已保存到 {options["save"]}'))
+
+        if baseline is not None:
+            if baseline.get('dataset') != dataset:
+                self.stdout.write(self.style.WARNING('基线使用的数据集规模不同，结果可能不可比'))
+            regressions = compare(
+                baseline['endpoints'], results, options['threshold'], options['metric'], options['min_delta']
+            )
+            if regressions:
+                raise CommandError('以下接口性能回退：\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f'与基线相比没有超过 {options["threshold"]:.0f}% 的回退'))
+
+    def run_benchmark(self, options):
+        setup_test_environment()
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            # 使用文件数据库，结果接近实际部署，--keepdb 时也能保留
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), 'study_room_benchmark.sqlite3'
+            )
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not get_user_model().objects.filter(username__startswith=f'{PREFIX}_').exists():
+                self.stdout.write('生成数据集...')
+                generator = DatasetGenerator(
+                    rooms=options['rooms'], users=options['users'], bookings=options['bookings'],
+                    seed=options['seed'], prefix=PREFIX, password=PASSWORD,
+                )
+                error = generator.check()
+                if error:
+                    raise CommandError(error)
+                generator.generate()
+            fixtures = Fixtures(PASSWORD)
+            case_list = cases(fixtures)
+            missing = uncovered_patterns(case_list)
+            if missing:
+                self.stdout.write(self.style.WARNING('以下路由没有基准用例：' + '、'.join(missing)))
+            case_list = [case for case in case_list if options['filter'] in case.label]
+            runner = Runner(fixtures, options['warmup'], options['runs'], log=self.stdout.write)
+            return runner.run_all(case_list)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
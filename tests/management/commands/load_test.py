@@ -0,0 +1,238 @@
+import importlib.util
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from bookings.models import Booking
+from tests.datagen import DatasetGenerator
+from tests.loadtest import (
+    DEFAULT_MIX, LOAD_PURPOSE, LOCKED_MESSAGE, Targets, build_report, create_sessions, double_bookings,
+    format_report, parse_mix, problems, run_worker, url_templates,
+)
+
+PREFIX = 'load'
+PASSWORD = 'synthetic123'
+SERVERS = ('runserver', 'gunicorn')
+
+SERVER_SETTINGS = '''from {base} import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+DATABASES = {{**DATABASES, 'default': {{**DATABASES['default'], 'NAME': {name!r}}}}}
+QUERY_BUDGET_ENFORCE = False
+# DEBUG 关闭时 Django 默认不输出 500 的堆栈，统计 database is locked 需要它们
+LOGGING = {{
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {{'console': {{'class': 'logging.StreamHandler'}}}},
+    'loggers': {{'django.request': {{'handlers': ['console'], 'level': 'ERROR'}}}},
+}}
+'''
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    """多进程并发压测
+
+    在独立的测试数据库中生成合成数据集，启动本地服务器，由多个工作进程同时请求
+    预约创建页面、预约 API 和可用性接口。例如：
+        python manage.py load_test --workers 16 --duration 30
+        python manage.py load_test --server gunicorn --server-workers 4 --rate 20 \\
+            --mix create=1,api_create=1,availability=4 --json load.json
+    发现同一时间段被重复预约，或成功响应数与实际写入数不一致时命令失败。
+    """
+    help = '启动本地服务器，用多个进程并发请求预约流程并报告吞吐量、延迟、冲突和重复预约'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='工作进程数，每个进程一个登录用户')
+        parser.add_argument('--duration', type=float, default=20.0, help='压测时长（秒）')
+        parser.add_argument('--rate', type=float, default=0.0, help='每个进程每秒的请求数，0 表示不限速')
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+            help='操作比例，可选 create、api_create、availability、grid'
+        )
+        parser.add_argument('--hot-slots', type=int, default=20, help='创建请求争抢的时间段数量')
+        parser.add_argument('--server', choices=SERVERS, default='runserver', help='本地服务器')
+        parser.add_argument('--server-workers', type=int, default=4, help='gunicorn 的 worker 数量')
+        parser.add_argument('--rooms', type=int, default=50, help='数据集的自习室数量')
+        parser.add_argument('--users', type=int, default=500, help='数据集的用户数量')
+        parser.add_argument('--bookings', type=int, default=5000, help='数据集的预约数量')
+        parser.add_argument('--seed', type=int, default=0, help='数据集和请求序列的随机种子')
+        parser.add_argument('--json', metavar='PATH', help='将报告保存为 JSON')
+        parser.add_argument('--server-log', metavar='PATH', help='保存服务器的输出，用于排查错误响应')
+        parser.add_argument('--keepdb', action='store_true', help='保留测试数据库和数据集供下次使用')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['workers'] < 1 or options['duration'] <= 0 or options['hot_slots'] < 1:
+            raise CommandError('工作进程数和热点时间段数至少为1，压测时长必须大于0')
+        if options['server'] == 'gunicorn' and importlib.util.find_spec('gunicorn') is None:
+            raise CommandError('未安装 gunicorn，请使用 --server runserver 或先安装 gunicorn')
+
+        setup_test_environment()
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            # 服务器在另一个进程中运行，必须使用文件数据库
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), 'study_room_loadtest.sqlite3'
+            )
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = self.run_load(options, mix)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write(format_report(report))
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'报告已保存到 {options["json"]}'))
+        found = problems(report)
+        if found:
+            raise CommandError('发现数据一致性问题：\n' + '\n'.join(found))
+        self.stdout.write(self.style.SUCCESS('没有发现重复预约'))
+
+    def run_load(self, options, mix):
+        if not get_user_model().objects.filter(username__startswith=f'{PREFIX}_').exists():
+            self.stdout.write('生成数据集...')
+            generator = DatasetGenerator(
+                rooms=options['rooms'], users=options['users'], bookings=options['bookings'],
+                seed=options['seed'], prefix=PREFIX, password=PASSWORD,
+            )
+            error = generator.check()
+            if error:
+                raise CommandError(error)
+            generator.generate()
+        try:
+            sessions = create_sessions(options['workers'])
+            targets = Targets(options['hot_slots'], options['seed'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        load_bookings = Booking.objects.filter(purpose=LOAD_PURPOSE, status__in=Booking.ACTIVE_STATUSES)
+        before = load_bookings.count()
+        plan = {
+            'mix': mix,
+            'rate': options['rate'],
+            'duration': options['duration'],
+            'targets': targets.as_dict(),
+            'paths': url_templates(),
+            'session_cookie': settings.SESSION_COOKIE_NAME,
+            'csrf_cookie': settings.CSRF_COOKIE_NAME,
+        }
+        # 服务器和工作进程启动前关闭本进程的连接，不持有数据库锁
+        connection.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'server.log')
+            with open(log_path, 'w+', encoding='utf-8') as log:
+                server, base_url = self.start_server(options, directory, log)
+                try:
+                    plan['base_url'] = base_url
+                    samples, elapsed = self.run_workers(plan, sessions, options)
+                finally:
+                    server.terminate()
+                    try:
+                        server.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        server.kill()
+                        server.wait()
+                log.seek(0)
+                output = log.read()
+        if options['server_log']:
+            with open(options['server_log'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        locked = output.count(LOCKED_MESSAGE)
+
+        report = build_report(samples, elapsed, load_bookings.count() - before, locked, double_bookings())
+        report['config'] = {
+            key: options[key]
+            for key in ('workers', 'duration', 'rate', 'hot_slots', 'server', 'rooms', 'users', 'bookings', 'seed')
+        }
+        report['config']['mix'] = mix
+        return report
+
+    def start_server(self, options, directory, log):
+        """在空闲端口启动服务器，等待其可以响应，返回 (进程, 基础 URL)"""
+        with open(os.path.join(directory, 'loadtest_settings.py'), 'w', encoding='utf-8') as f:
+            f.write(SERVER_SETTINGS.format(base=settings.SETTINGS_MODULE, name=connection.settings_dict['NAME']))
+        port = _free_port()
+        address = f'127.0.0.1:{port}'
+        if options['server'] == 'gunicorn':
+            command = [
+                sys.executable, '-m', 'gunicorn', 'study_room_system.wsgi:application',
+                '--bind', address, '--workers', str(options['server_workers']),
+            ]
+        else:
+            command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', address, '--noreload']
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='loadtest_settings',
+            PYTHONPATH=os.pathsep.join([directory, str(settings.BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+        )
+        self.stdout.write(f'启动 {options["server"]}（{address}）...')
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        base_url = f'http://{address}'
+        ready_url = base_url + reverse('accounts:login')
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                log.seek(0)
+                raise CommandError('服务器启动失败：\n' + log.read()[-2000:])
+            try:
+                with urllib.request.urlopen(ready_url, timeout=2):
+                    return server, base_url
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        server.kill()
+        raise CommandError('服务器 30 秒内没有响应')
+
+    def run_workers(self, plan, sessions, options):
+        """启动工作进程并收集全部样本，返回 (样本, 实际耗时秒)"""
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=run_worker,
+                args=(dict(plan, seed=options['seed'] * 1000 + index), session, results),
+            )
+            for index, session in enumerate(sessions)
+        ]
+        self.stdout.write(f'{len(workers)} 个工作进程压测 {options["duration"]:g} 秒...')
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        samples = []
+        try:
+            # 先取结果再 join，避免队列中的大量数据阻塞子进程退出
+            for _ in workers:
+                samples += results.get(timeout=options['duration'] + 120)
+        finally:
+            for worker in workers:
+                worker.join(timeout=10)
+                if worker.is_alive():
+                    worker.terminate()
+        return samples, time.perf_counter() - started
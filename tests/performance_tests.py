@@ -1,13 +1,17 @@
 """
 系统性能测试
 """
-from django.test import TestCase, TransactionTestCase
+from django.conf import settings
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase
 from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test.client import Client
 from datetime import datetime, date, timedelta
+import logging
+import queue
 import time
 import os
 import sys
@@ -18,6 +22,16 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from tests.base import BaseTestCase, TestDataFactory
+from bookings.models import Booking
+from bookings.serializers import BookingSerializer, ValuesProjection
+from bookings.stats import GLOBAL_KEY, get_stats
+from tests.datagen import DatasetGenerator
+from tests.benchmark import Fixtures, Runner, cases, compare, summarize, uncovered_patterns
+from tests import loadtest
+from rooms import catalog
+from django.contrib.auth import get_user_model
+
+logger = logging.getLogger(__name__)
 
 
 class DatabasePerformanceTest(BaseTestCase):
@@ -260,9 +274,15 @@ class CachePerformanceTest(BaseTestCase):
     })
     def test_cached_room_list_performance(self):
         """测试缓存的自习室列表性能"""
-        # 这里可以添加缓存相关的测试
-        # 如果系统使用了缓存机制的话
-        pass
+        self.login_student()
+        catalog.invalidate()
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(reverse('rooms:room_list'))
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(reverse('rooms:room_list'))
+        self.assertEqual(response.status_code, 200)
+        # 目录缓存命中后不再查询自习室表
+        self.assertLess(len(warm), len(cold))
     
     def test_repeated_queries_performance(self):
         """测试重复查询性能"""
@@ -329,3 +349,283 @@ class ResponseTimeTest(BaseTestCase):
         
         self.assertIn(response.status_code, [200, 302])
         self.assertLess(submission_time, 2.0, f"表单提交时间过长: {submission_time}秒")
+
+
+class BookingSerializerBenchmark(BaseTestCase):
+    """预约API读路径基准：查询次数和耗时随条数的变化
+
+    运行：python manage.py test tests.performance_tests.BookingSerializerBenchmark
+    """
+    PAGE_SIZES = (10, 50, 200)
+    
+    def setUp(self):
+        super().setUp()
+        slots = [self.slot_morning, self.slot_afternoon, self.slot_evening]
+        rooms = [self.room1, self.room2]
+        today = timezone.localdate()
+        Booking.objects.bulk_create([
+            Booking(
+                user=self.student_user, room=rooms[i % 2], time_slot=slots[i // 2 % 3],
+                date=today + timedelta(days=1 + i // 6), participants=1,
+            )
+            for i in range(max(self.PAGE_SIZES))
+        ])
+        self.queryset = Booking.objects.filter(user=self.student_user).order_by('-created_at', '-pk')
+    
+    def measure(self, serialize):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            data = serialize()
+            elapsed = time.perf_counter() - start
+        return data, len(queries), elapsed * 1000
+    
+    def test_read_path_scaling(self):
+        """测试逐行加载、预加载、values() 投影三种读路径"""
+        projection = ValuesProjection(BookingSerializer)
+        strategies = [
+            ('逐行加载', lambda n: BookingSerializer(self.queryset[:n], many=True).data),
+            ('预加载', lambda n: BookingSerializer(
+                BookingSerializer.setup_eager_loading(self.queryset)[:n], many=True
+            ).data),
+            ('values投影', lambda n: projection.serialize(self.queryset.values(*projection.lookups)[:n])),
+        ]
+        
+        # 对比表只写入日志，默认不输出；断言只检查查询次数
+        logger.info('条数  读路径        查询次数  耗时(ms)')
+        for size in self.PAGE_SIZES:
+            baseline = None
+            for name, serialize in strategies:
+                data, query_count, elapsed = self.measure(lambda: serialize(size))
+                logger.info('%4d  %-10s  %8d  %8.1f', size, name, query_count, elapsed)
+                data = [dict(item) for item in data]
+                if baseline is None:
+                    baseline = data
+                    # 每条预约分别查询用户、自习室、时间段
+                    self.assertEqual(query_count, 1 + 3 * size)
+                else:
+                    self.assertEqual(query_count, 1)
+                    self.assertEqual(len(data), len(baseline))
+                    self.assertEqual(data[0]['room'], dict(baseline[0]['room']))
+
+
+class DatasetGeneratorTest(BaseTestCase):
+    """合成数据集生成测试"""
+    
+    def generate(self, prefix, **kwargs):
+        options = dict(rooms=6, users=30, bookings=300, days_back=20, days_ahead=7, seed=7, batch_size=40)
+        options.update(kwargs)
+        generator = DatasetGenerator(prefix=prefix, **options)
+        self.assertIsNone(generator.check())
+        return generator.generate()
+    
+    def bookings_of(self, prefix):
+        return list(
+            Booking.objects.filter(user__username__startswith=f'{prefix}_').order_by('pk').values_list(
+                'room__name', 'date', 'time_slot__name', 'status', 'user__username'
+            )
+        )
+    
+    def test_generate_consistent_dataset(self):
+        """测试生成的数据满足约束，统计和历史与预约一致"""
+        counts = self.generate('a')
+        self.assertEqual((counts['rooms'], counts['users'], counts['bookings']), (6, 30, 300))
+        self.assertEqual(Booking.objects.count(), 300)
+        self.assertEqual(get_stats(GLOBAL_KEY).total, 300)
+        self.assertGreaterEqual(counts['history'], 300)
+        self.assertFalse(Booking.objects.filter(created_at__gt=timezone.now()).exists())
+        self.assertFalse(Booking.objects.filter(date__lt=timezone.localdate(), status__in=('pending', 'confirmed')).exists())
+        # 高峰时段（下午和晚上）的预约多于上午
+        peak = Booking.objects.filter(time_slot__start_time__hour__gte=14).count()
+        self.assertGreater(peak, 300 - peak)
+        # 共用的密码哈希仍可登录
+        user = get_user_model().objects.get(username='a_0000000')
+        self.assertTrue(user.check_password('synthetic123'))
+    
+    def test_same_seed_same_data(self):
+        """测试同一种子生成相同的数据"""
+        self.generate('a', history=False, rebuild_indexes=False)
+        self.generate('b', history=False, rebuild_indexes=False)
+        first = [(room, day, slot, status, user[2:]) for room, day, slot, status, user in self.bookings_of('a')]
+        second = [(room, day, slot, status, user[2:]) for room, day, slot, status, user in self.bookings_of('b')]
+        self.assertEqual(first, second)
+        self.assertIsNotNone(DatasetGenerator(prefix='a').check())
+    
+    def test_rejects_overfull_grid(self):
+        """测试预约数量超过可用组合时报错"""
+        self.assertIsNotNone(DatasetGenerator(rooms=1, days_back=1, days_ahead=1, bookings=100).check())
+
+
+class EndpointBenchmarkTest(BaseTestCase):
+    """接口基准测试套件的测试"""
+    
+    def setUp(self):
+        super().setUp()
+        DatasetGenerator(
+            rooms=5, users=20, bookings=150, days_back=10, days_ahead=7, seed=1, prefix='bench'
+        ).generate()
+        self.fixtures = Fixtures('synthetic123')
+    
+    def test_covers_every_route(self):
+        """测试每个路由都有基准用例"""
+        self.assertEqual(uncovered_patterns(cases(self.fixtures)), [])
+    
+    def test_runs_every_case(self):
+        """测试全部用例请求成功，写操作回滚后数据不变"""
+        count = Booking.objects.count()
+        results = Runner(self.fixtures, warmup=1, runs=2).run_all(cases(self.fixtures))
+        failed = {label: result['status'] for label, result in results.items() if not result['ok']}
+        self.assertEqual(failed, {})
+        self.assertEqual(Booking.objects.count(), count)
+        result = results['GET api:booking_list_create']
+        self.assertEqual(result['runs'], 2)
+        self.assertLessEqual(result['p50'], result['p99'])
+        self.assertGreater(result['queries'], 0)
+    
+    def test_compare_with_baseline(self):
+        """测试延迟超过阈值或查询次数增加时报告回退"""
+        baseline = {'a': {**summarize([10.0, 10.0]), 'queries': 3}, 'b': {**summarize([0.2]), 'queries': 3}}
+        results = {
+            'a': {**summarize([13.0, 13.0]), 'queries': 4},
+            'b': {**summarize([0.5]), 'queries': 3},
+            'new': {**summarize([1.0]), 'queries': 1},
+        }
+        regressions = compare(baseline, results, threshold=20)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(line.startswith('a：') for line in regressions))
+        self.assertEqual(compare(baseline, results, threshold=50), ['a：查询次数 3 -> 4'])
+
+
+class LoadHarnessTest(BaseTestCase):
+    """并发压测工具的测试"""
+    
+    def test_parse_mix(self):
+        """测试解析操作比例"""
+        self.assertEqual(loadtest.parse_mix('create=2, grid'), {'create': 2.0, 'grid': 1.0})
+        for value in ('unknown=1', 'create=x', 'create=-1', 'create=0', ''):
+            with self.assertRaises(ValueError):
+                loadtest.parse_mix(value)
+    
+    def test_classify(self):
+        """测试按操作和响应判断结果"""
+        self.assertEqual(loadtest.classify('create', 302, ''), 'accepted')
+        self.assertEqual(loadtest.classify('create', 200, '该时间段已被预约'), 'conflict')
+        self.assertEqual(loadtest.classify('create', 200, '表单错误'), 'invalid')
+        self.assertEqual(loadtest.classify('api_create', 201, ''), 'accepted')
+        self.assertEqual(loadtest.classify('api_create', 409, ''), 'conflict')
+        self.assertEqual(loadtest.classify('api_create', 403, ''), 'error')
+        self.assertEqual(loadtest.classify('grid', 200, ''), 'ok')
+        self.assertEqual(loadtest.classify('availability', 500, ''), 'error')
+        self.assertEqual(loadtest.classify('availability', 0, 'Connection refused'), 'error')
+    
+    def test_targets_after_existing_bookings(self):
+        """测试热点时间段只使用启用的自习室和时间段，且在已有预约之后"""
+        last = timezone.localdate() + timedelta(days=5)
+        self.create_test_booking(booking_date=last)
+        targets = loadtest.Targets(hot_slots=10, seed=1)
+        self.assertNotIn(self.room3.pk, targets.room_ids)
+        self.assertEqual(len(targets.hot), 10)
+        for room, slot, day in targets.hot:
+            self.assertIn(room, targets.room_ids)
+            self.assertNotEqual(slot, self.slot_inactive.pk)
+            self.assertGreater(date.fromisoformat(day), last)
+        self.assertEqual(targets.hot, loadtest.Targets(hot_slots=10, seed=1).hot)
+    
+    def test_url_templates(self):
+        """测试 URL 模板与 reverse() 一致"""
+        paths = loadtest.url_templates()
+        self.assertEqual(
+            paths['create'].format(room=self.room1.pk),
+            reverse('bookings:booking_create', kwargs={'room_id': self.room1.pk}),
+        )
+        self.assertEqual(
+            paths['availability'].format(room=self.room1.pk, date='2030-01-02'),
+            reverse('api:available_slots', kwargs={'room_id': self.room1.pk, 'date': '2030-01-02'}),
+        )
+    
+    def test_sessions_pass_csrf(self):
+        """测试预先建立的会话和 CSRF 令牌可以直接用于写请求"""
+        (username, session_id, token), = loadtest.create_sessions(1)
+        self.assertEqual(username, self.student_user.username)
+        client = Client(enforce_csrf_checks=True)
+        client.cookies[settings.SESSION_COOKIE_NAME] = session_id
+        client.cookies[settings.CSRF_COOKIE_NAME] = token
+        response = client.post(reverse('api:booking_list_create'), {
+            'room_id': self.room1.pk, 'time_slot_id': self.slot_morning.pk,
+            'date': (timezone.localdate() + timedelta(days=1)).isoformat(), 'purpose': loadtest.LOAD_PURPOSE,
+        }, HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 201)
+        with self.assertRaises(ValueError):
+            loadtest.create_sessions(10)
+    
+    def test_report_and_problems(self):
+        """测试报告汇总和正确性检查"""
+        samples = [
+            ('create', 10.0, 302, 'accepted'),
+            ('create', 12.0, 200, 'conflict'),
+            ('api_create', 8.0, 409, 'conflict'),
+            ('api_create', 30.0, 500, 'error'),
+            ('grid', 5.0, 200, 'ok'),
+        ]
+        report = loadtest.build_report(samples, 2.0, created=1, locked=1)
+        self.assertEqual(report['requests'], 5)
+        self.assertEqual(report['throughput'], 2.5)
+        self.assertEqual(report['accepted'], 1)
+        self.assertEqual(report['conflicts'], 2)
+        self.assertAlmostEqual(report['conflict_rate'], 2 / 3, places=3)
+        self.assertEqual(report['errors'], 1)
+        self.assertEqual(report['operations']['api_create']['statuses'], {'409': 1, '500': 1})
+        self.assertEqual(loadtest.problems(report), [])
+        self.assertIn('database is locked 1 次', loadtest.format_report(report))
+        
+        doubles = [{'room_id': 1, 'time_slot_id': 2, 'date': date(2030, 1, 2), 'count': 2}]
+        report = loadtest.build_report(samples, 2.0, created=2, doubles=doubles)
+        self.assertEqual(len(loadtest.problems(report)), 2)
+        self.assertEqual(report['double_bookings'][0]['date'], '2030-01-02')
+    
+    def test_no_double_bookings(self):
+        """测试已取消的预约不算重复预约"""
+        day = timezone.localdate() + timedelta(days=1)
+        self.create_test_booking(booking_date=day, status='cancelled')
+        self.create_test_booking(booking_date=day)
+        self.assertEqual(loadtest.double_bookings(), [])
+
+
+class LoadHarnessLiveTest(LiveServerTestCase):
+    """压测工作进程通过真实的 HTTP 请求预约流程
+    
+    测试数据库在内存中，由服务器线程共用连接，这里只运行一个工作进程验证请求、
+    会话和结果判断；真正的多进程并发由 load_test 命令在文件数据库上进行。
+    """
+    
+    def setUp(self):
+        super().setUp()
+        TestDataFactory.create_user('student1', user_type='student')
+        TestDataFactory.create_room('101自习室')
+        TestDataFactory.create_time_slot('上午', 8, 12)
+        # 冲突的 409 响应会逐条记录警告
+        logger = logging.getLogger('django.request')
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.ERROR)
+    
+    def test_worker_against_live_server(self):
+        """测试所有创建请求争抢同一时间段时只有一个成功"""
+        results = queue.Queue()
+        plan = {
+            'seed': 1,
+            'mix': loadtest.DEFAULT_MIX,
+            'rate': 0,
+            'duration': 1.0,
+            'base_url': self.live_server_url,
+            'targets': loadtest.Targets(hot_slots=1).as_dict(),
+            'paths': loadtest.url_templates(),
+            'session_cookie': settings.SESSION_COOKIE_NAME,
+            'csrf_cookie': settings.CSRF_COOKIE_NAME,
+        }
+        loadtest.run_worker(plan, loadtest.create_sessions(1)[0], results)
+        samples = results.get_nowait()
+        created = Booking.objects.filter(purpose=loadtest.LOAD_PURPOSE).count()
+        report = loadtest.build_report(samples, 1.0, created, doubles=loadtest.double_bookings())
+        self.assertEqual(report['errors'], 0, report['operations'])
+        self.assertEqual(report['accepted'], 1)
+        self.assertGreater(report['conflicts'], 0)
+        self.assertEqual(loadtest.problems(report), [])